@@ -0,0 +1,120 @@
+##############################################################################
+#
+# Copyright (c) 2007 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""Measure the cost of resolving template names using a search path of
+an increasing number of directories, with and without an indexed
+template loader.
+
+Each directory holds the same number of templates; each template is
+loaded once (the first lookup of a name, which the default loader does
+not cache), and as many names are looked up which are not found. The
+templates are created lazily, such that the time is that of resolving
+the name.
+
+Usage: python benchmarks/bench_loader.py [TEMPLATES_PER_DIRECTORY] [RUNS]
+"""
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+from z3c.pt.loader import TemplateLoader
+
+
+DIRECTORIES = (1, 10, 40, 100)
+
+
+def create_directories(path, count, templates):
+    directories = []
+    for i in range(count):
+        directory = os.path.join(path, "d%d" % i)
+        os.mkdir(directory)
+        for j in range(templates):
+            with open(os.path.join(directory, "t%d_%d.pt" % (i, j)), "w"):
+                pass
+        directories.append(directory)
+    return directories
+
+
+def measure(directories, names, runs, indexed):
+    build = []
+    found = []
+    missing = []
+    for i in range(runs):
+        start = time.perf_counter()
+        loader = TemplateLoader(directories, indexed=indexed, lazy=True)
+        build.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for name in names:
+            loader.load_page(name)
+        found.append((time.perf_counter() - start) / len(names))
+
+        start = time.perf_counter()
+        for name in names:
+            try:
+                loader.load_page("x" + name)
+            except ValueError:
+                pass
+        missing.append((time.perf_counter() - start) / len(names))
+
+    return (
+        statistics.median(build),
+        statistics.median(found),
+        statistics.median(missing),
+    )
+
+
+def main(argv=sys.argv[1:]):
+    templates = int(argv[0]) if argv else 20
+    runs = int(argv[1]) if len(argv) > 1 else 5
+    print(
+        "Resolving template names (%d templates per directory, "
+        "median of %d runs):" % (templates, runs)
+    )
+    print(
+        "%11s  %8s  %20s  %20s  %10s"
+        % ("directories", "loader", "found (us/lookup)",
+           "missing (us/lookup)", "index (ms)")
+    )
+    for count in DIRECTORIES:
+        path = tempfile.mkdtemp()
+        try:
+            directories = create_directories(path, count, templates)
+            names = [
+                "t%d_%d.pt" % (i, j)
+                for i in range(count)
+                for j in range(templates)
+            ]
+            for indexed in (False, True):
+                build, found, missing = measure(
+                    directories, names, runs, indexed
+                )
+                print(
+                    "%11d  %8s  %20.2f  %20.2f  %10s"
+                    % (
+                        count,
+                        "indexed" if indexed else "default",
+                        found * 1e6,
+                        missing * 1e6,
+                        "%.2f" % (build * 1000) if indexed else "-",
+                    )
+                )
+        finally:
+            shutil.rmtree(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+##############################################################################
+#
+# Copyright (c) 2007 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""Measure the unique memory (private RSS) of forked workers which
+render a set of templates, without and with preloading the templates
+in the parent process (see ``preload_templates``). Requires Linux.
+
+Usage: python benchmarks/bench_preload.py [TEMPLATES] [WORKERS]
+"""
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+
+TEMPLATE = """\
+<div tal:repeat="item options/items">
+  <h1 tal:content="item/title">Title</h1>
+  <p tal:condition="item/visible" tal:attributes="class item/cls">
+    ${item/description}
+  </p>
+  <ul><li tal:repeat="tag item/tags">${tag}</li></ul>
+</div>
+"""
+
+MASTER = """\
+import gc
+import os
+import sys
+
+from z3c.pt.pagetemplate import PageTemplateFile
+from z3c.pt.pagetemplate import preload_templates
+
+path, workers, mode = sys.argv[1], int(sys.argv[2]), sys.argv[3]
+templates = [
+    PageTemplateFile(os.path.join(path, name))
+    for name in sorted(os.listdir(path))
+]
+items = [
+    dict(title="t", visible=True, cls="c", description="d", tags=["a"])
+]
+
+if mode != "none":
+    preload_templates(freeze=mode == "freeze")
+    for template in templates:
+        template(items=items)
+
+
+def private_rss():
+    total = 0
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            if line.startswith(("Private_Clean:", "Private_Dirty:")):
+                total += int(line.split()[1])
+    return total
+
+
+pipes = []
+for i in range(workers):
+    read, write = os.pipe()
+    if os.fork() == 0:
+        os.close(read)
+        before = private_rss()
+        for template in templates:
+            template(items=items)
+        gc.collect()
+        os.write(write, ("%d %d" % (before, private_rss())).encode())
+        os._exit(0)
+    os.close(write)
+    pipes.append(read)
+
+results = []
+for read in pipes:
+    results.append(tuple(map(int, os.read(read, 100).split())))
+    os.wait()
+print(" ".join("%d,%d" % result for result in results))
+"""
+
+
+def measure(path, workers, mode):
+    output = subprocess.check_output(
+        [sys.executable, "-c", MASTER, path, str(workers), mode],
+        text=True,
+    )
+    results = [tuple(map(int, r.split(","))) for r in output.split()]
+    before = sum(r[0] for r in results) / len(results)
+    after = sum(r[1] for r in results) / len(results)
+    return before, after
+
+
+def main(argv=sys.argv[1:]):
+    count = int(argv[0]) if argv else 300
+    workers = int(argv[1]) if len(argv) > 1 else 4
+    if not os.path.exists("/proc/self/smaps_rollup"):
+        sys.exit("This benchmark requires Linux.")
+
+    path = tempfile.mkdtemp()
+    try:
+        for i in range(count):
+            with open(os.path.join(path, "t%04d.pt" % i), "w") as f:
+                f.write(TEMPLATE)
+
+        print(
+            "Private RSS per worker (%d templates, %d workers, average):"
+            % (count, workers)
+        )
+        for mode, title in (
+            ("none", "compiled in each worker"),
+            ("preload", "preloaded"),
+            ("freeze", "preloaded and frozen"),
+        ):
+            before, after = measure(path, workers, mode)
+            print(
+                "  %-24s  after fork: %7d kB  after render: %7d kB"
+                % (title, before, after)
+            )
+    finally:
+        shutil.rmtree(path)
+
+
+if __name__ == "__main__":
+    main()
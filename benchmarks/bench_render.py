@@ -0,0 +1,358 @@
+##############################################################################
+#
+# Copyright (c) 2007 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""Measure the time it takes to render templates of representative
+scenarios, and compare it with a baseline.
+
+The templates are compiled before they are measured. Each scenario is
+rendered in several rounds of as many renders as take at least 0.2
+seconds; the fastest round is reported (in microseconds per render).
+The results are written as JSON using ``--output``; given a baseline
+(a file written using ``--output``), the script fails if a scenario is
+slower than the baseline by more than the threshold factor (the
+``--threshold`` option, or that of the scenario if it is larger).
+
+Usage: python benchmarks/bench_render.py [-o FILE] [-b FILE]
+                                         [-t FACTOR] [-r ROUNDS]
+                                         [SCENARIO ...]
+"""
+import argparse
+import importlib.metadata
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import timeit
+
+import zope.component
+from zope.contentprovider.interfaces import IContentProvider
+from zope.i18n.interfaces import ITranslationDomain
+from zope.i18n.simpletranslationdomain import SimpleTranslationDomain
+from zope.interface import Interface
+from zope.interface import implementer
+from zope.traversing.adapters import DefaultTraversable
+from zope.traversing.interfaces import IPathAdapter
+from zope.traversing.interfaces import ITraversable
+
+from z3c.pt.pagetemplate import PageTemplate
+from z3c.pt.pagetemplate import ViewPageTemplateFile
+
+
+SCENARIOS = {}
+
+
+def scenario(name, threshold=None):
+    """Register a scenario; the function is called to set it up and
+    returns a function which renders it once."""
+
+    def decorator(func):
+        SCENARIOS[name] = func, threshold
+        return func
+
+    return decorator
+
+
+class Item:
+    def __init__(self, title, child=None):
+        self.title = title
+        self.child = child
+
+
+class Request:
+    response = None
+
+
+class View:
+    def __init__(self, context, request):
+        self.context = context
+        self.request = request
+
+
+@scenario("hello_world", threshold=1.5)
+def hello_world(path):
+    template = PageTemplate("<p>Hello ${options/name}!</p>")
+    return lambda: template(name="World")
+
+
+DEEP_PATH = """\
+<div tal:repeat="i python: range(50)">
+  <span tal:content="context/child/child/child/child/title" />
+  <span tal:content="view/context/child/child/items/a/b/c" />
+  <span tal:content="options/data/x/y/z/title" />
+</div>
+"""
+
+
+@scenario("deep_path")
+def deep_path(path):
+    filename = os.path.join(path, "deep_path.pt")
+    with open(filename, "w") as f:
+        f.write(DEEP_PATH)
+
+    class DeepView(View):
+        template = ViewPageTemplateFile(filename)
+
+    context = Item("root")
+    node = context
+    for i in range(4):
+        node.child = Item("item %d" % i)
+        node = node.child
+    context.child.child.items = {"a": {"b": {"c": "leaf"}}}
+    view = DeepView(context, Request())
+    data = {"x": {"y": {"z": Item("data")}}}
+    return lambda: view.template(data=data)
+
+
+REPEAT = """\
+<table>
+  <tr tal:repeat="row options/rows">
+    <td>${row/id}</td>
+    <td tal:content="row/name" />
+    <td tal:attributes="class python: repeat['row'].odd() and 'odd' or None"
+        tal:content="repeat/row/number" />
+  </tr>
+</table>
+"""
+
+
+@scenario("repeat_10k")
+def repeat_10k(path):
+    template = PageTemplate(REPEAT)
+    rows = [{"id": i, "name": "row %d" % i} for i in range(10000)]
+    return lambda: template(rows=rows)
+
+
+I18N = """\
+<div i18n:domain="bench">
+%s
+</div>
+"""
+
+
+@scenario("i18n_translate")
+def i18n_translate(path):
+    messages = {("de", "Message %d" % i): "Nachricht %d" % i
+                for i in range(200)}
+    zope.component.provideUtility(
+        SimpleTranslationDomain("bench", messages),
+        ITranslationDomain,
+        name="bench",
+    )
+    body = "\n".join(
+        '<p i18n:translate="">Message %d</p>'
+        '<span title="Message %d" i18n:attributes="title"'
+        ' i18n:translate="">Message %d</span>' % (i, i, i % 200)
+        for i in range(200)
+    )
+    template = PageTemplate(I18N % body)
+    return lambda: template.render(target_language="de")
+
+
+PROVIDER = """\
+<div tal:repeat="i python: range(50)">
+  <div tal:replace="structure provider:bench.box" />
+</div>
+"""
+
+
+@implementer(IContentProvider)
+class Box:
+    def __init__(self, context, request, view):
+        self.context = context
+
+    def update(self):
+        pass
+
+    def render(self):
+        return "<p>%s</p>" % self.context.title
+
+
+@scenario("provider")
+def provider(path):
+    filename = os.path.join(path, "provider.pt")
+    with open(filename, "w") as f:
+        f.write(PROVIDER)
+
+    class ProviderView(View):
+        template = ViewPageTemplateFile(filename)
+
+    zope.component.provideAdapter(
+        Box, (Interface, Interface, Interface), IContentProvider,
+        name="bench.box",
+    )
+    view = ProviderView(Item("box"), Request())
+    return lambda: view.template()
+
+
+FUNCTION_NAMESPACES = """\
+<div tal:repeat="item options/items">
+  <span tal:content="item/title/fmt:upper" />
+  <span tal:content="item/fmt:label" />
+  <span tal:content="item/child/fmt:label" />
+</div>
+"""
+
+
+class Format:
+    def __init__(self, context):
+        self.context = context
+
+    def upper(self):
+        return self.context.upper()
+
+    def label(self):
+        return "<%s>" % self.context.title
+
+
+@scenario("function_namespaces")
+def function_namespaces(path):
+    zope.component.provideAdapter(
+        Format, (Interface,), IPathAdapter, name="fmt"
+    )
+    template = PageTemplate(FUNCTION_NAMESPACES)
+    items = [Item("item %d" % i, Item("child %d" % i)) for i in range(100)]
+    return lambda: template(items=items)
+
+
+EXISTS_NOCALL = """\
+<div tal:repeat="item options/items">
+  <span tal:condition="exists: item/title">${item/title}</span>
+  <span tal:condition="not: exists: item/missing">missing</span>
+  <span tal:define="f nocall: item/render" tal:content="f" />
+  <span tal:content="nocall: item/title" />
+</div>
+"""
+
+
+class Renderable(Item):
+    def render(self):
+        return self.title
+
+
+@scenario("exists_nocall")
+def exists_nocall(path):
+    template = PageTemplate(EXISTS_NOCALL)
+    items = [Renderable("item %d" % i) for i in range(100)]
+    return lambda: template(items=items)
+
+
+def setup():
+    zope.component.provideAdapter(
+        DefaultTraversable, (Interface,), ITraversable
+    )
+
+
+def measure(render, rounds):
+    render()
+    timer = timeit.Timer(render)
+    number = 1
+    while timer.timeit(number) < 0.2:
+        number *= 2
+    return min(timer.repeat(rounds, number)) / number, number
+
+
+def compare(results, baseline, threshold):
+    """Return the names of the scenarios which are slower than in
+    ``baseline`` by more than their threshold."""
+
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get("results", {}).get(name)
+        if base is None:
+            continue
+        limit = max(threshold, SCENARIOS[name][1] or threshold)
+        if result["time"] > base["time"] * limit:
+            regressions.append(name)
+    return regressions
+
+
+def main(argv=sys.argv[1:]):
+    parser = argparse.ArgumentParser(
+        prog="bench_render.py", description="Render benchmarks."
+    )
+    parser.add_argument(
+        "scenarios",
+        nargs="*",
+        metavar="SCENARIO",
+        help="scenarios to run (default: all of %s)" % ", ".join(SCENARIOS),
+    )
+    parser.add_argument("-o", "--output", help="write the results to FILE")
+    parser.add_argument(
+        "-b", "--baseline", help="compare with the results in FILE"
+    )
+    parser.add_argument(
+        "-t",
+        "--threshold",
+        type=float,
+        default=1.2,
+        help="slowdown factor which fails the comparison (default: 1.2)",
+    )
+    parser.add_argument(
+        "-r", "--rounds", type=int, default=5, help="rounds (default: 5)"
+    )
+    args = parser.parse_args(argv)
+
+    names = args.scenarios or list(SCENARIOS)
+    for name in names:
+        if name not in SCENARIOS:
+            parser.error("unknown scenario: %s" % name)
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    setup()
+    path = tempfile.mkdtemp()
+    results = {}
+    try:
+        for name in names:
+            render = SCENARIOS[name][0](path)
+            seconds, number = measure(render, args.rounds)
+            results[name] = {"time": seconds, "number": number}
+            base = baseline.get("results", {}).get(name)
+            print(
+                "%-20s %12.1f us%s"
+                % (
+                    name,
+                    seconds * 1e6,
+                    "  (%.2fx)" % (seconds / base["time"]) if base else "",
+                )
+            )
+    finally:
+        shutil.rmtree(path)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(
+                {
+                    "python": platform.python_version(),
+                    "z3c.pt": importlib.metadata.version("z3c.pt"),
+                    "chameleon": importlib.metadata.version("chameleon"),
+                    "results": results,
+                },
+                f,
+                indent=2,
+                sort_keys=True,
+            )
+
+    regressions = compare(results, baseline, args.threshold)
+    for name in regressions:
+        print("regression: %s" % name)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,96 @@
+##############################################################################
+#
+# Copyright (c) 2007 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""Measure the time it takes to import a module which creates many
+templates, with and without lazy template construction.
+
+Usage: python benchmarks/bench_startup.py [TEMPLATES] [RUNS]
+"""
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+
+MODULE = """\
+from z3c.pt.pagetemplate import ViewPageTemplateFile
+
+
+class View:
+%s
+"""
+
+TEMPLATE = """\
+<div tal:content="view/title">Title</div>
+"""
+
+IMPORT = """\
+import time
+import z3c.pt.pagetemplate
+start = time.perf_counter()
+import package.views
+print(time.perf_counter() - start)
+"""
+
+
+def create_package(path, count, lazy):
+    package = os.path.join(path, "package")
+    os.mkdir(package)
+    with open(os.path.join(package, "__init__.py"), "w"):
+        pass
+    for i in range(count):
+        with open(os.path.join(package, "t%d.pt" % i), "w") as f:
+            f.write(TEMPLATE)
+    with open(os.path.join(package, "views.py"), "w") as f:
+        f.write(
+            MODULE
+            % "\n".join(
+                "    t%d = ViewPageTemplateFile('t%d.pt', lazy=%r)"
+                % (i, i, lazy)
+                for i in range(count)
+            )
+        )
+
+
+def measure(count, runs, lazy):
+    path = tempfile.mkdtemp()
+    try:
+        create_package(path, count, lazy)
+        timings = []
+        for i in range(runs):
+            output = subprocess.check_output(
+                [sys.executable, "-c", IMPORT],
+                cwd=path,
+                env=dict(os.environ, PYTHONDONTWRITEBYTECODE="1"),
+            )
+            timings.append(float(output))
+        return statistics.median(timings)
+    finally:
+        shutil.rmtree(path)
+
+
+def main(argv=sys.argv[1:]):
+    count = int(argv[0]) if argv else 500
+    runs = int(argv[1]) if len(argv) > 1 else 5
+    eager = measure(count, runs, False)
+    lazy = measure(count, runs, True)
+    print("Importing a module with %d templates (median of %d runs):"
+          % (count, runs))
+    print("  eager: %8.2f ms" % (eager * 1000))
+    print("  lazy:  %8.2f ms (%.1fx)" % (lazy * 1000, eager / lazy))
+
+
+if __name__ == "__main__":
+    main()
@@ -82,6 +82,11 @@ setup(
             "Sphinx",
         ]
     },
+    entry_points={
+        "console_scripts": [
+            "z3c-pt-compile = z3c.pt.precompile:main",
+        ],
+    },
     include_package_data=True,
     zip_safe=False,
 )
@@ -0,0 +1,304 @@
+##############################################################################
+#
+# Copyright (c) 2007 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+import logging
+import os
+import sys
+import threading
+import types
+from collections import OrderedDict
+
+import zope.event
+from chameleon.loader import ModuleLoader
+from chameleon.template import PROGRAM_NAME
+from zope.interface.interfaces import IRegistrationEvent
+
+
+log = logging.getLogger("z3c.pt")
+
+
+_marker = object()
+
+
+class LRUCache:
+    """Bounded mapping which evicts the least recently used entry.
+
+      >>> cache = LRUCache(2)
+      >>> cache['a'] = 1
+      >>> cache['b'] = 2
+      >>> cache.get('a')
+      1
+      >>> cache['c'] = 3
+      >>> cache.get('b') is None
+      True
+      >>> sorted(cache.stats().items())
+      [('evictions', 1), ('hits', 1), ('maxsize', 2), ('misses', 1),
+       ('size', 2)]
+    """
+
+    def __init__(self, maxsize=1000):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            value = self._data.get(key, _marker)
+            if value is _marker:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+        }
+
+
+class AdapterLookupCache(LRUCache):
+    """Bounded cache of adapter factory lookups, keyed by the adapter
+    registry and the arguments of the lookup.
+
+    An entry is valid for the generation of the adapter registry it was
+    looked up in, which changes whenever an adapter is registered or
+    unregistered in the registry or one of its bases (with or without
+    an event); an entry of an earlier generation is looked up again
+    (and counted as stale).
+
+      >>> from zope.interface import Interface
+      >>> from zope.interface.registry import Components
+      >>> registry = Components()
+      >>> cache = AdapterLookupCache()
+      >>> cache.lookup(registry.adapters, (Interface,), Interface) is None
+      True
+      >>> registry.registerAdapter(len, (Interface,), Interface)
+      >>> cache.lookup(registry.adapters, (Interface,), Interface)
+      <built-in function len>
+      >>> cache.lookup(registry.adapters, (Interface,), Interface)
+      <built-in function len>
+      >>> sorted(cache.stats().items())
+      [('evictions', 0), ('hits', 1), ('maxsize', 1000), ('misses', 2),
+       ('size', 1), ('stale', 1)]
+    """
+
+    def __init__(self, maxsize=1000):
+        super().__init__(maxsize)
+        self.stale = 0
+
+    def lookup(self, adapters, required, provided, name=""):
+        # The generation is read before the lookup, such that a change
+        # made meanwhile invalidates the entry.
+        generation = adapters._generation
+        key = adapters, required, provided, name
+        entry = self.get(key, _marker)
+        if entry is not _marker:
+            if entry[0] == generation:
+                return entry[1]
+            with self._lock:
+                self.hits -= 1
+                self.misses += 1
+                self.stale += 1
+
+        factory = adapters.lookup(required, provided, name)
+        self[key] = generation, factory
+        return factory
+
+    def stats(self):
+        stats = super().stats()
+        stats["stale"] = self.stale
+        return stats
+
+
+def program_size(program):
+    """Return the approximate size in bytes of the code of a compiled
+    template (the functions defined by its ``initialize`` function)."""
+
+    size = 0
+    stack = [program[PROGRAM_NAME].__code__]
+    while stack:
+        code = stack.pop()
+        size += sys.getsizeof(code) + sys.getsizeof(code.co_code)
+        for const in code.co_consts:
+            if isinstance(const, types.CodeType):
+                stack.append(const)
+            else:
+                size += sys.getsizeof(const)
+    return size
+
+
+class TemplateCache(LRUCache):
+    """Cache of compiled templates which evicts the least recently used
+    entry when there are more than ``maxsize`` entries or (if
+    ``maxbytes`` is set) their approximate total size exceeds
+    ``maxbytes``.
+
+    The size of an entry is computed using ``sizeof`` when it is
+    added.
+    """
+
+    def __init__(self, maxsize=1000, maxbytes=None, sizeof=program_size):
+        super().__init__(maxsize)
+        self.maxbytes = maxbytes
+        self.sizeof = sizeof
+        self.bytes = 0
+
+    def get(self, key, default=None):
+        entry = super().get(key, _marker)
+        if entry is _marker:
+            return default
+        return entry[0]
+
+    def __setitem__(self, key, value):
+        size = self.sizeof(value)
+        with self._lock:
+            entry = self._data.pop(key, None)
+            if entry is not None:
+                self.bytes -= entry[1]
+            self._data[key] = value, size
+            self.bytes += size
+            while len(self._data) > self.maxsize or (
+                self.maxbytes is not None
+                and self.bytes > self.maxbytes
+                and len(self._data) > 1
+            ):
+                entry = self._data.popitem(last=False)[1]
+                self.bytes -= entry[1]
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.bytes = 0
+
+    def stats(self):
+        stats = super().stats()
+        stats["bytes"] = self.bytes
+        stats["maxbytes"] = self.maxbytes
+        return stats
+
+
+class CompiledTemplateCache(ModuleLoader):
+    """On-disk cache of compiled templates which may be shared by
+    several processes.
+
+    It is used as the ``loader`` of a template; the compiled module of
+    a template is stored under a digest of its source and the settings
+    it is compiled with (see ``BaseTemplate.digest``). A module is
+    written to a temporary file which is then renamed, such that
+    concurrent writers (which write the same module for a digest) never
+    expose a partially written file.
+
+    A cached module which can not be loaded (e.g. written by an
+    incompatible version of Python) is stale; it is compiled again.
+    """
+
+    def __init__(self, path):
+        os.makedirs(path, exist_ok=True)
+        super().__init__(path)
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.stale = 0
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def get(self, filename):
+        path = os.path.join(self.path, filename)
+        if not os.path.exists(path):
+            self._count("misses")
+            return None
+
+        base = os.path.splitext(filename)[0]
+        try:
+            module = self._load(base, path)
+            if PROGRAM_NAME not in module:
+                raise ImportError("No %s function." % PROGRAM_NAME)
+        except Exception as exc:
+            log.warning("stale compiled template %s: %s", path, exc)
+            sys.modules.pop(base, None)
+            self._count("stale")
+            return None
+
+        self._count("hits")
+        return module
+
+    def build(self, source, filename):
+        try:
+            return super().build(source, filename)
+        except FileExistsError:
+            # Another process is writing the byte-code of the same
+            # module; the module is loaded from source.
+            base = os.path.splitext(filename)[0]
+            return self._load(base, os.path.join(self.path, base + ".py"))
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "stale": self.stale}
+
+
+_registry_caches = []
+
+
+def clear_on_registry_change(cache):
+    """Clear ``cache`` whenever a component is (un)registered.
+
+    Note that registrations made without an event (for example using
+    ``zope.component.provideAdapter``) do not trigger this; the cache
+    must be cleared explicitly in that case.
+    """
+    _registry_caches.append(cache)
+    return cache
+
+
+def clear_registry_caches():
+    for cache in _registry_caches:
+        cache.clear()
+
+
+def _handle_event(event):
+    if IRegistrationEvent.providedBy(event):
+        clear_registry_caches()
+
+
+zope.event.subscribers.append(_handle_event)
+
+try:
+    from zope.testing.cleanup import addCleanUp
+except ModuleNotFoundError:  # pragma: no cover
+    pass
+else:
+    addCleanUp(clear_registry_caches)
@@ -0,0 +1,268 @@
+##############################################################################
+#
+# Copyright (c) 2007 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+import ast
+import itertools
+import re
+
+from chameleon import nodes
+from chameleon.astutil import Symbol
+from chameleon.codegen import template
+from chameleon.compiler import Compiler as BaseCompiler
+from chameleon.compiler import TranslationContext
+from chameleon.compiler import identifier
+
+from z3c.pt.dependencies import record_macro
+from z3c.pt.expressions import RESOLVER
+from z3c.pt.expressions import current_compiler
+from z3c.pt.expressions import get_awaitable_resolver
+from z3c.pt.fragments import lookup
+from z3c.pt.streaming import hold
+from z3c.pt.streaming import release
+
+
+_re_whitespace = re.compile(r"\s+")
+
+
+def static_text(node):
+    """Return the text of a node which consists of static text only, or
+    ``None``."""
+
+    if isinstance(node, nodes.Text):
+        return node.value
+    if isinstance(node, nodes.Sequence):
+        parts = []
+        for item in node.items:
+            text = static_text(item)
+            if text is None:
+                return None
+            parts.append(text)
+        return "".join(parts)
+    return None
+
+
+class Compiler(BaseCompiler):
+    """Compiler which supports the nodes of ``z3c.pt.program``.
+
+    The names of the content providers which are inserted using a
+    ``provider:`` expression without interpolation, outside of any
+    statement which renders its content conditionally (or repeatedly),
+    are collected in ``static_providers``; the compiled module assigns
+    them to ``__static_providers``.
+
+    The render functions look up the resolver of awaitables (see
+    ``z3c.pt.expressions.resolve_target``) when they are called.
+
+    If ``macro_dependent`` (the filename of a file-based template) is
+    set, the macros which the template includes are recorded in
+    ``z3c.pt.dependencies.macro_dependencies``.
+    """
+
+    def __init__(self, *args, macro_dependent=None, **kwargs):
+        self.macro_dependent = macro_dependent
+        self._fragments = itertools.count()
+        self._conditional = 0
+        self.static_providers = []
+        token = current_compiler.set(self)
+        try:
+            super().__init__(*args, **kwargs)
+        finally:
+            current_compiler.reset(token)
+
+        self.code += "\n__static_providers = %r\n" % (
+            tuple(self.static_providers),
+        )
+
+    def record_provider(self, name):
+        if not self._conditional and name not in self.static_providers:
+            self.static_providers.append(name)
+
+    def _visit_conditional(self, visit, node):
+        self._conditional += 1
+        try:
+            return list(visit(node))
+        finally:
+            self._conditional -= 1
+
+    def visit_Condition(self, node):
+        return self._visit_conditional(super().visit_Condition, node)
+
+    def visit_Repeat(self, node):
+        return self._visit_conditional(super().visit_Repeat, node)
+
+    def visit_OnError(self, node):
+        # The output which the error handler may discard is not
+        # streamed until the statement has completed.
+        body = self._visit_conditional(super().visit_OnError, node)
+        return template("hold(__stream)", hold=Symbol(hold)) + [
+            ast.Try(
+                body=body,
+                handlers=[],
+                orelse=[],
+                finalbody=template(
+                    "release(__stream)", release=Symbol(release)
+                ),
+            )
+        ]
+
+    def visit_DefineSlot(self, node):
+        return self._visit_conditional(super().visit_DefineSlot, node)
+
+    def visit_UseExternalMacro(self, node):
+        stmts = self._visit_conditional(super().visit_UseExternalMacro, node)
+        if self.macro_dependent is not None:
+            stmts += template(
+                "record(DEPENDENT, __macro)",
+                record=Symbol(record_macro),
+                DEPENDENT=ast.Constant(self.macro_dependent),
+            )
+        return stmts
+
+    def visit_Macro(self, node):
+        # A macro other than the template itself is rendered only
+        # where it is used.
+        if node.name is None:
+            functions = list(super().visit_Macro(node))
+        else:
+            functions = self._visit_conditional(super().visit_Macro, node)
+
+        for function in functions:
+            function.body[:0] = template(
+                "RESOLVE = get_resolver()",
+                RESOLVE=RESOLVER,
+                get_resolver=Symbol(get_awaitable_resolver),
+            )
+        return functions
+
+    def visit_CacheFragment(self, node):
+        # The content is only rendered when it is not cached.
+        return self._visit_conditional(self._visit_fragment, node)
+
+    def _visit_fragment(self, node):
+        # The names are unique such that fragments may be nested.
+        suffix = str(next(self._fragments))
+        key = identifier("fragment_key", suffix)
+        cache = identifier("fragment_cache", suffix)
+        output = identifier("fragment", suffix)
+        stream = identifier("fragment_stream", suffix)
+        append = identifier("fragment_append", suffix)
+
+        if node.key is None:
+            body = template("KEY = ()", KEY=key)
+        else:
+            body = self._engine(node.key, key)
+
+        body += template(
+            "CACHE, KEY, OUTPUT = lookup(econtext, ID, FILENAME, KEY)",
+            CACHE=cache,
+            KEY=key,
+            OUTPUT=output,
+            ID=ast.Constant(node.id),
+            FILENAME=ast.Constant(node.filename),
+            lookup=Symbol(lookup),
+        )
+
+        # The output of the fragment is rendered into a stream of its
+        # own when it is not cached.
+        render = template("s = new_list", s=stream, new_list=self._new_list)
+        render += template("a = s.append", a=append, s=stream)
+        render.append(
+            TranslationContext(self.visit(node.node), append, stream)
+        )
+        render += template(
+            "OUTPUT = ''.join(STREAM)", OUTPUT=output, STREAM=stream
+        )
+        render += template(
+            "if CACHE is not None: CACHE.set(KEY, OUTPUT, TTL)",
+            CACHE=cache,
+            KEY=key,
+            OUTPUT=output,
+            TTL=ast.Constant(node.ttl),
+        )
+
+        body.append(
+            ast.If(
+                test=template("OUTPUT is None", OUTPUT=output, mode="eval"),
+                body=render,
+                orelse=[],
+            )
+        )
+        body += template("__append(OUTPUT)", OUTPUT=output)
+        return body
+
+
+class PretranslatingCompiler(Compiler):
+    """Compiler which substitutes the translation of static messages.
+
+    A message is static if the translated element contains only text
+    (no ``i18n:name`` or other elements) and its translation domain is
+    set in the same template using ``i18n:domain``. Such messages are
+    translated into ``target_language`` at compile time using
+    ``translate``, which is called with the message id, domain, target
+    language and default.
+
+    Since a macro may be called with a different target language, the
+    substituted translation is guarded by a runtime check; all other
+    messages are translated when the template is rendered.
+    """
+
+    def __init__(self, *args, translate, target_language, **kwargs):
+        self._pretranslate = translate
+        self._target_language = target_language
+        self._domains = [None]
+        super().__init__(*args, **kwargs)
+
+    def _visit_domain(self, visit, node, domain):
+        self._domains.append(domain)
+        try:
+            return list(visit(node))
+        finally:
+            self._domains.pop()
+
+    def visit_Macro(self, node):
+        # The translation domain of a macro is that of its caller.
+        return self._visit_domain(super().visit_Macro, node, None)
+
+    def visit_Domain(self, node):
+        return self._visit_domain(super().visit_Domain, node, node.name)
+
+    def visit_Translate(self, node):
+        body = super().visit_Translate(node)
+        domain = self._domains[-1]
+        text = static_text(node.node)
+        if text is None or domain is None:
+            return body
+
+        default = _re_whitespace.sub(" ", text).strip()
+        msgid = node.msgid or default
+        if not msgid:
+            return body
+
+        translation = self._pretranslate(
+            msgid, domain, self._target_language, default
+        )
+
+        return [
+            ast.If(
+                test=template(
+                    "target_language == LANGUAGE",
+                    LANGUAGE=ast.Constant(self._target_language),
+                    mode="eval",
+                ),
+                body=template(
+                    "__append(TRANSLATION)",
+                    TRANSLATION=ast.Constant(str(translation)),
+                ),
+                orelse=body,
+            )
+        ]
@@ -0,0 +1,145 @@
+##############################################################################
+#
+# Copyright (c) 2007 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+import logging
+import threading
+
+from chameleon.zpt.template import Macro
+
+
+log = logging.getLogger("z3c.pt")
+
+
+class DependencyGraph:
+    """Graph of the template files which use the macros of other
+    template files (an edge is recorded from the file which contains
+    the ``metal:use-macro`` statement).
+
+      >>> graph = DependencyGraph()
+      >>> graph.add('page.pt', 'main.pt')
+      >>> graph.add('form.pt', 'page.pt')
+      >>> sorted(graph.dependents('main.pt'))
+      ['form.pt', 'page.pt']
+      >>> sorted(graph.dependents('main.pt', transitive=False))
+      ['page.pt']
+      >>> sorted(graph.sources('form.pt'))
+      ['page.pt']
+
+    The functions in ``subscribers`` are called with the filename and
+    the dependents of a source which has changed:
+
+      >>> graph.subscribers.append(lambda source, dependents: print(
+      ...     source, sorted(dependents)))
+      >>> sorted(graph.changed('main.pt'))
+      main.pt ['form.pt', 'page.pt']
+      ['form.pt', 'page.pt']
+    """
+
+    def __init__(self):
+        self._sources = {}
+        self._dependents = {}
+        self._lock = threading.Lock()
+        self.subscribers = []
+
+    def add(self, dependent, source):
+        sources = self._sources.get(dependent)
+        if sources is not None and source in sources:
+            return
+        with self._lock:
+            self._sources.setdefault(dependent, set()).add(source)
+            self._dependents.setdefault(source, set()).add(dependent)
+
+    def sources(self, dependent):
+        """Return the files whose macros ``dependent`` uses."""
+
+        with self._lock:
+            return frozenset(self._sources.get(dependent, ()))
+
+    def dependents(self, source, transitive=True):
+        """Return the files which use the macros of ``source`` (or, if
+        ``transitive`` is set, of any of its dependents)."""
+
+        with self._lock:
+            result = set(self._dependents.get(source, ()))
+            if not transitive:
+                return result
+            stack = list(result)
+            while stack:
+                for dependent in self._dependents.get(stack.pop(), ()):
+                    if dependent not in result and dependent != source:
+                        result.add(dependent)
+                        stack.append(dependent)
+            return result
+
+    def remove(self, dependent):
+        """Remove the dependencies of ``dependent``."""
+
+        with self._lock:
+            for source in self._sources.pop(dependent, ()):
+                dependents = self._dependents.get(source)
+                dependents.discard(dependent)
+                if not dependents:
+                    del self._dependents[source]
+
+    def changed(self, source):
+        """Notify the subscribers that ``source`` has changed; returns
+        its dependents.
+
+        The dependencies of ``source`` itself are removed, since it may
+        no longer use them; they are added again when its statements
+        which use them are rendered.
+        """
+
+        dependents = self.dependents(source)
+        self.remove(source)
+        for subscriber in list(self.subscribers):
+            try:
+                subscriber(source, dependents)
+            except Exception:
+                log.exception("error notifying change of %s", source)
+        return dependents
+
+    def clear(self):
+        with self._lock:
+            self._sources.clear()
+            self._dependents.clear()
+
+
+# The file-based templates which include the macros of other file-based
+# templates; see ``record_macro``.
+macro_dependencies = DependencyGraph()
+
+
+class FileMacro(Macro):
+    """A macro of the template file ``filename``."""
+
+    __slots__ = ("filename",)
+
+    def __init__(self, render, filename):
+        super().__init__(render)
+        self.filename = filename
+
+
+def record_macro(dependent, macro):
+    """Record that the template file ``dependent`` includes ``macro``
+    in ``macro_dependencies``, if it is a ``FileMacro``.
+
+    This is called by the code of the ``metal:use-macro`` and
+    ``metal:extend-macro`` statements of a template file, which the
+    compiler knows the file of; the macro expression itself is only
+    evaluated when the template is rendered.
+    """
+
+    source = getattr(macro, "filename", None)
+    if source is not None and source != dependent:
+        macro_dependencies.add(dependent, source)
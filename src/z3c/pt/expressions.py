@@ -12,9 +12,14 @@
 #
 ##############################################################################
 import ast
+import contextvars
+import copy
+import functools
 import re
+import threading
 from types import MethodType
 
+import zope.component.hooks
 import zope.event
 from chameleon.astutil import Builtin
 from chameleon.astutil import NameLookupRewriteVisitor
@@ -22,22 +27,206 @@ from chameleon.astutil import Symbol
 from chameleon.codegen import template
 from chameleon.exc import ExpressionError
 from chameleon.tales import ExistsExpr as BaseExistsExpr
+from chameleon.tales import NotExpr
 from chameleon.tales import PythonExpr as BasePythonExpr
 from chameleon.tales import StringExpr
 from chameleon.tales import TalesExpr
 from zope.contentprovider.interfaces import BeforeUpdateEvent
 from zope.contentprovider.interfaces import ContentProviderLookupError
 from zope.contentprovider.interfaces import IContentProvider
+from zope.contentprovider.interfaces import ITALNamespaceData
 from zope.contentprovider.tales import addTALNamespaceData
+from zope.interface import implementer
+from zope.interface import providedBy
 from zope.location.interfaces import ILocation
+from zope.location.interfaces import LocationError
+from zope.publisher.interfaces import IHeld
+from zope.security.management import queryInteraction
+from zope.security.management import thread_local
+from zope.traversing.adapters import DefaultTraversable
 from zope.traversing.adapters import traversePathElement
 from zope.traversing.interfaces import ITraversable
 
 import z3c.pt.namespaces
+from z3c.pt.cache import AdapterLookupCache
+from z3c.pt.cache import LRUCache
+from z3c.pt.cache import clear_on_registry_change
+from z3c.pt.interfaces import ICachedContentProvider
 
 
 _marker = object()
 
+# While a template is compiled by ``z3c.pt.compiler.Compiler``, this is
+# set to the compiler.
+current_compiler = contextvars.ContextVar("current_compiler", default=None)
+
+# The name of the local variable of the render functions of a template
+# which holds the ``awaitable_resolver`` of the render.
+RESOLVER = "__resolve_awaitable"
+
+
+class _missing:
+    """Marker for a name which was not found by an inline lookup.
+
+    Compiled templates import it by name, so it must be a class.
+    """
+
+
+# The content provider factories of the interfaces provided by the
+# context, request and view, per provider name.
+provider_factories = clear_on_registry_change(AdapterLookupCache(1000))
+
+
+class ProviderOutputCache(LRUCache):
+    """Bounded cache of the output of content providers which provide
+    ``ICachedContentProvider``, which counts hits and misses per
+    provider name (see ``provider_stats``)."""
+
+    def __init__(self, maxsize=1000):
+        super().__init__(maxsize)
+        self._providers = {}
+
+    def key(self, name, cp):
+        """Return the key of the output of provider ``cp`` inserted
+        as ``name``, or ``None`` if it is not cached."""
+
+        if not ICachedContentProvider.providedBy(cp):
+            return None
+        key = cp.cache_key()
+        if key is None:
+            return None
+        return name, type(cp), key
+
+    def lookup(self, name, key):
+        output = self.get(key)
+        with self._lock:
+            counts = self._providers.get(name)
+            if counts is None:
+                counts = self._providers[name] = [0, 0]
+            counts[output is None] += 1
+        return output
+
+    def provider_stats(self):
+        """Return the hit and miss counts per provider name."""
+
+        with self._lock:
+            return {
+                name: {"hits": hits, "misses": misses}
+                for name, (hits, misses) in self._providers.items()
+            }
+
+
+# The output of content providers which provide
+# ``ICachedContentProvider``.
+provider_outputs = clear_on_registry_change(ProviderOutputCache(1000))
+
+
+def query_content_provider(context, request, view, name):
+    """Look up a content provider like ``queryMultiAdapter``, using
+    ``provider_factories``."""
+
+    factory = provider_factories.lookup(
+        zope.component.getSiteManager().adapters,
+        (providedBy(context), providedBy(request), providedBy(view)),
+        IContentProvider,
+        name,
+    )
+    if factory is None:
+        return None
+
+    return factory(context, request, view)
+
+
+def call_in_site(site, func, *args, **kwargs):
+    old_site = zope.component.hooks.getSite()
+    zope.component.hooks.setSite(site)
+    try:
+        return func(*args, **kwargs)
+    finally:
+        zope.component.hooks.setSite(old_site)
+
+
+def _set_interaction(interaction):
+    if interaction is None:
+        try:
+            del thread_local.interaction
+        except AttributeError:
+            pass
+    else:
+        thread_local.interaction = interaction
+
+
+def in_calling_context(func):
+    """Return a function which calls ``func`` (e.g. in a worker thread)
+    with the context variables, the site and the security interaction
+    of the calling thread."""
+
+    context = contextvars.copy_context()
+    site = zope.component.hooks.getSite()
+    interaction = queryInteraction()
+
+    def call(*args, **kwargs):
+        previous = queryInteraction()
+        _set_interaction(interaction)
+        try:
+            return context.run(call_in_site, site, func, *args, **kwargs)
+        finally:
+            _set_interaction(previous)
+
+    return call
+
+
+def update_content_providers(econtext, names, executor):
+    """Submit the update of the named content providers to ``executor``.
+
+    The providers are looked up for the ``context``, ``request`` and
+    ``view`` found in ``econtext`` and the ``BeforeUpdateEvent`` is
+    notified in the calling thread, in the order of ``names``. The
+    update runs with the context variables, the site and the security
+    interaction of the calling thread.
+
+    Providers which are not found or which require TAL namespace data
+    (which is only available at the point of insertion) are skipped.
+
+    Providers whose output is cached (see ``provider_outputs``) are
+    skipped as well.
+
+    Returns a mapping from name to a tuple of the context, request and
+    view, the provider, the future of its update and the key of its
+    output in ``provider_outputs`` (or ``None``).
+    """
+
+    context = econtext.get("context")
+    request = econtext.get("request")
+    view = econtext.get("view")
+
+    updates = {}
+    for name in names:
+        if name in updates:
+            continue
+
+        cp = query_content_provider(context, request, view, name)
+        if cp is None:
+            continue
+
+        if any(map(ITALNamespaceData.providedBy, providedBy(cp))):
+            continue
+
+        # The output is rendered from the cache at the point of
+        # insertion.
+        key = provider_outputs.key(name, cp)
+        if key is not None and key in provider_outputs:
+            continue
+
+        if ILocation.providedBy(cp):
+            cp.__name__ = name
+
+        zope.event.notify(BeforeUpdateEvent(cp, request))
+        future = executor.submit(in_calling_context(cp.update))
+        updates[name] = (context, request, view), cp, future, key
+
+    return updates
+
 
 def render_content_provider(econtext, name):
     name = name.strip()
@@ -46,9 +235,24 @@ def render_content_provider(econtext, name):
     request = econtext.get("request")
     view = econtext.get("view")
 
-    cp = zope.component.queryMultiAdapter(
-        (context, request, view), IContentProvider, name=name
-    )
+    # Use the provider updated ahead of the render pass, if it was
+    # updated for the same objects; the first insertion consumes it.
+    updates = econtext.get("__provider_updates")
+    if updates:
+        update = updates.pop(name, None)
+        if update is not None:
+            objects, cp, future, key = update
+            if objects[0] is context and objects[1] is request and \
+                    objects[2] is view:
+                resolve_awaitable(future.result())
+                output = resolve_awaitable(cp.render())
+                if key is not None:
+                    provider_outputs.lookup(name, key)
+                    provider_outputs[key] = output
+                return output
+            future.cancel()
+
+    cp = query_content_provider(context, request, view, name)
 
     # provide a useful error message, if the provider was not found.
     # Be sure to provide the objects in addition to the name so
@@ -63,54 +267,241 @@ def render_content_provider(econtext, name):
     # Insert the data gotten from the context
     addTALNamespaceData(cp, econtext)
 
+    key = provider_outputs.key(name, cp)
+    if key is not None:
+        output = provider_outputs.lookup(name, key)
+        if output is not None:
+            return output
+
     # Stage 1: Do the state update.
     zope.event.notify(BeforeUpdateEvent(cp, request))
-    cp.update()
+    resolve_awaitable(cp.update())
 
     # Stage 2: Render the HTML content.
-    return cp.render()
+    output = resolve_awaitable(cp.render())
+    if key is not None:
+        provider_outputs[key] = output
+    return output
 
 
-def path_traverse(base, econtext, call, path_items):
-    if path_items:
-        request = econtext.get("request")
-        path_items = list(path_items)
-        path_items.reverse()
+# While a template is rendered using ``render_async``, this is set to a
+# function which waits for the result of an awaitable (or of a list or
+# tuple of awaitables, which are awaited concurrently).
+awaitable_resolver = contextvars.ContextVar(
+    "z3c.pt.awaitable_resolver", default=None
+)
 
-        while path_items:
-            name = path_items.pop()
-            ns_used = ":" in name
-            if ns_used:
-                namespace, name = name.split(":", 1)
-                base = z3c.pt.namespaces.function_namespaces[namespace](base)
-                if ITraversable.providedBy(base):
-                    base = traversePathElement(
-                        base, name, path_items, request=request
-                    )
 
-                    # base = proxify(base)
+def resolve_awaitable(value):
+    """Return the result of ``value`` if it's awaitable (or a list or
+    tuple of awaitables) and the template is rendered asynchronously;
+    otherwise, ``value`` is returned as-is."""
 
-                    continue
+    resolve = awaitable_resolver.get()
+    if resolve is None:
+        return value
+    return resolve(value)
 
-            # special-case dicts for performance reasons
-            if isinstance(base, dict):
-                next = base.get(name, _marker)
-            else:
-                next = getattr(base, name, _marker)
-
-            if next is not _marker:
-                base = next
-                if ns_used and isinstance(base, MethodType):
-                    base = base()
-                # The bytecode peephole optimizer removes the next line:
-                continue  # pragma: no cover
-            else:
-                base = traversePathElement(
-                    base, name, path_items, request=request
+
+def get_awaitable_resolver():
+    return awaitable_resolver.get()
+
+
+def resolve_target(target):
+    """Return the statements which resolve the value of ``target`` with
+    ``resolve_awaitable``.
+
+    In a template, the resolver is looked up when a render function is
+    called (see ``z3c.pt.compiler.Compiler``), such that the value is
+    only checked when the template is rendered asynchronously.
+    """
+
+    if current_compiler.get() is None:
+        return template(
+            "target = resolve(target)",
+            target=target,
+            resolve=Symbol(resolve_awaitable),
+        )
+    return template(
+        "if RESOLVE is not None: target = RESOLVE(target)",
+        target=target,
+        RESOLVE=RESOLVER,
+    )
+
+
+# The ``ITraversable`` adapter factories of the interfaces provided by
+# the objects traversed by ``traverse_element``.
+traversal_plans = clear_on_registry_change(AdapterLookupCache(1000))
+
+
+def traverse_element(base, name, path_items, request):
+    """Traverse to ``name``, which is not an item of ``base`` (if it
+    is a dictionary) or an attribute (otherwise).
+
+    This is equivalent to ``traversePathElement``, but the
+    ``ITraversable`` adapter factory is remembered per provided
+    interfaces (i.e. per type, unless interfaces are provided by
+    the object directly) in ``traversal_plans``. When the factory is
+    the default traversable, the name is looked up directly.
+    """
+
+    # Names which are special to the traversal API are handled by the
+    # traversal API.
+    if not name or name in (".", "..") or name[:1] in "@+" or \
+            ITraversable.providedBy(base):
+        return traversePathElement(base, name, path_items, request=request)
+
+    factory = traversal_plans.lookup(
+        zope.component.getSiteManager().adapters,
+        (providedBy(base),),
+        ITraversable,
+    )
+    if factory is DefaultTraversable:
+        # See ``DefaultTraversable.traverse``.
+        next = getattr(base, name, _marker)
+        if next is not _marker:
+            return next
+        if hasattr(base, "__getitem__"):
+            try:
+                return base[name]
+            except (KeyError, TypeError):
+                pass
+        raise LocationError(base, name)
+
+    if factory is None:
+        return traversePathElement(base, name, path_items, request=request)
+
+    return traversePathElement(
+        base, name, path_items, traversable=factory(base), request=request
+    )
+
+
+class TraversalStats:
+    """Counts of the steps of path traversal which are fast (an
+    attribute or item lookup) or slow (a lookup using a traversal
+    adapter, e.g. ``ITraversable``), per expression, and of the slow
+    steps per type of the object traversed and name.
+
+    The steps of the path expressions of templates which are compiled
+    with the ``count_traversal`` option are counted; see
+    ``traversal_stats``.
+    """
+
+    def __init__(self):
+        self.expressions = {}
+        self.types = {}
+        self._lock = threading.Lock()
+
+    def record(self, key, steps, slow):
+        with self._lock:
+            counts = self.expressions.get(key)
+            if counts is None:
+                counts = self.expressions[key] = [0, 0]
+            counts[0] += steps - len(slow)
+            counts[1] += len(slow)
+            for cls, name in slow:
+                key = (
+                    "{}.{}".format(cls.__module__, cls.__qualname__),
+                    name,
                 )
+                self.types[key] = self.types.get(key, 0) + 1
+
+    def top(self, limit=10):
+        """Return the expressions with the most slow steps as a list of
+        ``(filename, line, expression, fast, slow)`` tuples, and the
+        types and names with the most slow steps as a list of
+        ``(type, name, slow)`` tuples."""
+
+        with self._lock:
+            expressions = [
+                key + tuple(counts)
+                for key, counts in self.expressions.items()
+                if counts[1]
+            ]
+            types = [key + (count,) for key, count in self.types.items()]
+        expressions.sort(key=lambda item: item[-1], reverse=True)
+        types.sort(key=lambda item: item[-1], reverse=True)
+        return expressions[:limit], types[:limit]
+
+    def format(self, limit=10):
+        """Return the top offenders as text."""
+
+        expressions, types = self.top(limit)
+        lines = ["%8s %8s  %s" % ("fast", "slow", "expression")]
+        for filename, line, expression, fast, slow in expressions:
+            lines.append(
+                "%8d %8d  %s:%s  %s" % (fast, slow, filename, line, expression)
+            )
+        lines.append("")
+        lines.append("%8s  %s" % ("slow", "type / name"))
+        for cls, name, slow in types:
+            lines.append("%8d  %s / %s" % (slow, cls, name))
+        return "\n".join(lines)
 
-            # if not isinstance(base, (basestring, tuple, list)):
-            #    base = proxify(base)
+    def clear(self):
+        with self._lock:
+            self.expressions.clear()
+            self.types.clear()
+
+
+traversal_stats = TraversalStats()
+
+
+def path_traverse(base, econtext, call, path_items, key=None):
+    # If ``key`` is given, the steps are counted in ``traversal_stats``.
+    slow = None if key is None else []
+    if path_items:
+        steps = len(path_items)
+        request = econtext.get("request")
+        path_items = list(path_items)
+        path_items.reverse()
+
+        try:
+            while path_items:
+                name = path_items.pop()
+                ns_used = ":" in name
+                if ns_used:
+                    namespace, name = name.split(":", 1)
+                    function = z3c.pt.namespaces.function_namespaces[
+                        namespace
+                    ]
+                    base = function(base)
+                    if ITraversable.providedBy(base):
+                        if slow is not None:
+                            slow.append((type(base), name))
+                        base = traversePathElement(
+                            base, name, path_items, request=request
+                        )
+
+                        # base = proxify(base)
+
+                        continue
+
+                # special-case dicts for performance reasons
+                if isinstance(base, dict):
+                    next = base.get(name, _marker)
+                else:
+                    next = getattr(base, name, _marker)
+
+                if next is not _marker:
+                    base = next
+                    if ns_used and isinstance(base, MethodType):
+                        base = base()
+                    # The bytecode peephole optimizer removes the next
+                    # line:
+                    continue  # pragma: no cover
+                else:
+                    if slow is not None:
+                        slow.append((type(base), name))
+                    base = traverse_element(base, name, path_items, request)
+
+                # if not isinstance(base, (basestring, tuple, list)):
+                #    base = proxify(base)
+        finally:
+            # The steps which have been taken are counted, including
+            # one which failed (e.g. in an ``exists:`` expression).
+            if slow is not None:
+                traversal_stats.record(key, steps - len(path_items), slow)
 
     if call and getattr(base, "__call__", _marker) is not _marker:
         return base()
@@ -118,6 +509,67 @@ def path_traverse(base, econtext, call, path_items):
     return base
 
 
+@implementer(IHeld)
+class PathMemo(dict):
+    """Memo of the values of ``memo:`` path expressions for a request,
+    keyed by the identity of the base object, the path and whether the
+    value is called. Each value is stored with its base object, such
+    that the identity of the object is not reused while the memo is
+    alive.
+
+    The memo is held by the request (if it supports ``hold``), which
+    releases it when it is closed.
+    """
+
+    def release(self):
+        self.clear()
+
+
+MEMO_KEY = "z3c.pt.memo"
+
+
+def request_memo(request):
+    """Return the ``PathMemo`` of ``request``, or ``None`` if the
+    request has no ``annotations``."""
+
+    annotations = getattr(request, "annotations", None)
+    if annotations is None:
+        return None
+    memo = annotations.get(MEMO_KEY)
+    if memo is None:
+        memo = annotations[MEMO_KEY] = PathMemo()
+        hold = getattr(request, "hold", None)
+        if hold is not None:
+            hold(memo)
+    return memo
+
+
+def clear_memo(request):
+    """Forget the values of the ``memo:`` expressions evaluated for
+    ``request``, e.g. after the objects they traverse have changed."""
+
+    memo = request_memo(request)
+    if memo is not None:
+        memo.clear()
+
+
+def memo_traverse(base, econtext, call, path_items, key=None):
+    memo = request_memo(econtext.get("request"))
+    if memo is None:
+        return path_traverse(base, econtext, call, path_items, key)
+
+    memo_key = id(base), path_items, call
+    entry = memo.get(memo_key)
+    if entry is None:
+        # An awaitable is awaited only once.
+        value = resolve_awaitable(
+            path_traverse(base, econtext, call, path_items, key)
+        )
+        memo[memo_key] = base, value
+        return value
+    return entry[1]
+
+
 class ContextExpressionMixin:
     """Mixin-class for expression compilers."""
 
@@ -139,6 +591,20 @@ class ContextExpressionMixin:
 
 
 class PathExpr(TalesExpr):
+    """Path expression compiler.
+
+    When ``inline`` is set, each literal path segment is compiled into
+    an inline dictionary or attribute lookup; the generic traverser is
+    then only called (with the remaining path) when a lookup misses,
+    or for segments which use interpolation or a namespace.
+    """
+
+    inline = False
+
+    # If set, the steps of the traversal are counted under this key in
+    # ``traversal_stats``; see ``counting_expression_types``.
+    traversal_key = None
+
     path_regex = re.compile(
         r"^(?:(nocall|not):\s*)*((?:[A-Za-z0-9_][A-Za-z0-9_:]*)"
         + r"(?:/[?A-Za-z0-9_@\-+][?A-Za-z0-9_@\-\.+/:]*)*)$"
@@ -187,6 +653,16 @@ class PathExpr(TalesExpr):
         >>> test(PathExpr('None')) is None
         True
         """
+        stmts = self._translate(string, target)
+
+        # An awaitable is returned by a call.
+        m = self.path_regex.match(string.strip())
+        if m is not None and m.group(1) != "nocall":
+            stmts += resolve_target(target)
+
+        return stmts
+
+    def _translate(self, string, target):
         string = string.strip()
 
         if not string:
@@ -211,6 +687,23 @@ class PathExpr(TalesExpr):
             else:
                 components = ()
 
+        if self.traversal_key is not None:
+            # The traversal is counted by the traverser, such that
+            # the path is not looked up inline.
+            call = template(
+                "traverse(base, econtext, call, path_items, key)",
+                traverse=self.traverser,
+                base=base,
+                call=str(not nocall),
+                path_items=ast.Tuple(elts=components),
+                key=ast.Constant(self.traversal_key),
+                mode="eval",
+            )
+            return template("target = value", target=target, value=call)
+
+        if self.inline:
+            return self._translate_inline(base, components, not nocall, target)
+
         call = template(
             "traverse(base, econtext, call, path_items)",
             traverse=self.traverser,
@@ -222,6 +715,65 @@ class PathExpr(TalesExpr):
 
         return template("target = value", target=target, value=call)
 
+    def _translate_inline(self, base, components, call, target):
+        # Only literal segments without a namespace are looked up
+        # inline; the first other segment and the rest of the path are
+        # handed to the traverser. Note that the path item nodes are
+        # copied for each use since the compiler rewrites them in
+        # place.
+        literal = 0
+        for component in components:
+            if not isinstance(component, ast.Constant) or \
+                    ":" in component.value:
+                break
+            literal += 1
+
+        remaining = components[literal:]
+        if remaining:
+            body = template(
+                "target = traverse(__path_base, econtext, call, path_items)",
+                target=target,
+                traverse=self.traverser,
+                call=str(call),
+                path_items=ast.Tuple(elts=copy.deepcopy(remaining)),
+            )
+        elif call:
+            body = template(
+                """
+                if getattr(__path_base, '__call__', marker) is not marker:
+                    __path_base = __path_base()
+                target = __path_base
+                """,
+                target=target,
+                marker=Symbol(_missing),
+            )
+        else:
+            body = template("target = __path_base", target=target)
+
+        for i in reversed(range(literal)):
+            lookup = template(
+                """
+                if isinstance(__path_base, dict):
+                    __path_next = __path_base.get(name, marker)
+                else:
+                    __path_next = getattr(__path_base, name, marker)
+                if __path_next is marker:
+                    target = traverse(__path_base, econtext, call, path_items)
+                else:
+                    __path_base = __path_next
+                """,
+                name=components[i],
+                marker=Symbol(_missing),
+                target=target,
+                traverse=self.traverser,
+                call=str(call),
+                path_items=ast.Tuple(elts=copy.deepcopy(components[i:])),
+            )
+            lookup[-1].orelse.extend(body)
+            body = lookup
+
+        return template("__path_base = base", base=base) + body
+
 
 class NocallExpr(PathExpr):
     """A path-expression which does not call the resolved object."""
@@ -232,6 +784,98 @@ class NocallExpr(PathExpr):
         )
 
 
+class InlinePathExpr(PathExpr):
+    """A path-expression which is compiled into inline lookups."""
+
+    inline = True
+
+
+class InlineNocallExpr(NocallExpr):
+    """A nocall-expression which is compiled into inline lookups."""
+
+    inline = True
+
+
+class MemoExpr(PathExpr):
+    """A path-expression whose value is memoized for the request, per
+    base object and path (see ``request_memo``); e.g.
+    ``memo: context/absolute_url``. It must only be used for paths
+    whose value does not change during the request.
+    """
+
+    traverser = Symbol(memo_traverse)
+
+
+# The key of the expression (e.g. ``exists:``) whose operand is being
+# compiled; the steps of the operand are counted under this key.
+_operand_traversal_key = contextvars.ContextVar(
+    "operand_traversal_key", default=None
+)
+
+
+def _traversal_key(name, expression):
+    location = getattr(expression, "location", None) or (None, None)
+    return (
+        getattr(expression, "filename", None),
+        location[0],
+        "{}:{}".format(name, expression.strip()),
+    )
+
+
+def _counting(factory, name, expression):
+    expr = factory(expression)
+    expr.traversal_key = (
+        _operand_traversal_key.get() or _traversal_key(name, expression)
+    )
+    return expr
+
+
+class CountingOperandExpr:
+    """Expression whose operand (an expression which is compiled when
+    this one is) is counted under the location and type of this
+    expression."""
+
+    def __init__(self, expr, key):
+        self.expr = expr
+        self.key = key
+
+    def __call__(self, target, engine):
+        token = _operand_traversal_key.set(
+            _operand_traversal_key.get() or self.key
+        )
+        try:
+            return self.expr(target, engine)
+        finally:
+            _operand_traversal_key.reset(token)
+
+
+def _counting_operand(factory, name, expression):
+    return CountingOperandExpr(
+        factory(expression), _traversal_key(name, expression)
+    )
+
+
+def counting_expression_types(expression_types):
+    """Return the expression types with the path expression types
+    replaced by factories of expressions which count the steps of
+    their traversal in ``traversal_stats``; the steps of the operands
+    of ``exists:`` and ``not:`` expressions are counted under the
+    location and type of these."""
+
+    def counting(name, factory):
+        if isinstance(factory, type):
+            if issubclass(factory, PathExpr):
+                return functools.partial(_counting, factory, name)
+            if issubclass(factory, (BaseExistsExpr, NotExpr)):
+                return functools.partial(_counting_operand, factory, name)
+        return factory
+
+    return {
+        name: counting(name, factory)
+        for name, factory in expression_types.items()
+    }
+
+
 class ExistsExpr(BaseExistsExpr):
     exceptions = AttributeError, LookupError, TypeError, KeyError, NameError
 
@@ -242,6 +886,16 @@ class ExistsExpr(BaseExistsExpr):
 class ProviderExpr(ContextExpressionMixin, StringExpr):
     transform = Symbol(render_content_provider)
 
+    def __init__(self, expression, *args, **kwargs):
+        super().__init__(expression, *args, **kwargs)
+        self.expression = expression
+
+    def __call__(self, target, engine):
+        compiler = current_compiler.get()
+        if compiler is not None and "$" not in self.expression:
+            compiler.record_provider(self.expression.strip())
+        return super().__call__(target, engine)
+
 
 class PythonExpr(BasePythonExpr):
     builtins = {
@@ -255,7 +909,16 @@ class PythonExpr(BasePythonExpr):
     }
 
     def __call__(self, target, engine):
-        return self.translate(self.expression, target)
+        stmts = self.translate(self.expression, target)
+
+        # An awaitable is returned by a call; the result of other
+        # expressions is left alone.
+        assignment = stmts[-1]
+        if isinstance(assignment, ast.Assign) and \
+                isinstance(assignment.value, ast.Call):
+            stmts += resolve_target(target)
+
+        return stmts
 
     def rewrite(self, node):
         builtin = self.builtins.get(node.id)
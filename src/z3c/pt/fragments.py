@@ -0,0 +1,194 @@
+##############################################################################
+#
+# Copyright (c) 2007 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""Cache the output of template fragments.
+
+The output of an element which has a ``cache:key`` (an expression)
+or ``cache:ttl`` (a number of seconds) attribute is cached, e.g.::
+
+  <nav cache:key="python: (context.modified, request.LANGUAGE)"
+       cache:ttl="300">...</nav>
+
+When the output is cached, the element (and its content) is not
+rendered at all. The output is cached under the position of the
+element in the template and the value of the key, which must be
+hashable; if the key is ``None``, the element is rendered without
+caching.
+
+The cache is the ``fragment_cache`` of the template which is rendered
+(for a macro, that of the template which uses it) or, if it is not
+set, ``fragment_cache``, a ``MemoryFragmentCache``.
+
+When a template file whose macros are included by the fragments of
+other template files is reloaded, these fragments are no longer used;
+see ``invalidate``.
+"""
+import hashlib
+import itertools
+import os
+import tempfile
+import time
+
+from z3c.pt.cache import LRUCache
+from z3c.pt.dependencies import macro_dependencies
+
+
+_marker = object()
+
+
+class MemoryFragmentCache(LRUCache):
+    """In-process cache of at most ``maxsize`` fragments, which evicts
+    the least recently used entry."""
+
+    def get(self, key, default=None):
+        entry = super().get(key, _marker)
+        if entry is _marker:
+            return default
+        value, expires = entry
+        if expires is not None and expires <= time.monotonic():
+            with self._lock:
+                if self._data.get(key) is entry:
+                    del self._data[key]
+                self.hits -= 1
+                self.misses += 1
+            return default
+        return value
+
+    def set(self, key, value, ttl=None):
+        expires = None if ttl is None else time.monotonic() + ttl
+        self[key] = value, expires
+
+
+class FileFragmentCache:
+    """Cache of fragments stored as files in the directory ``path``,
+    which may be shared by several processes (e.g. in ``/dev/shm``, a
+    file system in shared memory).
+
+    A file is named by a digest of the ``repr()`` of its key, which
+    must therefore identify the key. Expired files are removed when
+    they are read, or by ``prune``.
+    """
+
+    def __init__(self, path):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+
+    def _filename(self, key):
+        digest = hashlib.sha256(repr(key).encode("utf-8")).hexdigest()
+        return os.path.join(self.path, digest)
+
+    def _read(self, filename):
+        with open(filename, encoding="utf-8", newline="") as f:
+            expires = f.readline().strip()
+            if expires != "-" and float(expires) <= time.time():
+                return None
+            return f.read()
+
+    def get(self, key, default=None):
+        filename = self._filename(key)
+        try:
+            value = self._read(filename)
+        except (OSError, ValueError):
+            return default
+        if value is None:
+            _remove(filename)
+            return default
+        return value
+
+    def set(self, key, value, ttl=None):
+        expires = "-" if ttl is None else repr(time.time() + ttl)
+        fd, name = tempfile.mkstemp(dir=self.path, prefix=".")
+        try:
+            with open(fd, "w", encoding="utf-8", newline="") as f:
+                f.write(expires + "\n")
+                f.write(value)
+            os.replace(name, self._filename(key))
+        except BaseException:
+            _remove(name)
+            raise
+
+    def prune(self):
+        """Remove the expired fragments."""
+
+        for name in os.listdir(self.path):
+            if name.startswith("."):
+                # A file which is being written.
+                continue
+            filename = os.path.join(self.path, name)
+            try:
+                expired = self._read(filename) is None
+            except (OSError, ValueError):
+                continue
+            if expired:
+                _remove(filename)
+
+    def clear(self):
+        for name in os.listdir(self.path):
+            _remove(os.path.join(self.path, name))
+
+
+def _remove(filename):
+    try:
+        os.remove(filename)
+    except OSError:
+        pass
+
+
+fragment_cache = MemoryFragmentCache()
+
+# Maps a template file to the generation of its fragments, which is
+# part of their keys; see ``invalidate``.
+generations = {}
+
+_generation = itertools.count(1)
+
+
+def invalidate(source, dependents):
+    """Start a new generation of the fragments of the template files
+    ``dependents``, which include the macros of the template file
+    ``source`` (which has changed); subscribed to
+    ``z3c.pt.dependencies.macro_dependencies``.
+
+    Note that the generations are not shared by processes; a
+    ``FileFragmentCache`` should be cleared when the templates are
+    changed and the processes restarted.
+    """
+
+    for filename in dependents:
+        generations[filename] = next(_generation)
+
+
+macro_dependencies.subscribers.append(invalidate)
+
+
+def lookup(econtext, fragment_id, filename, key):
+    """Return the cache, the key of the fragment of the template file
+    ``filename`` in it and its cached output (or ``None``); the cache
+    is ``None`` if the key is ``None``."""
+
+    if key is None:
+        return None, None, None
+    cache = econtext.get("__fragment_cache")
+    if cache is None:
+        cache = fragment_cache
+    key = fragment_id, generations.get(filename, 0), key
+    return cache, key, cache.get(key)
+
+
+try:
+    from zope.testing.cleanup import addCleanUp
+except ModuleNotFoundError:  # pragma: no cover
+    pass
+else:
+    addCleanUp(fragment_cache.clear)
+    addCleanUp(generations.clear)
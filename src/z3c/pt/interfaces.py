@@ -1,3 +1,4 @@
+from zope.contentprovider.interfaces import IContentProvider
 from zope.interface import Attribute
 from zope.interface import Interface
 
@@ -100,3 +101,22 @@ class ITALESIterator(ITALIterator):  # pragma: no cover
         Note that this may fail if the TAL iterator was created on a Python
         iterator.
         """
+
+
+class ICachedContentProvider(IContentProvider):  # pragma: no cover
+    """A content provider whose output may be cached
+
+    When the provider is inserted using a ``provider:`` expression, the
+    output of ``render`` is cached under the key returned by
+    ``cache_key``; while it is cached, the provider is neither updated
+    nor rendered.
+    """
+
+    def cache_key():
+        """Return a hashable key which identifies the output
+
+        The key is computed before ``update`` is called, and should
+        depend on everything the output depends on (e.g. the
+        modification time of the content and the language of the
+        request). Return ``None`` if the output must not be cached.
+        """
@@ -11,11 +11,247 @@
 # FOR A PARTICULAR PURPOSE.
 #
 ##############################################################################
+import concurrent.futures
+import fnmatch
+import os
+import threading
+import time
+
 from chameleon import loader
+from chameleon.config import CACHE_DIRECTORY
 
+from z3c.pt.cache import CompiledTemplateCache
 from z3c.pt.pagetemplate import PageTemplateFile
+from z3c.pt.precompile import compile_template
+
+
+class LoadReport:
+    """The result of ``TemplateLoader.load_all``.
+
+    ``templates`` maps the relative name of each template which was
+    loaded to the template, ``failures`` the name of each template
+    which could not be loaded to the exception, and ``timings`` the
+    name of each template to the time it took to load (and compile) it
+    in seconds; ``duration`` is the total time in seconds.
+    """
+
+    def __init__(self):
+        self.templates = {}
+        self.failures = {}
+        self.timings = {}
+        self.duration = 0.0
+
+    def __repr__(self):
+        return "<{} {} loaded, {} failed in {:.3f}s>".format(
+            type(self).__name__,
+            len(self.templates),
+            len(self.failures),
+            self.duration,
+        )
 
 
 class TemplateLoader(loader.TemplateLoader):
+    """Template loader which loads ``PageTemplateFile`` instances using
+    ``load_page``.
+
+    If ``indexed`` is set, the files in the directories of the search
+    path (and their subdirectories) are indexed by their relative name
+    when the loader is created, such that a relative name is resolved
+    without probing each directory; as with the default lookup, the
+    first directory which has a file of that name takes precedence.
+    The index is built again if a directory has changed (a file was
+    added, removed or renamed), which is checked at most every
+    ``refresh_interval`` seconds when a template is loaded (or never,
+    if ``None``; see ``refresh``). Templates are created once per
+    resolved path and class.
+
+    Entries of the search path must be directories in the file system;
+    a ``package:path`` entry is resolved to the directory of the
+    package.
+    """
+
+    def __init__(
+        self,
+        search_path=None,
+        default_extension=None,
+        indexed=False,
+        refresh_interval=1.0,
+        **kwargs
+    ):
+        super().__init__(search_path, default_extension, **kwargs)
+        self.indexed = indexed
+        self.refresh_interval = refresh_interval
+        if indexed:
+            self._lock = threading.Lock()
+            self._templates = {}
+            self.refresh(force=True)
+
+    def _directories(self):
+        for path in self.search_path:
+            if not os.path.isabs(path) and ":" in path:
+                package_name, path = path.split(":", 1)
+                with loader.import_package_resource(package_name) as files:
+                    path = str(files.joinpath(path))
+            yield os.path.abspath(path)
+
+    def _build(self):
+        index = {}
+        mtimes = {}
+        paths = set()
+        for directory in self._directories():
+            mtimes[directory] = _mtime(directory)
+            for path, dirnames, filenames in os.walk(directory):
+                dirnames.sort()
+                if path != directory:
+                    mtimes[path] = _mtime(path)
+                prefix = os.path.relpath(path, directory)
+                for filename in filenames:
+                    name = os.path.normpath(os.path.join(prefix, filename))
+                    filename = os.path.join(path, filename)
+                    index.setdefault(name, filename)
+                    paths.add(filename)
+        return index, mtimes, paths
+
+    def refresh(self, force=False):
+        """Build the index again if a directory has changed (or if
+        ``force`` is set)."""
+
+        with self._lock:
+            self._checked = time.monotonic()
+            if not force and all(
+                _mtime(path) == mtime for path, mtime in self._mtimes.items()
+            ):
+                return False
+
+            self._index, self._mtimes, paths = self._build()
+            self._templates = {
+                key: template
+                for key, template in self._templates.items()
+                if key[0] in paths
+            }
+            return True
+
+    def load(self, spec, cls=None):
+        if not self.indexed:
+            return super().load(spec, cls)
+
+        if cls is None:
+            raise ValueError("Unbound template loader.")
+
+        spec = spec.strip()
+        if self.default_extension is not None and "." not in spec:
+            spec += self.default_extension
+
+        if os.path.isabs(spec) or ":" in spec:
+            return super().load(spec, cls)
+
+        interval = self.refresh_interval
+        if (
+            interval is not None
+            and time.monotonic() - self._checked >= interval
+        ):
+            self.refresh()
+
+        name = os.path.normpath(spec)
+        path = self._index.get(name)
+        if path is None:
+            raise ValueError("Template not found: %s." % spec)
+
+        key = path, cls
+        template = self._templates.get(key)
+        if template is None:
+            template = self._templates.setdefault(
+                key, cls(path, search_path=self.search_path, **self.kwargs)
+            )
+        return template
+
+    def load_all(
+        self,
+        patterns=("*.pt",),
+        cls=PageTemplateFile,
+        jobs=None,
+        processes=False,
+        cache_dir=None,
+    ):
+        """Load and compile the templates in the search path whose
+        relative names match one of ``patterns`` (see ``fnmatch``),
+        e.g. when a server starts; returns a ``LoadReport``.
+
+        The templates are loaded using a pool of ``jobs`` threads. If
+        ``processes`` is set, they are first compiled into the cache
+        directory ``cache_dir`` (by default, the Chameleon cache
+        directory) by as many worker processes (see
+        ``z3c.pt.precompile``) and then loaded from there.
+        """
+
+        start = time.perf_counter()
+        if self.indexed:
+            self.refresh()
+            index = self._index
+        else:
+            index = self._build()[0]
+
+        names = sorted(
+            name
+            for name in index
+            if any(fnmatch.fnmatch(name, pattern) for pattern in patterns)
+        )
+
+        report = LoadReport()
+        compile_times = {}
+        cache = None
+        if processes:
+            cache_dir = cache_dir or CACHE_DIRECTORY
+            if not cache_dir:
+                raise ValueError("No cache directory (set CHAMELEON_CACHE).")
+            cache_dir = os.path.abspath(cache_dir)
+            class_name = "{}.{}".format(cls.__module__, cls.__qualname__)
+            with concurrent.futures.ProcessPoolExecutor(jobs) as executor:
+                futures = {
+                    name: executor.submit(
+                        compile_template,
+                        index[name],
+                        class_name,
+                        cache_dir,
+                        self.kwargs,
+                    )
+                    for name in names
+                }
+                for name, future in futures.items():
+                    compile_times[name] = future.result()[3]
+            cache = CompiledTemplateCache(cache_dir)
+
+        def load(name):
+            start = time.perf_counter()
+            try:
+                template = self.load(name, cls)
+                if cache is not None and not (
+                    isinstance(template.loader, CompiledTemplateCache)
+                    and os.path.abspath(template.loader.path) == cache_dir
+                ):
+                    template.loader = cache
+                template.cook_check()
+            except Exception as exc:
+                return name, None, exc, time.perf_counter() - start
+            return name, template, None, time.perf_counter() - start
+
+        with concurrent.futures.ThreadPoolExecutor(jobs) as executor:
+            for name, template, exc, duration in executor.map(load, names):
+                report.timings[name] = duration + compile_times.get(name, 0)
+                if exc is None:
+                    report.templates[name] = template
+                else:
+                    report.failures[name] = exc
+
+        report.duration = time.perf_counter() - start
+        return report
+
     def load_page(self, filename):
         return self.load(filename, PageTemplateFile)
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
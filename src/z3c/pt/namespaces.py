@@ -12,8 +12,17 @@
 #
 ##############################################################################
 import zope.component
+from zope.interface import providedBy
 from zope.traversing.interfaces import IPathAdapter
 
+from z3c.pt.cache import AdapterLookupCache
+from z3c.pt.cache import clear_on_registry_change
+
+
+# The ``IPathAdapter`` factories of the interfaces provided by the
+# objects which a namespace is applied to, per namespace name.
+path_adapter_factories = clear_on_registry_change(AdapterLookupCache(1000))
+
 
 class AdapterNamespaces:
     """Simulate tales function namespaces with adapter lookup.
@@ -50,12 +59,18 @@ class AdapterNamespaces:
         if namespace is None:
 
             def namespace(object):
-                try:
-                    return zope.component.getAdapter(
-                        object, IPathAdapter, name
-                    )
-                except zope.component.ComponentLookupError:
-                    raise KeyError(name)
+                factory = path_adapter_factories.lookup(
+                    zope.component.getSiteManager().adapters,
+                    (providedBy(object),),
+                    IPathAdapter,
+                    name,
+                )
+                if factory is not None:
+                    adapter = factory(object)
+                    if adapter is not None:
+                        return adapter
+
+                raise KeyError(name)
 
             self.namespaces[name] = namespace
         return namespace
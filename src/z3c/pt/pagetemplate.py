@@ -11,19 +11,51 @@
 # FOR A PARTICULAR PURPOSE.
 #
 ##############################################################################
+import asyncio
+import concurrent.futures
+import contextvars
+import copy
+import functools
+import gc
+import hashlib
+import importlib.metadata
+import inspect
+import logging
 import os
+import queue
 import sys
+import threading
+import weakref
 
+import zope.component
 from chameleon.compiler import ExpressionEvaluator
+from chameleon.config import CACHE_DIRECTORY
 from chameleon.i18n import fast_translate
+from chameleon.loader import MemoryLoader
+from chameleon.nodes import Module
+from chameleon.tales import ExpressionParser
 from chameleon.tales import NotExpr
 from chameleon.tales import StringExpr
 from chameleon.tales import StructureExpr
+from chameleon.template import PROGRAM_NAME
 from chameleon.zpt import template
 from zope import i18n
+from zope.i18n.interfaces import ITranslationDomain
 from zope.security.proxy import ProxyFactory
 
 from z3c.pt import expressions
+from z3c.pt import streaming
+from z3c.pt import threads
+from z3c.pt.cache import CompiledTemplateCache
+from z3c.pt.cache import LRUCache
+from z3c.pt.cache import TemplateCache
+from z3c.pt.cache import clear_on_registry_change
+from z3c.pt.compiler import Compiler
+from z3c.pt.compiler import PretranslatingCompiler
+from z3c.pt.dependencies import FileMacro
+from z3c.pt.dependencies import macro_dependencies
+from z3c.pt.profile import profiled_expression_types
+from z3c.pt.program import MacroProgram
 
 
 try:
@@ -35,6 +67,13 @@ except ModuleNotFoundError:
 
 _marker = object()
 
+log = logging.getLogger("z3c.pt")
+
+try:
+    VERSION = importlib.metadata.version("z3c.pt")
+except importlib.metadata.PackageNotFoundError:  # pragma: no cover
+    VERSION = ""
+
 
 BOOLEAN_HTML_ATTRS = frozenset(
     [
@@ -100,6 +139,268 @@ class OpaqueDict(dict):
 sys_modules = ProxyFactory(OpaqueDict(sys.modules))
 
 
+# Maps the domain (and its translation domain utility, which depends
+# on the current site), message id, default and target language of a
+# message without mapping to its translation; see
+# ``BaseTemplate.memoize_translations``. It is cleared when a component
+# is registered or unregistered; code which reloads message catalogs
+# should clear it as well.
+translation_cache = clear_on_registry_change(LRUCache(10000))
+
+
+def memoized_translate(msgid, domain, context, target_language, default):
+    """Translate a message without mapping using ``fast_translate``,
+    memoizing the result in ``translation_cache``."""
+
+    if isinstance(msgid, i18n.Message):
+        if msgid.mapping is not None or msgid.msgid_plural is not None:
+            return fast_translate(
+                msgid, domain, None, context, target_language, default
+            )
+        domain = msgid.domain
+        default = msgid.default
+
+    utility = zope.component.queryUtility(ITranslationDomain, domain)
+    key = domain, utility, str(msgid), default, target_language
+    result = translation_cache.get(key, _marker)
+    if result is _marker:
+        result = translation_cache[key] = fast_translate(
+            msgid, domain, None, context, target_language, default
+        )
+
+    return result
+
+
+# Maps a template and target language to the body and the variant of
+# the template compiled for that language; see
+# ``BaseTemplate.pretranslate_languages``.
+pretranslated_templates = clear_on_registry_change(LRUCache(1000))
+
+
+# Maps the filename and ``_compile_digest`` of a file-based template
+# to the compiled template, such that another template for the same
+# file (of any class) is not compiled again; see
+# ``BaseTemplateFile.cache``.
+template_cache = TemplateCache()
+
+# The file-based templates which have been created; see
+# ``preload_templates``.
+file_templates = weakref.WeakSet()
+
+
+def pretranslate(msgid, domain, target_language, default):
+    """Translate a static message when a template is compiled."""
+
+    return fast_translate(msgid, domain, None, None, target_language, default)
+
+
+async def _capture(awaitable):
+    try:
+        return True, await awaitable
+    except Exception as exc:
+        return False, exc
+
+
+async def _gather(value):
+    if inspect.isawaitable(value):
+        return await value
+
+    results = iter(await asyncio.gather(
+        *(item for item in value if inspect.isawaitable(item))
+    ))
+    return type(value)(
+        next(results) if inspect.isawaitable(item) else item
+        for item in value
+    )
+
+
+# The render whose awaitables are awaited by the current task.
+_awaiting_render = contextvars.ContextVar("awaiting_render", default=None)
+
+
+def _set_result(future, success, result):
+    if future.cancelled():
+        return
+    if success:
+        future.set_result(result)
+    else:
+        future.set_exception(result)
+
+
+def _describe_factory(factory):
+    """Return a description of an expression factory (or of an argument
+    of a ``functools.partial``) which is the same in each process.
+
+    A factory without a name (e.g. an instance) is described by its
+    class, and a partial by its function and arguments; the ``repr``
+    of such objects may contain their address.
+    """
+
+    if isinstance(factory, functools.partial):
+        args = [_describe_factory(arg) for arg in factory.args]
+        args.extend(
+            "{}={}".format(key, _describe_factory(value))
+            for key, value in sorted(factory.keywords.items())
+        )
+        return "{}({})".format(
+            _describe_factory(factory.func), ", ".join(args)
+        )
+    if isinstance(factory, (str, bytes, int, float, bool, type(None))):
+        return repr(factory)
+    qualname = getattr(factory, "__qualname__", None)
+    if qualname is None:
+        factory = type(factory)
+        qualname = factory.__qualname__
+    return "{}.{}".format(factory.__module__, qualname)
+
+
+class AsyncRender:
+    """A template render of ``run_async``.
+
+    The awaitables are awaited on the event loop while the thread of
+    the render waits; meanwhile, it runs the renders which are started
+    by them (see ``run_nested``), such that these never wait for a
+    thread of the executor.
+    """
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.calls = queue.SimpleQueue()
+        self.waiting = False
+
+    def resolve(self, value):
+        if not inspect.isawaitable(value) and not (
+            isinstance(value, (list, tuple))
+            and any(map(inspect.isawaitable, value))
+        ):
+            return value
+
+        self.waiting = True
+        future = asyncio.run_coroutine_threadsafe(
+            self._await(value), self.loop
+        )
+        future.add_done_callback(self._done)
+        for call in iter(self.calls.get, None):
+            call()
+        return future.result()
+
+    async def _await(self, value):
+        _awaiting_render.set(self)
+        return await _gather(value)
+
+    def _done(self, future):
+        # Called on the event loop (or, if the task could not be
+        # scheduled, in the thread of the render).
+        self.waiting = False
+        self.calls.put(None)
+
+    def run_nested(self, call):
+        """Run ``call`` in the thread of the render and return a future
+        of its result."""
+
+        future = self.loop.create_future()
+
+        def run():
+            try:
+                result = True, call()
+            except BaseException as exc:
+                result = False, exc
+            self.loop.call_soon_threadsafe(_set_result, future, *result)
+
+        self.calls.put(run)
+        return future
+
+
+async def run_async(func, *args, **kwargs):
+    """Call ``func`` (which renders a template) in a thread of
+    ``z3c.pt.threads.executor`` and return its result.
+
+    While rendering, awaitables returned by a call in a path or Python
+    expression and by a content provider's ``update()`` or ``render()``
+    are awaited on the running event loop; the elements of a list or
+    tuple of awaitables are awaited concurrently.
+
+    The context variables, site and security interaction of the caller
+    are used, but no other thread-local state: e.g. the render sees
+    another transaction (``transaction.get()``) and no global request
+    (``zope.globalrequest.getRequest()``); see ``z3c.pt.threads``. A
+    template which depends on such state must be rendered using
+    ``render()``.
+
+    A render which is started by an awaitable of another render is run
+    in the thread of the latter (which waits for it).
+    """
+
+    loop = asyncio.get_running_loop()
+    render = AsyncRender(loop)
+
+    def run():
+        token = expressions.awaitable_resolver.set(render.resolve)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            expressions.awaitable_resolver.reset(token)
+
+    call = expressions.in_calling_context(run)
+    awaiting = _awaiting_render.get()
+    if awaiting is not None and awaiting.loop is loop and awaiting.waiting:
+        return await awaiting.run_nested(call)
+    return await loop.run_in_executor(threads.executor, call)
+
+
+class AwaitingExecutor:
+    """Executor which calls the submitted function right away; if it
+    returns an awaitable, the future is completed by ``wait``, which
+    awaits all of them concurrently."""
+
+    def __init__(self):
+        self.pending = []
+
+    def submit(self, func, *args, **kwargs):
+        future = concurrent.futures.Future()
+        try:
+            result = func(*args, **kwargs)
+        except Exception as exc:
+            future.set_exception(exc)
+        else:
+            if inspect.isawaitable(result):
+                self.pending.append((future, _capture(result)))
+            else:
+                future.set_result(result)
+        return future
+
+    def wait(self):
+        if not self.pending:
+            return
+
+        futures, awaitables = zip(*self.pending)
+        del self.pending[:]
+        results = expressions.resolve_awaitable(list(awaitables))
+        for future, (success, result) in zip(futures, results):
+            if success:
+                future.set_result(result)
+            else:
+                future.set_exception(result)
+
+
+class Macros(template.Macros):
+    """The macros of a template.
+
+    The macros of a file-based template know its file, such that the
+    file-based templates which include them record the dependency in
+    ``macro_dependencies`` (see ``z3c.pt.dependencies.record_macro``).
+    """
+
+    __slots__ = ()
+
+    def __getitem__(self, name):
+        macro = super().__getitem__(name)
+        source = self.template
+        if not isinstance(source, BaseTemplateFile):
+            return macro
+        return FileMacro(macro.include, str(source.filename))
+
+
 class BaseTemplate(template.PageTemplate):
     content_type = None
     version = 2
@@ -112,6 +413,7 @@ class BaseTemplate(template.PageTemplate):
         "path": expressions.PathExpr,
         "provider": expressions.ProviderExpr,
         "nocall": expressions.NocallExpr,
+        "memo": expressions.MemoExpr,
         "structure": StructureExpr,
     }
 
@@ -128,6 +430,63 @@ class BaseTemplate(template.PageTemplate):
 
     i18n_message_type = i18n.Message
 
+    # If set to an executor (e.g. a ``ThreadPoolExecutor``), the
+    # ``update()`` of the content providers which are inserted using a
+    # static ``provider:`` expression is submitted to it when the
+    # render starts; each provider is then rendered in document order
+    # when its update has completed. Note that providers which are
+    # never inserted (e.g. due to a condition) are updated as well.
+    provider_update_executor = None
+
+    _static_providers = ()
+
+    # If set, the translation of messages without a mapping is
+    # memoized per domain, message id, default and target language when
+    # the target language is known; see ``translation_cache``.
+    memoize_translations = False
+
+    # Size (in characters) of the chunks yielded by ``render_iter``.
+    stream_chunk_size = 65536
+
+    # Target languages for which a variant of the template is compiled
+    # (when first rendered in that language) with the translation of
+    # static messages substituted; see ``PretranslatingCompiler``.
+    # Note that these translations must not depend on the request or
+    # the site.
+    pretranslate_languages = ()
+
+    _pretranslate_language = None
+
+    # The body which the template was last cooked with; the variants
+    # are compiled from it.
+    _pretranslate_body = None
+
+    _variant_lock = threading.Lock()
+
+    # If set, the template is compiled such that the evaluation of each
+    # expression is timed and recorded in
+    # ``z3c.pt.profile.expression_profile``. Note that this must be set
+    # before the template is compiled.
+    profile_expressions = False
+
+    # If set, the template is compiled such that the steps of the
+    # traversal of path expressions which are fast (an attribute or
+    # item lookup) or slow (using a traversal adapter) are counted in
+    # ``z3c.pt.expressions.traversal_stats``. Note that this must be
+    # set before the template is compiled.
+    count_traversal = False
+
+    # The cache of the output of the elements which have a
+    # ``cache:key`` or ``cache:ttl`` attribute (e.g. a
+    # ``z3c.pt.fragments.FileFragmentCache``); if ``None``, that of
+    # ``z3c.pt.fragments``.
+    fragment_cache = None
+
+    # Compiled templates are written to the Chameleon cache directory
+    # (if set) using a cache which keeps hit, miss and stale counts.
+    if CACHE_DIRECTORY:
+        loader = CompiledTemplateCache(CACHE_DIRECTORY)
+
     @property
     def boolean_attributes(self):
         if self.content_type == "text/xml":
@@ -135,6 +494,17 @@ class BaseTemplate(template.PageTemplate):
 
         return BOOLEAN_HTML_ATTRS
 
+    @property
+    def expression_parser(self):
+        expression_types = self.expression_types
+        if self.count_traversal:
+            expression_types = expressions.counting_expression_types(
+                expression_types
+            )
+        if self.profile_expressions:
+            expression_types = profiled_expression_types(expression_types)
+        return ExpressionParser(expression_types, self.default_expression)
+
     @property
     def builtins(self):
         builtins = {"nothing": None, "modules": sys_modules}
@@ -144,6 +514,151 @@ class BaseTemplate(template.PageTemplate):
 
         return builtins
 
+    def cook(self, body):
+        super().cook(body)
+        self._pretranslate_body = body
+
+    def digest(self, body, names):
+        """Return the key of the compiled template, which includes the
+        expression types, the version of this package and the settings
+        which the compiled template depends on."""
+
+        digest = hashlib.sha256(super().digest(body, names).encode("utf-8"))
+        digest.update(self._compile_digest(body, names).encode("ascii"))
+        return digest.hexdigest()[:32]
+
+    def _compile_digest(self, body, names):
+        """Return a digest of the source, the builtin names, the
+        expression types, the version of this package and the settings
+        which the compiled template depends on (but not of the class of
+        the template)."""
+
+        digest = hashlib.sha256(body.encode("utf-8"))
+        digest.update(";".join(names).encode("utf-8"))
+        digest.update(VERSION.encode("utf-8"))
+        for name, factory in sorted(self.expression_types.items()):
+            digest.update(
+                ";{}={}".format(name, _describe_factory(factory)).encode(
+                    "utf-8"
+                )
+            )
+        for attr in (
+            "content_type",
+            "count_traversal",
+            "default_expression",
+            "enable_comment_interpolation",
+            "implicit_i18n_translate",
+            "literal_false",
+            "mode",
+            "profile_expressions",
+            "strict",
+            "trim_attribute_space",
+            "_pretranslate_language",
+        ):
+            digest.update(
+                ";{}={}".format(attr, getattr(self, attr)).encode("utf-8")
+            )
+        digest.update(
+            ";implicit_i18n_attributes={}".format(
+                sorted(self.implicit_i18n_attributes)
+            ).encode("utf-8")
+        )
+        for name in ("parse", "_compile"):
+            method = getattr(type(self), name)
+            digest.update(
+                ";{}={}.{}".format(
+                    name, method.__module__, method.__qualname__
+                ).encode("utf-8")
+            )
+        return digest.hexdigest()
+
+    def parse(self, body):
+        # As ``chameleon.zpt.template.PageTemplate.parse``, but the
+        # program supports the ``cache`` namespace.
+        boolean_attributes = self.boolean_attributes
+
+        if self.content_type != "text/xml":
+            if boolean_attributes is None:
+                boolean_attributes = template.BOOLEAN_HTML_ATTRIBUTES
+
+            body = body.replace("\r\n", "\n").replace("\r", "\n")
+
+        return MacroProgram(
+            body,
+            self.mode,
+            self.filename,
+            escape=self.mode == "xml",
+            default_marker=self.default_marker,
+            boolean_attributes=boolean_attributes or frozenset(),
+            implicit_i18n_translate=self.implicit_i18n_translate,
+            implicit_i18n_attributes=self.implicit_i18n_attributes,
+            trim_attribute_space=self.trim_attribute_space,
+            enable_data_attributes=self.enable_data_attributes,
+            enable_comment_interpolation=self.enable_comment_interpolation,
+            restricted_namespace=self.restricted_namespace,
+            tokenizer=self.tokenizer,
+        )
+
+    def _cook(self, body, name, builtins):
+        program = self._cook_program(body, name, builtins)
+
+        # See ``z3c.pt.compiler.Compiler``.
+        self._static_providers = program.get("__static_providers", ())
+        return program
+
+    def _cook_program(self, body, name, builtins):
+        return super()._cook(body, name, builtins)
+
+    def _compile(self, body, builtins):
+        program = self.parse(body)
+        kwargs = {}
+        if isinstance(self, BaseTemplateFile):
+            kwargs.update(macro_dependent=str(self.filename))
+        compiler = Compiler
+        target_language = self._pretranslate_language
+        if target_language is not None:
+            compiler = PretranslatingCompiler
+            kwargs.update(
+                translate=pretranslate, target_language=target_language
+            )
+
+        return compiler(
+            self.engine,
+            Module(PROGRAM_NAME, program),
+            str(self.filename),
+            body,
+            builtins=builtins,
+            strict=self.strict,
+            **kwargs
+        ).code
+
+    def _pretranslated(self, target_language):
+        """Return the variant of the template compiled for
+        ``target_language``."""
+
+        self.cook_check()
+        body = self._pretranslate_body
+        key = self, target_language
+        entry = pretranslated_templates.get(key)
+        if entry is not None and entry[0] is body:
+            return entry[1]
+
+        with self._variant_lock:
+            entry = pretranslated_templates.get(key)
+            if entry is None or entry[0] is not body:
+                variant = copy.copy(self)
+                variant._pretranslate_language = target_language
+                variant._cook_lock = threading.Lock()
+                variant.auto_reload = False
+
+                # The translations may change when the template does
+                # not; the variant is therefore never written to the
+                # cache.
+                variant.loader = MemoryLoader()
+                variant.cook(body)
+                entry = pretranslated_templates[key] = body, variant
+        return entry[1]
+
     def bind(self, ob, request=None):
         def render(request=request, **kwargs):
             context = self._pt_get_context(ob, request, kwargs)
@@ -151,7 +666,23 @@ class BaseTemplate(template.PageTemplate):
 
         return BoundPageTemplate(self, render)
 
+    def output_stream_factory(self):
+        # See ``z3c.pt.streaming``.
+        stream = streaming.output_stream.get()
+        if stream is None:
+            return template.PageTemplate.output_stream_factory()
+        streaming.output_stream.set(None)
+        stream.started.set()
+        return stream
+
     def render(self, target_language=None, **context):
+        # The output of a render for ``render_iter`` is streamed; the
+        # stream is not passed on to what is called before the template
+        # itself is rendered (e.g. content provider updates).
+        stream = streaming.output_stream.get()
+        if stream is not None:
+            streaming.output_stream.set(None)
+
         # We always include a ``request`` variable; it is (currently)
         # depended on in various expression types and must be defined
         request = context.setdefault("request", None)
@@ -163,6 +694,7 @@ class BaseTemplate(template.PageTemplate):
                 target_language = None
 
         context["target_language"] = target_language
+        memoize = self.memoize_translations
 
         # bind translation-method to request
         def translate(
@@ -191,12 +723,20 @@ class BaseTemplate(template.PageTemplate):
             if not isinstance(msgid, (self.i18n_message_type, str)):
                 return msgid
 
+            if memoize and mapping is None and target_language is not None:
+                return memoized_translate(
+                    msgid, domain, request, target_language, default
+                )
+
             return fast_translate(
                 msgid, domain, mapping, request, target_language, default
             )
 
         context["translate"] = translate
 
+        if self.fragment_cache is not None:
+            context.setdefault("__fragment_cache", self.fragment_cache)
+
         if request is not None and not isinstance(request, str):
             content_type = self.content_type or "text/html"
             response = request.response
@@ -204,7 +744,66 @@ class BaseTemplate(template.PageTemplate):
                 response.setHeader("Content-Type", content_type)
 
         base_renderer = super().render
-        return base_renderer(**context)
+        if target_language in self.pretranslate_languages:
+            variant = self._pretranslated(target_language)
+            base_renderer = super(BaseTemplate, variant).render
+        if stream is not None:
+            base_renderer = functools.partial(
+                streaming.render_into, stream, base_renderer
+            )
+
+        # When rendering asynchronously, the content provider updates
+        # which return an awaitable are awaited concurrently.
+        executor = self.provider_update_executor
+        if executor is None:
+            if expressions.awaitable_resolver.get() is None:
+                return base_renderer(**context)
+            executor = AwaitingExecutor()
+
+        # The static provider names are collected when the template
+        # is cooked.
+        self.cook_check()
+        if not self._static_providers:
+            return base_renderer(**context)
+
+        updates = context["__provider_updates"] = (
+            expressions.update_content_providers(
+                context, self._static_providers, executor
+            )
+        )
+
+        if isinstance(executor, AwaitingExecutor):
+            executor.wait()
+
+        try:
+            return base_renderer(**context)
+        finally:
+            for objects, cp, future, key in updates.values():
+                future.cancel()
+
+    def render_iter(self, chunk_size=None, **context):
+        """Render the template and return an iterator over chunks of
+        the output of ``chunk_size`` characters (the last may be
+        shorter), which are yielded while the template is rendered.
+
+        The template is rendered in a thread of
+        ``z3c.pt.threads.executor``; see ``z3c.pt.threads`` for the
+        state of the calling thread which it uses. This method returns
+        when the template starts to write its output (such that the
+        response headers are set before the first chunk is sent). The
+        output of an ``on-error`` statement is yielded once the
+        statement has completed, since its handler may discard it.
+        """
+
+        return streaming.iter_render(
+            self.render, chunk_size or self.stream_chunk_size, **context
+        )
+
+    async def render_async(self, **context):
+        """Render the template without blocking the event loop; see
+        ``run_async``."""
+
+        return await run_async(self.render, **context)
 
     def __call__(self, *args, **kwargs):
         bound_pt = self.bind(self)
@@ -222,18 +821,54 @@ class BaseTemplate(template.PageTemplate):
 
 class BaseTemplateFile(BaseTemplate, template.PageTemplateFile):
     """If ``filename`` is a relative path, the module path of the
-    class where the instance is used to get an absolute path."""
+    class where the instance is used to get an absolute path.
 
-    cache = {}
+    If ``lazy`` is set, only the filename and the globals of the caller
+    are recorded when the template is created; the path is resolved and
+    the template initialized when it is first used."""
+
+    # The cache of compiled templates (e.g. a ``TemplateCache``), or
+    # ``None``.
+    cache = template_cache
+
+    lazy = False
+
+    # If set, a ``z3c.pt.watch.TemplateWatcher`` which is used to
+    # detect changes of the file when ``auto_reload`` is enabled,
+    # instead of reading its modification time on each render.
+    watcher = None
+
+    _v_watched = None
+    _v_changed = False
+
+    _resolve_lock = threading.RLock()
 
     def __init__(self, filename, path=None, content_type=None, **kwargs):
+        file_templates.add(self)
+        self._cook_lock = threading.Lock()
+
         if path is not None:
             filename = os.path.join(path, filename)
 
+        caller_globals = None
         if not os.path.isabs(filename):
-            for depth in (1, 2):
-                frame = sys._getframe(depth)
-                package_name = frame.f_globals.get("__name__", None)
+            frame = sys._getframe(1)
+            caller_globals = (
+                frame.f_globals,
+                frame.f_back.f_globals if frame.f_back is not None else None,
+            )
+
+        if kwargs.pop("lazy", self.lazy):
+            self._unresolved = filename, caller_globals, content_type, kwargs
+            self.macros = Macros(self)
+        else:
+            self._initialize(filename, caller_globals, content_type, kwargs)
+
+    def _initialize(self, filename, caller_globals, content_type, kwargs):
+        if caller_globals is not None:
+            path = None
+            for f_globals in caller_globals:
+                package_name = f_globals.get("__name__", None)
                 if (
                     package_name is not None
                     and package_name != self.__module__
@@ -246,7 +881,7 @@ class BaseTemplateFile(BaseTemplate, template.PageTemplateFile):
                         path = path[: path.rfind(os.sep)]
                     break
                 else:
-                    package_path = frame.f_globals.get("__file__", None)
+                    package_path = f_globals.get("__file__", None)
                     if package_path is not None:
                         path = os.path.dirname(package_path)
                         break
@@ -255,11 +890,131 @@ class BaseTemplateFile(BaseTemplate, template.PageTemplateFile):
                 filename = os.path.join(path, filename)
 
         template.PageTemplateFile.__init__(self, filename, **kwargs)
+        self.macros = Macros(self)
 
         # Set content-type last, so that we can override whatever was
         # magically sniffed from the source template.
         self.content_type = content_type
 
+    def _resolve(self):
+        if "_unresolved" not in self.__dict__:
+            return
+
+        with self._resolve_lock:
+            unresolved = self.__dict__.get("_unresolved")
+            if unresolved is None:
+                # Either resolved by another thread or being resolved
+                # by this one.
+                return
+            self._unresolved = None
+            try:
+                self._initialize(*unresolved)
+            finally:
+                del self._unresolved
+
+    @property
+    def filename(self):
+        self._resolve()
+        return self.__dict__.get("filename")
+
+    @filename.setter
+    def filename(self, filename):
+        self.__dict__["filename"] = filename
+        self._v_last_read = None
+        self._cooked = False
+
+    def _cook_program(self, body, name, builtins):
+        cache = self.cache
+        if (
+            cache is None
+            or self.keep_source
+            or self._pretranslate_language is not None
+        ):
+            return super()._cook_program(body, name, builtins)
+
+        key = str(self.filename), self._compile_digest(body, builtins)
+        program = cache.get(key)
+        if program is None:
+            program = cache[key] = super()._cook_program(
+                body, name, builtins
+            )
+        return program
+
+    def cook_check(self):
+        self._resolve()
+        if self._cooked:
+            if not self.auto_reload:
+                return False
+            watcher = self.watcher
+            if (
+                watcher is not None
+                and self._v_watched is watcher
+                and not self._v_changed
+            ):
+                return False
+
+        # Only one thread (re)compiles the template; the others wait
+        # for it to complete.
+        with self._cook_lock:
+            watcher = self.watcher if self.auto_reload else None
+            if watcher is not None and (
+                self._v_watched not in (watcher, False) or self._v_changed
+            ):
+                # The file is watched before it is read, such that a
+                # change made while it is read is not missed. A
+                # replaced file may have the same modification time;
+                # the template is then reloaded regardless. If the
+                # file can not be watched, its modification time is
+                # read on each render.
+                if self._v_changed:
+                    self._v_changed = False
+                    self._v_last_read = None
+                if self.package_name is None and watcher.watch(
+                    self.filename, self
+                ):
+                    self._v_watched = watcher
+                else:
+                    self._v_watched = False
+            reload = self._cooked
+            cooked = super().cook_check()
+
+        if cooked and reload:
+            macro_dependencies.changed(str(self.filename))
+        return cooked
+
+    def render(self, **context):
+        self._resolve()
+        return super().render(**context)
+
+
+def preload_templates(freeze=True):
+    """Load (or compile) the file-based templates which have been
+    created, including lazy templates, e.g. in a server process before
+    it forks its workers.
+
+    If ``freeze`` is set, all objects are then moved to the permanent
+    generation of the garbage collector (see ``gc.freeze``), such that
+    the memory pages which hold them are not written to (and thus
+    copied) when the garbage collector runs in a worker.
+
+    Errors are logged; returns the number of templates loaded.
+    """
+
+    count = 0
+    for pt in list(file_templates):
+        try:
+            pt.cook_check()
+        except Exception:
+            log.exception("Unable to load template %r.", pt)
+        else:
+            count += 1
+
+    if freeze:
+        gc.collect()
+        gc.freeze()
+
+    return count
+
 
 class PageTemplate(BaseTemplate):
     """Page Templates using TAL, TALES, and METAL.
@@ -285,8 +1040,6 @@ class PageTemplateFile(BaseTemplateFile, PageTemplate):
 
     Initialize with a filename."""
 
-    cache = {}
-
 
 class ViewPageTemplate(PageTemplate):
     """Template class suitable for use with a Zope browser view; the
@@ -320,8 +1073,6 @@ class ViewPageTemplateFile(ViewPageTemplate, PageTemplateFile):
     """If ``filename`` is a relative path, the module path of the
     class where the instance is used to get an absolute path."""
 
-    cache = {}
-
 
 class BoundPageTemplate:
     """When a page template class is used as a property, it's bound to
@@ -344,6 +1095,20 @@ class BoundPageTemplate:
         kw.setdefault("args", args)
         return self.__func__(**kw)
 
+    async def render_async(self, *args, **kw):
+        """Render the template like ``__call__`` without blocking the
+        event loop; see ``run_async``."""
+
+        return await run_async(self, *args, **kw)
+
+    def stream(self, *args, chunk_size=None, **kw):
+        """Render the template like ``__call__`` and return an iterator
+        over chunks of the output; see ``BaseTemplate.render_iter``."""
+
+        return streaming.iter_render(
+            self, chunk_size or self.__self__.stream_chunk_size, *args, **kw
+        )
+
     def __setattr__(self, name, v):
         raise AttributeError("Can't set attribute", name)
 
@@ -0,0 +1,223 @@
+##############################################################################
+#
+# Copyright (c) 2007 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""Compile page templates ahead of time into the Chameleon cache.
+
+The compiled modules are written to the cache directory given by the
+``CHAMELEON_CACHE`` environment variable (or the ``--cache-dir``
+option); a process which uses the same cache directory then loads the
+templates instead of compiling them. Note that the cache key includes
+the absolute path of the template file and its class, such that the
+templates must be compiled at the location (and using the classes)
+they are used with.
+"""
+import argparse
+import concurrent.futures
+import importlib
+import importlib.util
+import os
+import sys
+import time
+
+from chameleon.config import CACHE_DIRECTORY
+
+from z3c.pt.cache import CompiledTemplateCache
+
+
+DEFAULT_TEMPLATE_CLASSES = (
+    "z3c.pt.pagetemplate.PageTemplateFile",
+    "z3c.pt.pagetemplate.ViewPageTemplateFile",
+)
+
+
+def resolve(name):
+    """Return the object with the given dotted name."""
+
+    module_name, attribute = name.rsplit(".", 1)
+    return getattr(importlib.import_module(module_name), attribute)
+
+
+def find_templates(locations, extensions=(".pt",)):
+    """Yield the absolute paths of the template files in the given
+    directories, files or packages (dotted names)."""
+
+    for location in locations:
+        if os.path.isfile(location):
+            yield os.path.abspath(location)
+            continue
+
+        if os.path.isdir(location):
+            directories = [location]
+        else:
+            spec = importlib.util.find_spec(location)
+            if spec is None or spec.submodule_search_locations is None:
+                raise ValueError("Not a directory or package: %s" % location)
+            directories = list(spec.submodule_search_locations)
+
+        for directory in directories:
+            for path, dirnames, filenames in os.walk(directory):
+                dirnames.sort()
+                for filename in sorted(filenames):
+                    if filename.endswith(tuple(extensions)):
+                        yield os.path.abspath(os.path.join(path, filename))
+
+
+def compile_template(filename, class_name, cache_dir, kwargs=None):
+    """Compile a template into ``cache_dir``; ``kwargs`` are passed on
+    to the template class.
+
+    Returns a tuple of the filename, class name, status (``compiled``,
+    ``cached`` or the error message) and duration in seconds.
+    """
+
+    start = time.perf_counter()
+    try:
+        template = resolve(class_name)(filename, **(kwargs or {}))
+        template.cache = None
+        cache = template.loader = CompiledTemplateCache(cache_dir)
+        template.cook_check()
+    except Exception as exc:
+        status = "error: {}: {}".format(type(exc).__name__, exc)
+    else:
+        status = "cached" if cache.hits else "compiled"
+    return filename, class_name, status, time.perf_counter() - start
+
+
+def precompile(
+    locations,
+    cache_dir=None,
+    template_classes=DEFAULT_TEMPLATE_CLASSES,
+    extensions=(".pt",),
+    jobs=1,
+):
+    """Compile the templates in ``locations`` into ``cache_dir`` (by
+    default, the Chameleon cache directory) using each of the template
+    classes (given by dotted name).
+
+    If ``jobs`` is greater than one, the templates are compiled in as
+    many worker processes. Returns an iterator over the results of
+    ``compile_template`` (in completion order).
+    """
+
+    cache_dir = cache_dir or CACHE_DIRECTORY
+    if not cache_dir:
+        raise ValueError("No cache directory (set CHAMELEON_CACHE).")
+
+    tasks = [
+        (filename, class_name, os.path.abspath(cache_dir))
+        for filename in find_templates(locations, extensions)
+        for class_name in template_classes
+    ]
+
+    if jobs <= 1:
+        for task in tasks:
+            yield compile_template(*task)
+        return
+
+    with concurrent.futures.ProcessPoolExecutor(jobs) as executor:
+        futures = [executor.submit(compile_template, *task) for task in tasks]
+        for future in concurrent.futures.as_completed(futures):
+            yield future.result()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="z3c-pt-compile",
+        description="Compile page templates into the Chameleon cache.",
+    )
+    parser.add_argument(
+        "locations",
+        nargs="+",
+        metavar="LOCATION",
+        help="directory, template file or package (dotted name)",
+    )
+    parser.add_argument(
+        "-d",
+        "--cache-dir",
+        default=CACHE_DIRECTORY,
+        help="cache directory (default: $CHAMELEON_CACHE)",
+    )
+    parser.add_argument(
+        "-c",
+        "--template-class",
+        action="append",
+        dest="template_classes",
+        metavar="DOTTED_NAME",
+        help="template class to compile with (may be repeated; "
+        "default: %s)" % ", ".join(DEFAULT_TEMPLATE_CLASSES),
+    )
+    parser.add_argument(
+        "-e",
+        "--extension",
+        action="append",
+        dest="extensions",
+        help="file extension of templates (may be repeated; default: .pt)",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="number of worker processes (default: 1)",
+    )
+    parser.add_argument(
+        "-q", "--quiet", action="store_true", help="only report errors"
+    )
+    args = parser.parse_args(argv)
+
+    if not args.cache_dir:
+        parser.error("no cache directory (use --cache-dir or CHAMELEON_CACHE)")
+
+    results = precompile(
+        args.locations,
+        cache_dir=args.cache_dir,
+        template_classes=args.template_classes or DEFAULT_TEMPLATE_CLASSES,
+        extensions=args.extensions or (".pt",),
+        jobs=args.jobs,
+    )
+
+    counts = {}
+    total = 0.0
+    errors = 0
+    for filename, class_name, status, duration in results:
+        total += duration
+        if status.startswith("error"):
+            errors += 1
+            key = "error"
+        else:
+            key = status
+        counts[key] = counts.get(key, 0) + 1
+        if key == "error" or not args.quiet:
+            print(
+                "%8.3fs  %s (%s)  %s"
+                % (duration, filename, class_name.rsplit(".")[-1], status)
+            )
+
+    if not args.quiet:
+        print(
+            "%d templates (%s) in %.3fs"
+            % (
+                sum(counts.values()),
+                ", ".join(
+                    "%d %s" % (count, key)
+                    for key, count in sorted(counts.items())
+                ),
+                total,
+            )
+        )
+
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":  # pragma: no cover
+    sys.exit(main())
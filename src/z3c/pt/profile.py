@@ -0,0 +1,174 @@
+##############################################################################
+#
+# Copyright (c) 2007 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""Profile the evaluation of the expressions of templates.
+
+A template which is compiled with ``profile_expressions`` set times the
+evaluation of each of its expressions and records it in
+``expression_profile``, per filename, line and expression.
+"""
+import ast
+import collections
+import functools
+import itertools
+import threading
+import time
+
+from chameleon.astutil import Symbol
+from chameleon.codegen import template
+
+
+# Expression types which only transform the value of another
+# expression; the other expression is profiled instead.
+WRAPPER_TYPES = frozenset(("not", "structure"))
+
+
+ProfileEntry = collections.namedtuple(
+    "ProfileEntry", "filename line expression calls time errors"
+)
+
+
+class ExpressionProfile:
+    """The number of evaluations, total time (in seconds) and number of
+    errors per expression.
+
+    Note that the time of an expression includes that of the
+    expressions it contains (e.g. an interpolation in a string
+    expression).
+    """
+
+    def __init__(self):
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def record(self, key, duration, error):
+        with self._lock:
+            entry = self._stats.get(key)
+            if entry is None:
+                entry = self._stats[key] = [0, 0.0, 0]
+            entry[0] += 1
+            entry[1] += duration
+            entry[2] += error
+
+    def report(self, sort="time", limit=None):
+        """Return a list of ``ProfileEntry`` tuples, sorted by
+        ``sort`` (``time``, ``calls``, ``errors`` or ``average``) in
+        descending order."""
+
+        with self._lock:
+            entries = [
+                ProfileEntry(*key, *stats)
+                for key, stats in self._stats.items()
+            ]
+
+        if sort == "average":
+            def sort_key(entry):
+                return entry.time / entry.calls
+        else:
+            def sort_key(entry):
+                return getattr(entry, sort)
+
+        entries.sort(key=sort_key, reverse=True)
+        return entries[:limit]
+
+    def format(self, sort="time", limit=20):
+        """Return the report as a table."""
+
+        lines = ["%10s %8s %8s %10s  %s" % (
+            "time (ms)", "calls", "errors", "avg (us)", "expression")]
+        for entry in self.report(sort, limit):
+            lines.append(
+                "%10.3f %8d %8d %10.2f  %s:%s  %s"
+                % (
+                    entry.time * 1000,
+                    entry.calls,
+                    entry.errors,
+                    entry.time / entry.calls * 1e6,
+                    entry.filename,
+                    entry.line,
+                    entry.expression,
+                )
+            )
+        return "\n".join(lines)
+
+    def clear(self):
+        with self._lock:
+            self._stats.clear()
+
+
+expression_profile = ExpressionProfile()
+
+
+def record(key, duration, error):
+    expression_profile.record(key, duration, error)
+
+
+_names = itertools.count()
+
+
+class ProfiledExpr:
+    """Expression compiler which times the evaluation of the expression
+    compiled by ``factory``."""
+
+    def __init__(self, factory, name, expression):
+        self.expression = factory(expression)
+        self.key = (
+            expression.filename,
+            expression.location[0],
+            "{}:{}".format(name, expression.strip()),
+        )
+
+    def __call__(self, target, engine):
+        body = self.expression(target, engine)
+        start = "__profile_start_%d" % next(_names)
+        error = "__profile_error_%d" % next(_names)
+        stmts = template(
+            """
+            START = clock()
+            ERROR = True
+            try:
+                pass
+            finally:
+                record(KEY, clock() - START, ERROR)
+            """,
+            START=start,
+            ERROR=error,
+            KEY=ast.Constant(self.key),
+            clock=Symbol(time.perf_counter),
+            record=Symbol(record),
+        )
+        stmts[-1].body = body + template("ERROR = False", ERROR=error)
+        return stmts
+
+
+def _profiled(factory, name, expression):
+    # Expressions which are not in the source of the template (e.g.
+    # the path expression of an ``exists:`` expression) have no
+    # location; they are profiled as part of the outer expression.
+    if getattr(expression, "location", None) is None:
+        return factory(expression)
+    return ProfiledExpr(factory, name, expression)
+
+
+def profiled_expression_types(expression_types):
+    """Return the expression types with each type (except wrapper
+    types) wrapped by ``ProfiledExpr``."""
+
+    return {
+        name: (
+            factory
+            if name in WRAPPER_TYPES
+            else functools.partial(_profiled, factory, name)
+        )
+        for name, factory in expression_types.items()
+    }
@@ -0,0 +1,181 @@
+##############################################################################
+#
+# Copyright (c) 2007 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+import hashlib
+
+from chameleon import nodes
+from chameleon.astutil import Node
+from chameleon.exc import LanguageError
+from chameleon.namespaces import I18N_NS as I18N
+from chameleon.namespaces import METAL_NS as METAL
+from chameleon.namespaces import TAL_NS as TAL
+from chameleon.tal import parse_defines
+from chameleon.zpt import program
+from chameleon.zpt.program import convert_data_attributes
+from chameleon.zpt.program import validate_attributes
+
+
+CACHE_NS = "http://xml.zope.org/namespaces/cache"
+
+CACHE_WHITELIST = frozenset(("key", "ttl"))
+
+
+class CacheFragment(Node):
+    """The output of ``node`` is cached under the fragment ``id`` and
+    the value of the ``key`` expression (or ``None``, for a static key)
+    for ``ttl`` seconds (or ``None``, until it is evicted). The fragment
+    is part of the template file ``filename``."""
+
+    _fields = "id", "filename", "key", "ttl", "node"
+
+
+def _is_statement(node, condition):
+    """Return whether ``node`` is one of the nodes of the ``on-error``,
+    ``define``, ``case``, ``condition`` and ``repeat`` statements of an
+    element (whose ``tal:condition`` clause is ``condition``)."""
+
+    if isinstance(node, (nodes.OnError, nodes.Cancel, nodes.Repeat)):
+        return True
+    if isinstance(node, nodes.Define):
+        # The definitions of the element begin with ``attrs``; those of
+        # a ``tal:case`` define ``default`` for its condition.
+        first = node.assignments[0]
+        return (
+            isinstance(first, nodes.Alias) and first.names == ["attrs"]
+        ) or (
+            isinstance(node.node, nodes.Condition)
+            and isinstance(node.node.node, nodes.Cancel)
+        )
+    if isinstance(node, nodes.Condition):
+        return (
+            isinstance(node.expression, nodes.Value)
+            and node.expression.value is condition
+        ) or isinstance(node.node, nodes.Cancel)
+    return False
+
+
+def _innermost_statement(node, condition):
+    """Return the innermost node of the statements of the element whose
+    node is ``node``; see ``_is_statement``. Since ``tal:define``
+    always defines ``attrs``, there is at least one."""
+
+    parent = None
+    while _is_statement(node, condition):
+        parent, node = node, node.node
+    return parent
+
+
+class MacroProgram(program.MacroProgram):
+    """Program which supports the ``cache`` namespace.
+
+    The output of an element which has a ``cache:key`` or ``cache:ttl``
+    attribute is cached; see ``z3c.pt.fragments``. Its ``tal:on-error``,
+    ``tal:define``, ``tal:case``, ``tal:condition`` and ``tal:repeat``
+    statements are evaluated before the key (and thus on each render).
+    Since the elements within a fragment are not rendered when it is
+    cached, they must not define global variables.
+    """
+
+    DEFAULT_NAMESPACES = dict(
+        program.MacroProgram.DEFAULT_NAMESPACES, cache=CACHE_NS
+    )
+
+    DROP_NS = program.MacroProgram.DROP_NS + (CACHE_NS,)
+
+    # The number of fragments which the visited element is part of.
+    _fragments = 0
+
+    def visit_element(self, start, end, children):
+        ns = start["ns_attrs"]
+
+        # Data attributes (e.g. ``data-cache-key``) are converted into
+        # namespace attributes (again) when the element is visited.
+        if self.enable_data_attributes:
+            convert_data_attributes(
+                ns, list(start["attrs"]), start["ns_map"]
+            )
+        if self._fragments:
+            self._check_global(ns)
+
+        cached = any(prefix == CACHE_NS for prefix, name in ns)
+        self._fragments += cached
+        try:
+            node = super().visit_element(start, end, children)
+        finally:
+            self._fragments -= cached
+
+        validate_attributes(ns, CACHE_NS, CACHE_WHITELIST)
+        key = ns.get((CACHE_NS, "key"))
+        ttl = ns.get((CACHE_NS, "ttl"))
+        if key is None and ttl is None:
+            return node
+
+        token = key if key is not None else ttl
+        for name in ("define-macro", "define-slot", "fill-slot"):
+            if (METAL, name) in ns:
+                raise LanguageError(
+                    "Can't cache the output of metal:%s." % name, token
+                )
+        if (I18N, "name") in ns:
+            raise LanguageError(
+                "Can't cache the output of i18n:name.", token
+            )
+
+        if ttl is not None and ttl.strip():
+            try:
+                ttl = float(ttl)
+            except ValueError:
+                raise LanguageError(
+                    "The cache:ttl must be a number of seconds.", ttl
+                )
+        else:
+            ttl = None
+
+        if key is not None and key.strip():
+            key = nodes.Value(key)
+        else:
+            key = None
+
+        # The fragment is identified by its position in the template
+        # and a digest of the source; a changed template does not
+        # render fragments which were cached before the change.
+        source = token.source or ""
+        line, column = token.location
+        fragment_id = "{}:{}:{}:{}".format(
+            token.filename,
+            line,
+            column,
+            hashlib.sha256(source.encode("utf-8")).hexdigest()[:16],
+        )
+
+        # The key may use the variables which the statements that are
+        # evaluated before it define; the fragment is the body of the
+        # innermost of them.
+        parent = _innermost_statement(node, ns.get((TAL, "condition")))
+        parent.node = CacheFragment(
+            fragment_id, token.filename, key, ttl, parent.node
+        )
+        return node
+
+    def _check_global(self, ns):
+        for name in ("define", "repeat"):
+            clause = ns.get((TAL, name))
+            if clause is None:
+                continue
+            for context, names, expr in parse_defines(clause) or ():
+                if context == "global":
+                    raise LanguageError(
+                        "Can't define a global variable within a cached "
+                        "fragment.",
+                        clause,
+                    )
@@ -0,0 +1,204 @@
+##############################################################################
+#
+# Copyright (c) 2007 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""Stream the output of a template while it is rendered.
+
+The template is rendered in a thread of ``z3c.pt.threads.executor``
+into an ``OutputStream``, which passes the output on in chunks as soon
+as it has been written; see ``iter_render``. Which state of the
+calling thread the render uses is described in ``z3c.pt.threads``.
+"""
+import contextvars
+import queue
+import threading
+
+from z3c.pt import threads
+from z3c.pt.expressions import in_calling_context
+
+
+# The stream which the next template render (in this context) writes
+# its output to; see ``BaseTemplate.output_stream_factory``.
+output_stream = contextvars.ContextVar("output_stream", default=None)
+
+# The number of chunks which are queued before the render waits for
+# them to be consumed.
+QUEUE_SIZE = 4
+
+_done = object()
+
+
+class RenderAborted(BaseException):
+    """The iterator over the output of a render was closed."""
+
+
+class OutputStream(list):
+    """Output stream which calls ``emit`` with each chunk of ``size``
+    characters as soon as it has been written.
+
+    Output which may be discarded (by an ``on-error`` handler) is held
+    until the statement has completed; see ``hold`` and ``release``.
+    The items which remain in the list when the render has completed
+    are those which have not been emitted.
+
+    Once ``closed`` is set, writing to the stream aborts the render.
+    """
+
+    def __init__(self, emit, size, closed=None):
+        super().__init__()
+        self.emit = emit
+        self.size = size
+        self.closed = closed
+        self.held = 0
+        self.started = threading.Event()
+        self._pending = 0
+        self._emitted = 0
+
+    def __len__(self):
+        return self._emitted + super().__len__()
+
+    def __delitem__(self, key):
+        # The output written since a position, which is never emitted
+        # while it is held.
+        start = key.start - self._emitted
+        if start < 0:
+            raise RuntimeError("The output has already been emitted.")
+        super().__delitem__(slice(start, None))
+        self._pending = sum(map(len, self))
+
+    def append(self, value):
+        if self.closed is not None and self.closed.is_set():
+            raise RenderAborted()
+        super().append(value)
+        self._pending += len(value)
+        if self._pending >= self.size and not self.held:
+            self.flush()
+
+    def flush(self):
+        items = super().__len__()
+        text = "".join(self)
+        end = len(text) - len(text) % self.size
+        for i in range(0, end, self.size):
+            self.emit(text[i:i + self.size])
+
+        # The rest is kept as a single item.
+        super().__delitem__(slice(None))
+        self._emitted += items
+        if end < len(text):
+            super().append(text[end:])
+            self._emitted -= 1
+        self._pending = len(text) - end
+
+
+def hold(stream):
+    if isinstance(stream, OutputStream):
+        stream.held += 1
+
+
+def release(stream):
+    if isinstance(stream, OutputStream):
+        stream.held -= 1
+
+
+def render_into(stream, render, **context):
+    """Call ``render``, a template's render method, which writes its
+    output to ``stream``."""
+
+    output_stream.set(stream)
+    return render(**context)
+
+
+def iter_chunks(string, size):
+    return (string[i:i + size] for i in range(0, len(string), size))
+
+
+def _render(func, args, kwargs, stream, chunks, closed):
+    def put(item):
+        while not closed.is_set():
+            try:
+                chunks.put(item, timeout=0.1)
+            except queue.Full:
+                continue
+            return
+        raise RenderAborted()
+
+    stream.emit = lambda chunk: put((chunk, None))
+    output_stream.set(stream)
+    try:
+        rest = func(*args, **kwargs)
+        for chunk in iter_chunks(rest, stream.size):
+            put((chunk, None))
+        put((_done, None))
+    except RenderAborted:
+        pass
+    except BaseException as exc:
+        try:
+            put((None, exc))
+        except RenderAborted:
+            pass
+    finally:
+        stream.started.set()
+
+
+class ChunkIterator:
+    """Iterator over the chunks of the output of a render; closing it
+    (or dropping it) aborts the render."""
+
+    def __init__(self, func, size, args, kwargs):
+        self._chunks = queue.Queue(QUEUE_SIZE)
+        self._closed = threading.Event()
+        stream = OutputStream(None, size, self._closed)
+
+        # The render does not refer to the iterator, which may thus be
+        # dropped while it runs.
+        self.future = threads.executor.submit(
+            in_calling_context(_render),
+            func, args, kwargs, stream, self._chunks, self._closed,
+        )
+        stream.started.wait()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._closed.is_set():
+            raise StopIteration
+        chunk, exc = self._chunks.get()
+        if exc is not None:
+            self.close()
+            raise exc
+        if chunk is _done:
+            self.close()
+            raise StopIteration
+        return chunk
+
+    def close(self):
+        self._closed.set()
+
+    def __del__(self):
+        self.close()
+
+
+def iter_render(func, size, *args, **kwargs):
+    """Call ``func`` with ``args`` and ``kwargs`` in a thread of
+    ``z3c.pt.threads.executor`` (with the context variables, site and
+    security interaction of the calling thread) and return an iterator
+    over the chunks of ``size`` characters (the last may be shorter)
+    of the output of the template which it renders, once the template
+    starts to write its output.
+
+    The output of the first template which is rendered by ``func`` is
+    streamed; ``func`` must return what remains of it. Closing (or
+    dropping) the iterator aborts the render when it next writes.
+    """
+
+    return ChunkIterator(func, size, args, kwargs)
@@ -0,0 +1,233 @@
+"""
+Tests for cache.py
+
+"""
+import concurrent.futures
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from zope.testing.cleanup import CleanUp
+
+from z3c.pt import cache
+from z3c.pt import expressions
+from z3c.pt import pagetemplate
+from z3c.pt import precompile
+
+
+class TestLRUCache(unittest.TestCase):
+    def test_get_refreshes_entry(self):
+        lru = cache.LRUCache(2)
+        lru["a"] = 1
+        lru["b"] = 2
+        self.assertEqual(lru.get("a"), 1)
+        lru["c"] = 3
+        self.assertIn("a", lru)
+        self.assertNotIn("b", lru)
+        self.assertEqual(len(lru), 2)
+
+    def test_stats(self):
+        lru = cache.LRUCache(1)
+        self.assertIsNone(lru.get("a"))
+        lru["a"] = 1
+        lru["b"] = 2
+        self.assertEqual(lru.get("b"), 2)
+        self.assertEqual(
+            lru.stats(),
+            {"hits": 1, "misses": 1, "evictions": 1, "size": 1, "maxsize": 1},
+        )
+
+    def test_clear(self):
+        lru = cache.LRUCache()
+        lru["a"] = 1
+        lru.clear()
+        self.assertEqual(len(lru), 0)
+
+
+class TestTemplateCache(unittest.TestCase):
+    def test_maxbytes(self):
+        templates = cache.TemplateCache(maxbytes=10, sizeof=len)
+        templates["a"] = "aaaa"
+        templates["b"] = "bbbb"
+        self.assertEqual(templates.get("a"), "aaaa")
+        templates["c"] = "cccc"
+        self.assertIsNone(templates.get("b"))
+        self.assertEqual(
+            templates.stats(),
+            {
+                "hits": 1,
+                "misses": 1,
+                "evictions": 1,
+                "size": 2,
+                "maxsize": 1000,
+                "bytes": 8,
+                "maxbytes": 10,
+            },
+        )
+
+        # An entry which exceeds the limit is kept on its own.
+        templates["d"] = "d" * 20
+        self.assertEqual(len(templates), 1)
+        self.assertEqual(templates.stats()["bytes"], 20)
+
+    def test_replace(self):
+        templates = cache.TemplateCache(sizeof=len)
+        templates["a"] = "aaaa"
+        templates["a"] = "aa"
+        self.assertEqual(templates.stats()["bytes"], 2)
+        templates.clear()
+        self.assertEqual(templates.stats()["bytes"], 0)
+
+    def test_program_size(self):
+        template = pagetemplate.PageTemplate("<p>${options/name}</p>")
+        template.cook_check()
+        program = template._cook(
+            "<p>${options/name}</p>", "digest", sorted(template.builtins)
+        )
+        self.assertGreater(cache.program_size(program), 1000)
+
+
+class TestClearOnRegistryChange(CleanUp, unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.lru = cache.clear_on_registry_change(cache.LRUCache())
+        self.lru["a"] = 1
+
+    def tearDown(self):
+        cache._registry_caches.remove(self.lru)
+        super().tearDown()
+
+    def test_registration_clears(self):
+        from zope import component
+        from zope import interface
+
+        class IFoo(interface.Interface):
+            pass
+
+        component.getGlobalSiteManager().registerUtility(
+            object(), IFoo, "foo"
+        )
+        self.assertEqual(len(self.lru), 0)
+
+    def test_other_events_are_ignored(self):
+        import zope.event
+
+        zope.event.notify(object())
+        self.assertEqual(len(self.lru), 1)
+
+
+class TestCompiledTemplateCache(unittest.TestCase):
+    def setUp(self):
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        self.cache_dir = os.path.join(path, "cache")
+        self.filename = os.path.join(path, "template.pt")
+        with open(self.filename, "w") as f:
+            f.write("<p>${options/name}</p>")
+
+    def _render(self, cls=pagetemplate.PageTemplateFile):
+        template = cls(self.filename)
+        template.cache = None
+        template.loader = loader = cache.CompiledTemplateCache(self.cache_dir)
+        self.assertEqual(template(name="Bob"), "<p>Bob</p>")
+        return loader.stats()
+
+    def _modules(self):
+        return [
+            filename
+            for filename in os.listdir(self.cache_dir)
+            if filename.endswith(".py")
+        ]
+
+    def test_hit(self):
+        self.assertEqual(
+            self._render(), {"hits": 0, "misses": 1, "stale": 0}
+        )
+        self.assertEqual(
+            self._render(), {"hits": 1, "misses": 0, "stale": 0}
+        )
+        self.assertEqual(len(self._modules()), 1)
+
+    def test_key_includes_expression_types(self):
+        class Template(pagetemplate.PageTemplateFile):
+            pass
+
+        self._render(Template)
+        self.assertEqual(self._render(Template)["hits"], 1)
+        Template.expression_types = dict(
+            Template.expression_types, inline=expressions.InlinePathExpr
+        )
+        self.assertEqual(self._render(Template)["misses"], 1)
+
+    def test_key_includes_partial_expression_types(self):
+        import functools
+
+        class Template(pagetemplate.PageTemplateFile):
+            expression_types = dict(
+                pagetemplate.PageTemplateFile.expression_types,
+                inline=functools.partial(expressions.InlinePathExpr),
+            )
+
+        self.assertEqual(self._render(Template)["misses"], 1)
+        self.assertEqual(self._render(Template)["hits"], 1)
+
+    def test_key_is_stable(self):
+        import functools
+
+        class Factory:
+            def __call__(self, expression):
+                return expressions.InlinePathExpr(expression)
+
+        def make(factory):
+            template = pagetemplate.PageTemplate("<p />")
+            template.expression_types = dict(
+                template.expression_types,
+                inline=functools.partial(factory, Factory()),
+            )
+            return template._compile_digest("<p />", ())
+
+        # The key does not depend on the identity (the address) of the
+        # factory.
+        self.assertEqual(make(lambda f, e: f(e)), make(lambda f, e: f(e)))
+
+    def test_key_includes_settings(self):
+        class Template(pagetemplate.PageTemplateFile):
+            pass
+
+        self._render(Template)
+        Template.literal_false = False
+        self.assertEqual(self._render(Template)["misses"], 1)
+        Template.literal_false = True
+        self.assertEqual(self._render(Template)["hits"], 1)
+
+    def test_stale(self):
+        self._render()
+        (filename,) = self._modules()
+        with open(os.path.join(self.cache_dir, filename), "w") as f:
+            f.write("initialize = (")
+        shutil.rmtree(os.path.join(self.cache_dir, "__pycache__"))
+        sys.modules.pop(os.path.splitext(filename)[0])
+
+        self.assertEqual(
+            self._render(), {"hits": 0, "misses": 0, "stale": 1}
+        )
+        self.assertEqual(self._render()["hits"], 1)
+
+    def test_concurrent_writers(self):
+        os.mkdir(self.cache_dir)
+        with concurrent.futures.ProcessPoolExecutor(4) as executor:
+            futures = [
+                executor.submit(
+                    precompile.compile_template,
+                    self.filename,
+                    "z3c.pt.pagetemplate.PageTemplateFile",
+                    self.cache_dir,
+                )
+                for i in range(8)
+            ]
+            statuses = {future.result()[2] for future in futures}
+        self.assertLessEqual(statuses, {"compiled", "cached"})
+        self.assertEqual(len(self._modules()), 1)
+        self.assertEqual(self._render()["hits"], 1)
@@ -38,6 +38,14 @@ def test_suite():
                 tearDown=zope.component.testing.tearDown,
                 package="z3c.pt",
             ),
+            doctest.DocTestSuite(
+                "z3c.pt.cache",
+                optionflags=OPTIONFLAGS,
+            ),
+            doctest.DocTestSuite(
+                "z3c.pt.dependencies",
+                optionflags=OPTIONFLAGS,
+            ),
             doctest.DocTestSuite(
                 "z3c.pt.expressions",
                 optionflags=OPTIONFLAGS,
@@ -63,6 +63,161 @@ class TestRenderContentProvider(CleanUp, unittest.TestCase):
 
         self.assertEqual(attrs, {"__name__": "a provider"})
 
+    def test_factory_cache(self):
+        from zope import component
+        from zope import interface
+        from zope.contentprovider.interfaces import ContentProviderLookupError
+        from zope.contentprovider.interfaces import IContentProvider
+
+        @interface.implementer(IContentProvider)
+        class Provider:
+            def __init__(self, *args):
+                pass
+
+            def update(self):
+                pass
+
+            def render(self):
+                return "rendered"
+
+        component.getGlobalSiteManager().registerAdapter(
+            Provider, (object, object, object), IContentProvider, "cached"
+        )
+        econtext = {"context": 1, "request": 2, "view": 3}
+        factories = expressions.provider_factories
+        hits, misses = factories.hits, factories.misses
+
+        for i in range(3):
+            self.assertEqual(
+                expressions.render_content_provider(econtext, "cached"),
+                "rendered",
+            )
+        for i in range(2):
+            with self.assertRaises(ContentProviderLookupError):
+                expressions.render_content_provider(econtext, "missing")
+
+        # The factory (or its absence) is looked up once.
+        self.assertEqual(
+            (factories.hits - hits, factories.misses - misses), (3, 2)
+        )
+
+    def test_registration_without_event(self):
+        from zope import component
+        from zope import interface
+        from zope.contentprovider.interfaces import IContentProvider
+
+        def provider(output):
+            @interface.implementer(IContentProvider)
+            class Provider:
+                def __init__(self, *args):
+                    pass
+
+                def update(self):
+                    pass
+
+                def render(self):
+                    return output
+
+            return Provider
+
+        econtext = {"context": 1, "request": 2, "view": 3}
+        for output in ("first", "second"):
+            # ``provideAdapter`` registers the adapter without an event.
+            component.provideAdapter(
+                provider(output),
+                adapts=(object, object, object),
+                provides=IContentProvider,
+                name="replaced",
+            )
+            self.assertEqual(
+                expressions.render_content_provider(econtext, "replaced"),
+                output,
+            )
+
+    def test_registration_invalidates(self):
+        from zope import component
+        from zope import interface
+        from zope.contentprovider.interfaces import ContentProviderLookupError
+        from zope.contentprovider.interfaces import IContentProvider
+
+        econtext = {"context": 1, "request": 2, "view": 3}
+        with self.assertRaises(ContentProviderLookupError):
+            expressions.render_content_provider(econtext, "late")
+
+        @interface.implementer(IContentProvider)
+        class Provider:
+            def __init__(self, *args):
+                pass
+
+            update = render = lambda s: "late"
+
+        component.getGlobalSiteManager().registerAdapter(
+            Provider, (object, object, object), IContentProvider, "late"
+        )
+        self.assertEqual(
+            expressions.render_content_provider(econtext, "late"), "late"
+        )
+
+    def test_factory_returning_none(self):
+        from zope import component
+        from zope.contentprovider.interfaces import ContentProviderLookupError
+        from zope.contentprovider.interfaces import IContentProvider
+
+        component.provideAdapter(
+            lambda *args: None,
+            adapts=(object, object, object),
+            provides=IContentProvider,
+            name="none",
+        )
+        econtext = {"context": 1, "request": 2, "view": 3}
+        with self.assertRaises(ContentProviderLookupError):
+            expressions.render_content_provider(econtext, "none")
+
+    def test_cached_output(self):
+        from zope import component
+        from zope import interface
+
+        from z3c.pt.interfaces import ICachedContentProvider
+
+        log = []
+
+        @interface.implementer(ICachedContentProvider)
+        class Provider:
+            def __init__(self, context, request, view):
+                self.context = context
+
+            def cache_key(self):
+                return self.context
+
+            def update(self):
+                log.append("update")
+
+            def render(self):
+                log.append("render")
+                return "<p>%s</p>" % self.context
+
+        component.provideAdapter(
+            Provider,
+            adapts=(object, object, object),
+            provides=ICachedContentProvider,
+            name="portlet",
+        )
+
+        for context in (1, 1, 2, None, None):
+            econtext = {"context": context, "request": 2, "view": 3}
+            self.assertEqual(
+                expressions.render_content_provider(econtext, "portlet"),
+                "<p>%s</p>" % context,
+            )
+
+        # The output is cached per key (unless it is ``None``); the
+        # provider is not updated when it is cached.
+        self.assertEqual(log, ["update", "render"] * 4)
+        self.assertEqual(
+            expressions.provider_outputs.provider_stats()["portlet"],
+            {"hits": 1, "misses": 2},
+        )
+
 
 class TestPathExpr(CleanUp, unittest.TestCase):
     def test_translate_empty_string(self):
@@ -120,3 +275,364 @@ class TestPathExpr(CleanUp, unittest.TestCase):
 
         # Multiple interpolations
         self.assertEqual(evaluate("a/?t1/?t2", t1='b', t2='c'), Context('c'))
+
+
+class Container:
+    def __init__(self, **items):
+        self.items = items
+
+    def __getitem__(self, name):
+        return self.items[name]
+
+
+class TestTraverseElement(CleanUp, unittest.TestCase):
+    def setUp(self):
+        from zope import component
+        from zope.traversing.adapters import DefaultTraversable
+        from zope.traversing.interfaces import ITraversable
+
+        super().setUp()
+        component.provideAdapter(DefaultTraversable, (None,), ITraversable)
+
+    def test_default_traversable(self):
+        from unittest import mock
+
+        # The item is looked up directly.
+        with mock.patch.object(expressions, "traversePathElement") as tpe:
+            self.assertEqual(
+                expressions.traverse_element(Container(a=2), "a", [], None),
+                2,
+            )
+        tpe.assert_not_called()
+
+    def test_default_traversable_attribute(self):
+        # The methods of a dictionary are not found by the item lookup
+        # which precedes the traversal.
+        self.assertEqual(
+            expressions.traverse_element({"a": 1}, "keys", [], None)(),
+            {"a": 1}.keys(),
+        )
+        from z3c.pt.pagetemplate import PageTemplate
+
+        template = PageTemplate(
+            "<p>${python: list(path('options/d/keys'))}</p>"
+        )
+        self.assertEqual(template(d={"a": 1}), "<p>['a']</p>")
+
+    def test_plans(self):
+        expressions.traversal_plans.clear()
+        stats = expressions.traversal_plans.stats()
+        for i in range(3):
+            expressions.traverse_element(Container(a=i), "a", [], None)
+        self.assertEqual(
+            (
+                expressions.traversal_plans.hits - stats["hits"],
+                expressions.traversal_plans.misses - stats["misses"],
+            ),
+            (2, 1),
+        )
+
+    def test_default_traversable_missing(self):
+        from zope.location.interfaces import LocationError
+
+        with self.assertRaises(LocationError):
+            expressions.traverse_element(Container(), "a", [], None)
+
+    def test_adapter(self):
+        from zope import component
+        from zope import interface
+        from zope.traversing.interfaces import ITraversable
+
+        class Context:
+            pass
+
+        @interface.implementer(ITraversable)
+        class Traversable:
+            def __init__(self, context):
+                self.context = context
+
+            def traverse(self, name, furtherPath):
+                return name.upper()
+
+        component.provideAdapter(Traversable, (Context,), ITraversable)
+        self.assertEqual(
+            expressions.traverse_element(Context(), "a", [], None), "A"
+        )
+
+    def test_traversable_object(self):
+        from zope import interface
+        from zope.traversing.interfaces import ITraversable
+
+        @interface.implementer(ITraversable)
+        class Traversable:
+            def traverse(self, name, furtherPath):
+                return "traversed"
+
+        container = Container(a=1)
+        interface.alsoProvides(container, ITraversable)
+        container.traverse = Traversable().traverse
+        self.assertEqual(
+            expressions.traverse_element(container, "a", [], None),
+            "traversed",
+        )
+
+    def test_registration_without_event(self):
+        from zope import component
+        from zope import interface
+        from zope.traversing.interfaces import ITraversable
+
+        @interface.implementer(ITraversable)
+        class Traversable:
+            def __init__(self, context):
+                pass
+
+            def traverse(self, name, furtherPath):
+                return "adapted"
+
+        self.assertEqual(
+            expressions.traverse_element(Container(a=1), "a", [], None), 1
+        )
+
+        # ``provideAdapter`` registers the adapter without an event.
+        component.provideAdapter(Traversable, (Container,), ITraversable)
+        self.assertEqual(
+            expressions.traverse_element(Container(a=1), "a", [], None),
+            "adapted",
+        )
+
+
+class TestInlinePathExpr(CleanUp, unittest.TestCase):
+    def _makeEvaluator(self, **builtins):
+        from chameleon.compiler import ExpressionEngine
+        from chameleon.compiler import ExpressionEvaluator
+        from chameleon.tales import ExpressionParser
+        from chameleon.utils import Scope
+
+        parser = ExpressionParser(
+            {
+                'path': expressions.InlinePathExpr,
+                'nocall': expressions.InlineNocallExpr,
+            },
+            'path'
+        )
+        engine = functools.partial(ExpressionEngine, parser)
+        builtins.setdefault('nothing', None)
+        evaluator = ExpressionEvaluator(engine, builtins)
+
+        def evaluate(expression, **context):
+            return evaluator(Scope(context), {}, 'path', expression)
+
+        return evaluate
+
+    def test_attribute_and_dict_lookups(self):
+        class Context:
+            items = {'title': 'Hello'}
+
+            def method(self):
+                return 'called'
+
+        evaluate = self._makeEvaluator()
+        context = Context()
+        self.assertIs(evaluate("context", context=context), context)
+        self.assertEqual(evaluate("context/items/title", context=context),
+                         'Hello')
+        self.assertEqual(evaluate("context/method", context=context),
+                         'called')
+        self.assertEqual(evaluate("nocall:context/method", context=context),
+                         context.method)
+
+    def test_hits_do_not_call_traverser(self):
+        from unittest import mock
+
+        class Context:
+            title = 'Hello'
+
+        evaluate = self._makeEvaluator()
+        with mock.patch.object(expressions, 'traversePathElement') as tpe:
+            self.assertEqual(evaluate("context/title", context=Context()),
+                             'Hello')
+        tpe.assert_not_called()
+
+    def test_miss_falls_back_to_traversal(self):
+        from zope.interface import classImplements
+        from zope.traversing.interfaces import ITraversable
+
+        class Context(str):
+            def traverse(self, name, rest):
+                # The remaining path is passed on to the traversable,
+                # which consumes it.
+                names = [name]
+                while rest:
+                    names.append(rest.pop())
+                return Context('/'.join(names))
+
+        classImplements(Context, ITraversable)
+
+        class Root:
+            child = Context('child')
+
+        evaluate = self._makeEvaluator()
+        self.assertEqual(evaluate("root/child/a", root=Root()), 'a')
+        self.assertEqual(evaluate("root/child/?t1/c", root=Root(), t1='b'),
+                         'b/c')
+
+    def test_miss_raises(self):
+        from zope.location.interfaces import LocationError
+
+        evaluate = self._makeEvaluator()
+        with self.assertRaises(LocationError):
+            evaluate("context/missing", context=object())
+
+    def test_template(self):
+        from z3c.pt.pagetemplate import PageTemplate
+
+        class InlinePageTemplate(PageTemplate):
+            expression_types = dict(
+                PageTemplate.expression_types,
+                path=expressions.InlinePathExpr,
+                nocall=expressions.InlineNocallExpr,
+            )
+
+        template = InlinePageTemplate(
+            '<div tal:content="options/a/b | string:missing" />'
+        )
+        self.assertEqual(template(a={'b': 'ok'}), "<div>ok</div>")
+        self.assertEqual(template(a={}), "<div>missing</div>")
+
+
+class TestTraversalStats(CleanUp, unittest.TestCase):
+    def setUp(self):
+        from zope import component
+        from zope.traversing.adapters import DefaultTraversable
+        from zope.traversing.interfaces import ITraversable
+
+        super().setUp()
+        component.provideAdapter(DefaultTraversable, (None,), ITraversable)
+        expressions.traversal_stats.clear()
+        self.addCleanup(expressions.traversal_stats.clear)
+
+    def test_template(self):
+        from z3c.pt.pagetemplate import PageTemplate
+
+        template = PageTemplate(
+            '<p tal:repeat="i python: range(2)">'
+            '${options/c/a/b} ${options/c/x}</p>\n'
+            '<b tal:condition="not: exists: options/c/y" />',
+            count_traversal=True,
+        )
+        self.assertEqual(
+            template(c=Container(a={"b": "b"}, x="x", y="y")),
+            "<p>b x</p>\n<p>b x</p>\n",
+        )
+        expressions_, types = expressions.traversal_stats.top()
+        self.assertEqual(
+            sorted(expressions_, key=lambda entry: entry[2]),
+            [
+                ("<string>", 2, "not:exists: options/c/y", 1, 1),
+                ("<string>", 1, "path:options/c/a/b", 4, 2),
+                ("<string>", 1, "path:options/c/x", 2, 2),
+            ],
+        )
+        self.assertEqual(
+            sorted(types),
+            [
+                ("z3c.pt.tests.test_expressions.Container", "a", 2),
+                ("z3c.pt.tests.test_expressions.Container", "x", 2),
+                ("z3c.pt.tests.test_expressions.Container", "y", 1),
+            ],
+        )
+        self.assertIn("Container / x", expressions.traversal_stats.format())
+
+    def test_disabled(self):
+        from z3c.pt.pagetemplate import PageTemplate
+
+        template = PageTemplate('<p>${options/c/x}</p>')
+        self.assertEqual(template(c=Container(x="x")), "<p>x</p>")
+        self.assertEqual(expressions.traversal_stats.top(), ([], []))
+
+    def test_failing_steps(self):
+        from z3c.pt.pagetemplate import PageTemplate
+
+        # The steps of a path which fails are counted, up to and
+        # including the step which failed.
+        template = PageTemplate(
+            '<p tal:condition="exists: options/c/a/z" />\n'
+            '<i>${options/c/z/y | string:missing}</i>',
+            count_traversal=True,
+        )
+        self.assertEqual(
+            template(c=Container(a={"b": "b"})), "\n<i>missing</i>"
+        )
+        expressions_, types = expressions.traversal_stats.top()
+        self.assertEqual(
+            sorted(expressions_, key=lambda entry: entry[1]),
+            [
+                ("<string>", 1, "exists:options/c/a/z", 1, 2),
+                ("<string>", 2, "path:options/c/z/y | string:missing", 1, 1),
+            ],
+        )
+
+    def test_path_traverse(self):
+        key = (None, None, "path:a/b")
+        base = {"a": Container(b=1)}
+        self.assertEqual(
+            expressions.path_traverse(base, {}, False, ("a", "b"), key), 1
+        )
+        self.assertEqual(
+            expressions.traversal_stats.expressions, {key: [1, 1]}
+        )
+
+
+class TestMemoExpr(CleanUp, unittest.TestCase):
+    def _makeView(self, request):
+        from z3c.pt.pagetemplate import ViewPageTemplate
+
+        calls = []
+
+        class Context:
+            def url(self):
+                calls.append("url")
+                return "http://site/a"
+
+        class View:
+            context = Context()
+            main = ViewPageTemplate(
+                "<a href='${memo: context/url}'>${memo: context/url}</a>"
+            )
+            other = ViewPageTemplate("<b>${memo: context/url}</b>")
+            plain = ViewPageTemplate("<i>${context/url}</i>")
+
+        view = View()
+        view.request = request
+        return view, calls
+
+    def test_memo(self):
+        from zope.publisher.browser import TestRequest
+
+        request = TestRequest()
+        view, calls = self._makeView(request)
+        self.assertEqual(
+            view.main(), "<a href='http://site/a'>http://site/a</a>"
+        )
+        self.assertEqual(view.other(), "<b>http://site/a</b>")
+        self.assertEqual(calls, ["url"])
+
+        # Path expressions are not memoized.
+        self.assertEqual(view.plain(), "<i>http://site/a</i>")
+        self.assertEqual(calls, ["url", "url"])
+
+        expressions.clear_memo(request)
+        view.other()
+        self.assertEqual(calls, ["url", "url", "url"])
+
+        # The memo is released when the request is closed.
+        memo = expressions.request_memo(request)
+        self.assertEqual(len(memo), 1)
+        request.close()
+        self.assertEqual(len(memo), 0)
+
+    def test_no_annotations(self):
+        view, calls = self._makeView(None)
+        view.main()
+        self.assertEqual(calls, ["url", "url"])
+        self.assertIsNone(expressions.request_memo(None))
@@ -0,0 +1,245 @@
+##############################################################################
+#
+# Copyright (c) 2007 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+import os
+import shutil
+import tempfile
+import unittest
+
+from chameleon.exc import CompilationError
+
+from z3c.pt.fragments import FileFragmentCache
+from z3c.pt.fragments import MemoryFragmentCache
+from z3c.pt.fragments import fragment_cache
+from z3c.pt.fragments import generations
+from z3c.pt.pagetemplate import PageTemplate
+from z3c.pt.pagetemplate import PageTemplateFile
+from z3c.pt.pagetemplate import macro_dependencies
+
+
+BODY = """\
+<div>
+  <nav cache:key="options/key" cache:ttl="300">
+    <p tal:repeat="item options/items">${python: options['f'](item)}</p>
+  </nav>
+  <p>${options/key}</p>
+</div>
+"""
+
+
+class TestFragmentCache(unittest.TestCase):
+    def setUp(self):
+        fragment_cache.clear()
+        self.addCleanup(fragment_cache.clear)
+        self.calls = []
+
+    def f(self, item):
+        self.calls.append(item)
+        return item
+
+    def test_cache(self):
+        template = PageTemplate(BODY)
+        output = template(key=1, items=("a", "b"), f=self.f)
+        self.assertIn("<p>a</p>", output)
+        self.assertNotIn("cache:", output)
+
+        # The fragment is not rendered again for the same key.
+        self.assertEqual(
+            template(key=1, items=("c",), f=self.f), output
+        )
+        self.assertEqual(self.calls, ["a", "b"])
+
+        output = template(key=2, items=("c",), f=self.f)
+        self.assertIn("<p>c</p>", output)
+        self.assertNotIn("<p>a</p>", output)
+        self.assertEqual(self.calls, ["a", "b", "c"])
+
+    def test_no_key(self):
+        template = PageTemplate(
+            '<p cache:key="options/key">${python: options["f"](1)}</p>'
+        )
+        self.assertEqual(template(key=None, f=self.f), "<p>1</p>")
+        self.assertEqual(template(key=None, f=self.f), "<p>1</p>")
+        self.assertEqual(self.calls, [1, 1])
+        self.assertEqual(len(fragment_cache), 0)
+
+    def test_static(self):
+        template = PageTemplate(
+            '<footer cache:ttl="">${python: options["f"](1)}</footer>'
+            '<i tal:content="python: options[\'f\'](2)" cache:ttl="0" />'
+        )
+        template(f=self.f)
+        template(f=self.f)
+        self.assertEqual(self.calls, [1, 2, 2])
+
+    def test_nested(self):
+        template = PageTemplate(
+            '<div cache:key="options/a">'
+            '<p cache:key="options/b">${python: options["f"]("b")}</p>'
+            '${python: options["f"]("a")}</div>'
+        )
+        self.assertEqual(
+            template(a=1, b=1, f=self.f), "<div><p>b</p>a</div>"
+        )
+        template(a=2, b=1, f=self.f)
+        self.assertEqual(self.calls, ["b", "a", "a"])
+
+    def test_macro(self):
+        macros = PageTemplate(
+            '<div metal:define-macro="box">${python: options["f"](1)}</div>'
+        )
+        template = PageTemplate(
+            '<div cache:key="string:box"'
+            ' metal:use-macro="python: options[\'m\'].macros[\'box\']" />'
+        )
+        self.assertEqual(template(m=macros, f=self.f), "<div>1</div>")
+        self.assertEqual(template(m=macros, f=self.f), "<div>1</div>")
+        self.assertEqual(self.calls, [1])
+
+    def test_statements(self):
+        # The key is evaluated within the statements of the element.
+        template = PageTemplate(
+            '<p tal:define="f nocall: options/f"'
+            ' tal:repeat="item options/items"'
+            ' cache:key="python: item and (f.__name__, item) or None">'
+            '${python: f(item)}</p>'
+        )
+        output = template(items=(1, 0, 2, 1), f=self.f)
+        self.assertEqual(
+            output.split(), ["<p>1</p>", "<p>0</p>", "<p>2</p>", "<p>1</p>"]
+        )
+        self.assertEqual(self.calls, [1, 0, 2])
+
+    def test_case_condition(self):
+        # The ``tal:case`` and ``tal:condition`` are evaluated before
+        # the key, also together with ``tal:on-error`` and
+        # ``tal:replace``.
+        template = PageTemplate(
+            '<div tal:switch="options/kind">'
+            '<p tal:case="string:a" tal:condition="options/show"'
+            ' tal:on-error="string:error" tal:define="f nocall: options/f"'
+            ' tal:replace="python: f(options[\'kind\'])"'
+            ' cache:key="options/kind" />'
+            '</div>'
+        )
+        for kind, show, output in (
+            ("a", True, "<div>a</div>"),
+            ("a", True, "<div>a</div>"),
+            ("b", True, "<div></div>"),
+            ("a", False, "<div></div>"),
+        ):
+            self.assertEqual(template(kind=kind, show=show, f=self.f), output)
+        self.assertEqual(self.calls, ["a"])
+
+    def test_errors(self):
+        for body in (
+            '<p cache:ttl="soon" />',
+            '<p cache:keys="a" />',
+            '<div metal:use-macro="options/m">'
+            '<p metal:fill-slot="s" cache:key="a" /></div>',
+            '<div cache:key="a"><p tal:define="global x 1" /></div>',
+            '<div cache:key="a"><p tal:define="y 1; global x 1" /></div>',
+            '<div cache:key="a"><p tal:repeat="global x a" /></div>',
+        ):
+            with self.assertRaises(CompilationError):
+                PageTemplate(body)
+
+        # The statements of the element itself are not cached.
+        template = PageTemplate(
+            '<div tal:define="global x python: 1" cache:key="x">${x}</div>'
+            '${x}'
+        )
+        self.assertEqual(template(), "<div>1</div>1")
+        self.assertEqual(template(), "<div>1</div>1")
+
+    def test_macro_changed(self):
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        self.addCleanup(macro_dependencies.clear)
+
+        def write(name, body):
+            with open(os.path.join(path, name), "w") as f:
+                f.write(body)
+
+        write("main.pt", '<p metal:define-macro="main">main</p>')
+        write(
+            "view.pt",
+            '<div cache:key="string:main" metal:use-macro="'
+            "python: options['main'].macros['main']\" />",
+        )
+        main = PageTemplateFile(
+            os.path.join(path, "main.pt"), auto_reload=True
+        )
+        view = PageTemplateFile(os.path.join(path, "view.pt"))
+        self.assertEqual(view(main=main), "<p>main</p>")
+
+        # The fragments which include a macro of a reloaded template
+        # are rendered again.
+        write("main.pt", '<p metal:define-macro="main">new</p>')
+        main._v_last_read = None
+        main.cook_check()
+        self.assertEqual(generations.get(view.filename), 1)
+        self.assertEqual(view(main=main), "<p>new</p>")
+
+    def test_file_cache(self):
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+
+        template = PageTemplate(BODY)
+        template.fragment_cache = FileFragmentCache(path)
+        output = template(key=1, items=("a",), f=self.f)
+        self.assertEqual(template(key=1, items=("b",), f=self.f), output)
+        self.assertEqual(self.calls, ["a"])
+        self.assertEqual(len(os.listdir(path)), 1)
+        self.assertEqual(len(fragment_cache), 0)
+
+
+class TestMemoryFragmentCache(unittest.TestCase):
+    def test_ttl(self):
+        cache = MemoryFragmentCache(2)
+        cache.set("a", "A")
+        cache.set("b", "B", 0)
+        self.assertEqual(cache.get("a"), "A")
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.stats()["misses"], 1)
+
+
+class TestFileFragmentCache(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+
+    def test_get_set(self):
+        cache = FileFragmentCache(self.path)
+        cache.set(("f", 1), "<p>\r\n1</p>")
+        self.assertEqual(cache.get(("f", 1)), "<p>\r\n1</p>")
+        self.assertIsNone(cache.get(("f", 2)))
+
+        # The cache is shared by its instances.
+        self.assertEqual(
+            FileFragmentCache(self.path).get(("f", 1)), "<p>\r\n1</p>"
+        )
+
+    def test_ttl(self):
+        cache = FileFragmentCache(self.path)
+        cache.set("a", "A", 0)
+        cache.set("b", "B", 0)
+        cache.set("c", "C", 60)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(len(os.listdir(self.path)), 2)
+        cache.prune()
+        self.assertEqual(len(os.listdir(self.path)), 1)
+        self.assertEqual(cache.get("c"), "C")
+        cache.clear()
+        self.assertEqual(os.listdir(self.path), [])
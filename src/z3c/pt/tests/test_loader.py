@@ -65,3 +65,156 @@ class LoadTests:
 class LoadPageTests(unittest.TestCase, LoadTests):
     def _load(self, loader, filename):
         return loader.load_page(filename)
+
+
+class IndexedLoadPageTests(LoadPageTests):
+    def _makeOne(self, search_path=None, **kwargs):
+        return super()._makeOne(search_path, indexed=True, **kwargs)
+
+    def setUp(self):
+        import shutil
+        import tempfile
+
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+        self.first = self._mkdir("first")
+        self.second = self._mkdir("second")
+        self._write(self.second, "a.pt")
+        self._write(self._mkdir("second", "sub"), "b.pt")
+
+    def _mkdir(self, *names):
+        import os
+
+        path = os.path.join(self.path, *names)
+        os.mkdir(path)
+        return path
+
+    def _write(self, path, name):
+        import os
+
+        filename = os.path.join(path, name)
+        with open(filename, "w") as f:
+            f.write("<p>%s</p>" % filename)
+        return filename
+
+    def test_index(self):
+        import os
+
+        loader = self._makeOne([self.first, self.second])
+        self.assertEqual(
+            loader.load_page("a.pt").filename,
+            os.path.join(self.second, "a.pt"),
+        )
+        self.assertEqual(
+            loader.load_page("sub/b.pt").filename,
+            os.path.join(self.second, "sub", "b.pt"),
+        )
+        with self.assertRaises(ValueError):
+            loader.load_page("missing.pt")
+
+    def test_default_extension(self):
+        loader = self._makeOne([self.second], default_extension="pt")
+        self.assertIs(loader.load_page("a"), loader.load_page("a.pt"))
+
+    def test_refresh(self):
+        import os
+
+        loader = self._makeOne([self.first, self.second])
+        template = loader.load_page("a.pt")
+
+        # A file in a directory which takes precedence is found when
+        # the index is refreshed.
+        filename = self._write(self.first, "a.pt")
+        self._write(os.path.join(self.second, "sub"), "c.pt")
+        self.assertIs(loader.load_page("a.pt"), template)
+        self.assertTrue(loader.refresh())
+        self.assertFalse(loader.refresh())
+        self.assertEqual(loader.load_page("a.pt").filename, filename)
+        self.assertTrue(loader.load_page("sub/c.pt"))
+
+        os.remove(filename)
+        self.assertTrue(loader.refresh())
+        self.assertIs(loader.load_page("a.pt"), template)
+
+    def test_refresh_interval(self):
+        loader = self._makeOne([self.first, self.second], refresh_interval=0)
+        with self.assertRaises(ValueError):
+            loader.load_page("d.pt")
+        self._write(self.first, "d.pt")
+        self.assertTrue(loader.load_page("d.pt"))
+
+    def test_package(self):
+        import os
+
+        loader = self._makeOne(["z3c.pt:tests"])
+        self.assertEqual(
+            loader.load_page("view.pt").filename,
+            os.path.join(os.path.dirname(__file__), "view.pt"),
+        )
+
+
+class LoadAllTests(unittest.TestCase):
+    def setUp(self):
+        import os
+        import shutil
+        import tempfile
+
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+        os.mkdir(os.path.join(self.path, "sub"))
+        for name, body in (
+            ("a.pt", "<p>${options/name}</p>"),
+            ("sub/b.pt", "<p>b</p>"),
+            ("bad.pt", "<p tal:repeat='a'></p>"),
+            ("c.txt", "c"),
+        ):
+            with open(os.path.join(self.path, name), "w") as f:
+                f.write(body)
+
+    def _makeOne(self, **kwargs):
+        from z3c.pt.loader import TemplateLoader
+
+        return TemplateLoader([self.path], **kwargs)
+
+    def test_load_all(self):
+        import os
+
+        for indexed in (False, True):
+            loader = self._makeOne(indexed=indexed)
+            report = loader.load_all(jobs=2)
+            self.assertEqual(
+                sorted(report.templates), ["a.pt", os.path.join("sub", "b.pt")]
+            )
+            self.assertEqual(list(report.failures), ["bad.pt"])
+            self.assertEqual(len(report.timings), 3)
+            self.assertTrue(report.templates["a.pt"]._cooked)
+            self.assertIs(report.templates["a.pt"], loader.load_page("a.pt"))
+            self.assertIn("2 loaded, 1 failed", repr(report))
+
+    def test_patterns(self):
+        report = self._makeOne().load_all(patterns=("sub/*", "*.txt"))
+        self.assertEqual(len(report.templates), 2)
+        self.assertEqual(report.failures, {})
+
+    def test_processes(self):
+        import shutil
+        import tempfile
+
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        loader = self._makeOne(literal_false=False)
+        report = loader.load_all(jobs=2, processes=True, cache_dir=cache_dir)
+        self.assertEqual(len(report.templates), 2)
+        self.assertEqual(list(report.failures), ["bad.pt"])
+
+        # The templates are loaded from the cache.
+        template = report.templates["a.pt"]
+        self.assertEqual(template.loader.stats()["hits"], 2)
+        self.assertEqual(template(name="Bob"), "<p>Bob</p>")
+
+    def test_processes_without_cache_dir(self):
+        import unittest.mock
+
+        with unittest.mock.patch("z3c.pt.loader.CACHE_DIRECTORY", None):
+            with self.assertRaises(ValueError):
+                self._makeOne().load_all(processes=True)
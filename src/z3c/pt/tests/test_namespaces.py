@@ -5,6 +5,8 @@ Tests for namespaces.py.
 
 import unittest
 
+from zope.testing.cleanup import CleanUp
+
 from z3c.pt import namespaces
 
 
@@ -35,3 +37,66 @@ class TestAdapterNamespaces(unittest.TestCase):
         self.assertIsInstance(
             namespaces.function_namespaces, engine.AdapterNamespaces
         )
+
+
+class TestPathAdapterFactories(CleanUp, unittest.TestCase):
+    def _register(self, factory, name):
+        from zope import component
+        from zope.interface import Interface
+        from zope.traversing.interfaces import IPathAdapter
+
+        component.getGlobalSiteManager().registerAdapter(
+            factory, [Interface], IPathAdapter, name
+        )
+
+    def test_factory_lookup(self):
+        from unittest import mock
+
+        from zope import component
+        from zope.interface import providedBy
+        from zope.traversing.interfaces import IPathAdapter
+
+        self._register(lambda ob: ("adapted", ob), "fmt")
+        namespace = namespaces.AdapterNamespaces()["fmt"]
+        adapters = component.getGlobalSiteManager().adapters
+        hits = namespaces.path_adapter_factories.hits
+        with mock.patch.object(
+            adapters, "lookup", wraps=adapters.lookup
+        ) as lookup:
+            self.assertEqual(namespace(1), ("adapted", 1))
+            self.assertEqual(namespace(2), ("adapted", 2))
+
+        # The factory is remembered.
+        lookup.assert_called_once_with(
+            (providedBy(1),), IPathAdapter, "fmt"
+        )
+        self.assertEqual(namespaces.path_adapter_factories.hits, hits + 1)
+
+    def test_registration_without_event(self):
+        from zope import component
+        from zope.interface import Interface
+        from zope.traversing.interfaces import IPathAdapter
+
+        self._register(lambda ob: "adapted", "fmt")
+        namespace = namespaces.AdapterNamespaces()["fmt"]
+        self.assertEqual(namespace(1), "adapted")
+
+        # ``provideAdapter`` registers the adapter without an event.
+        component.provideAdapter(
+            lambda ob: "replaced", (Interface,), IPathAdapter, "fmt"
+        )
+        self.assertEqual(namespace(1), "replaced")
+
+    def test_registration_invalidates(self):
+        namespace = namespaces.AdapterNamespaces()["fmt"]
+        with self.assertRaises(KeyError):
+            namespace(1)
+
+        self._register(lambda ob: "adapted", "fmt")
+        self.assertEqual(namespace(1), "adapted")
+
+    def test_factory_returning_none(self):
+        self._register(lambda ob: None, "fmt")
+        namespace = namespaces.AdapterNamespaces()["fmt"]
+        with self.assertRaises(KeyError):
+            namespace(1)
@@ -0,0 +1,110 @@
+##############################################################################
+#
+# Copyright (c) 2007 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from z3c.pt import precompile
+from z3c.pt.cache import CompiledTemplateCache
+from z3c.pt.pagetemplate import PageTemplateFile
+
+
+class TestPrecompile(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir)
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+        for name in ("a.pt", "b.pt", "c.txt"):
+            with open(os.path.join(self.path, name), "w") as f:
+                f.write("<p>${options/name}</p>")
+
+    def _main(self, *args):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            result = precompile.main(list(args))
+        return result, output.getvalue()
+
+    def test_find_templates(self):
+        self.assertEqual(
+            [
+                os.path.basename(filename)
+                for filename in precompile.find_templates([self.path])
+            ],
+            ["a.pt", "b.pt"],
+        )
+        filenames = list(precompile.find_templates(["z3c.pt.tests"]))
+        self.assertIn(
+            os.path.join(os.path.dirname(__file__), "view.pt"), filenames
+        )
+        with self.assertRaises(ValueError):
+            list(precompile.find_templates(["z3c.pt.pagetemplate"]))
+
+    def test_main(self):
+        result, output = self._main("-d", self.cache_dir, self.path)
+        self.assertEqual(result, 0)
+        self.assertIn("4 templates (4 compiled)", output)
+        self.assertIn("a.pt (ViewPageTemplateFile)", output)
+
+        # The compiled templates are loaded from the cache.
+        result, output = self._main("-d", self.cache_dir, self.path)
+        self.assertIn("4 templates (4 cached)", output)
+
+        template = PageTemplateFile(os.path.join(self.path, "a.pt"))
+        template.loader = loader = CompiledTemplateCache(self.cache_dir)
+        self.assertEqual(template(name="Bob"), "<p>Bob</p>")
+        self.assertEqual(loader.stats()["hits"], 1)
+
+    def test_main_jobs(self):
+        result, output = self._main(
+            "-d",
+            self.cache_dir,
+            "-j",
+            "2",
+            "-c",
+            "z3c.pt.pagetemplate.PageTemplateFile",
+            "-e",
+            ".txt",
+            self.path,
+        )
+        self.assertEqual(result, 0)
+        self.assertIn("1 templates (1 compiled)", output)
+        self.assertIn("c.txt (PageTemplateFile)", output)
+
+    def test_main_error(self):
+        with open(os.path.join(self.path, "b.pt"), "w") as f:
+            f.write("<p tal:repeat='a'></p>")
+        result, output = self._main("-q", "-d", self.cache_dir, self.path)
+        self.assertEqual(result, 1)
+        self.assertEqual(output.count("error: LanguageError"), 2)
+        self.assertNotIn("a.pt", output)
+
+    def test_compile_template(self):
+        filename, class_name, status, duration = precompile.compile_template(
+            os.path.join(self.path, "a.pt"),
+            "z3c.pt.pagetemplate.PageTemplateFile",
+            self.cache_dir,
+        )
+        self.assertEqual(status, "compiled")
+        filenames = [
+            filename
+            for filename in os.listdir(self.cache_dir)
+            if filename.endswith(".py")
+        ]
+        self.assertEqual(len(filenames), 1)
+        cache = CompiledTemplateCache(self.cache_dir)
+        self.assertTrue(cache.get(filenames[0]))
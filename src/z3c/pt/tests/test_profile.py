@@ -0,0 +1,106 @@
+##############################################################################
+#
+# Copyright (c) 2007 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+import os
+import unittest
+
+from z3c.pt.pagetemplate import PageTemplate
+from z3c.pt.pagetemplate import PageTemplateFile
+from z3c.pt.profile import ExpressionProfile
+from z3c.pt.profile import expression_profile
+
+
+BODY = """\
+<div>
+  <p tal:repeat="i python: range(3)" tal:content="string:${i}" />
+  <b tal:condition="not: exists: options/missing">missing</b>
+  <i tal:content="python: options['f']()" />
+</div>
+"""
+
+
+class TestExpressionProfile(unittest.TestCase):
+    def setUp(self):
+        expression_profile.clear()
+        self.addCleanup(expression_profile.clear)
+
+    def test_profile(self):
+        template = PageTemplate(BODY, profile_expressions=True)
+        template(f=lambda: "f")
+        entries = {
+            entry.expression: entry for entry in expression_profile.report()
+        }
+        self.assertEqual(
+            sorted(entries),
+            [
+                "exists:options/missing",
+                "path:i",
+                "python:options['f']()",
+                "python:range(3)",
+                "string:${i}",
+            ],
+        )
+        self.assertEqual(entries["path:i"].calls, 3)
+        self.assertEqual(entries["path:i"].line, 2)
+        self.assertEqual(entries["path:i"].filename, "<string>")
+        self.assertEqual(entries["exists:options/missing"].errors, 0)
+        self.assertEqual(entries["exists:options/missing"].line, 3)
+
+    def test_errors(self):
+        template = PageTemplate(BODY, profile_expressions=True)
+        with self.assertRaises(ZeroDivisionError):
+            template(f=lambda: 1 / 0)
+        (entry,) = expression_profile.report(sort="errors", limit=1)
+        self.assertEqual(entry.expression, "python:options['f']()")
+        self.assertEqual(entry.errors, 1)
+
+    def test_file(self):
+        template = PageTemplateFile("false.pt", profile_expressions=True)
+        template()
+        (entry,) = expression_profile.report()
+        self.assertEqual(
+            entry.filename,
+            os.path.join(os.path.dirname(__file__), "false.pt"),
+        )
+        self.assertEqual(entry[1:4], (3, "path:False", 1))
+
+    def test_disabled(self):
+        template = PageTemplate(BODY)
+        template(f=lambda: "f")
+        self.assertEqual(expression_profile.report(), [])
+
+        # The compiled template is the same as before.
+        self.assertNotIn("profile", template._compile(BODY, {}))
+        self.assertNotEqual(
+            template.digest(BODY, ()),
+            PageTemplate(BODY, profile_expressions=True).digest(BODY, ()),
+        )
+
+    def test_report(self):
+        profile = ExpressionProfile()
+        profile.record(("a.pt", 1, "path:a"), 0.5, False)
+        profile.record(("a.pt", 1, "path:a"), 0.5, True)
+        profile.record(("a.pt", 2, "path:b"), 0.8, False)
+        self.assertEqual(
+            [entry.expression for entry in profile.report()],
+            ["path:a", "path:b"],
+        )
+        self.assertEqual(
+            [entry.expression for entry in profile.report("average")],
+            ["path:b", "path:a"],
+        )
+        self.assertEqual(
+            profile.report("calls", 1),
+            [("a.pt", 1, "path:a", 2, 1.0, 1)],
+        )
+        self.assertIn("a.pt:2  path:b", profile.format())
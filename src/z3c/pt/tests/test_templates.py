@@ -11,7 +11,13 @@
 # FOR A PARTICULAR PURPOSE.
 #
 ##############################################################################
+import concurrent.futures
+import gc
 import os
+import shutil
+import tempfile
+import threading
+import time
 import unittest
 import unittest.mock
 
@@ -22,10 +28,29 @@ from zope.i18n.interfaces import ITranslationDomain
 from zope.testing.cleanup import CleanUp
 
 from z3c.pt import pagetemplate
+from z3c.pt import threads
 from z3c.pt.pagetemplate import PageTemplateFile
+from z3c.pt.pagetemplate import ViewPageTemplate
 from z3c.pt.pagetemplate import ViewPageTemplateFile
 
 
+def use_executor(test, max_workers=2):
+    """Render in the threads of an executor of the test, which are
+    stopped when the test has completed."""
+
+    executor = concurrent.futures.ThreadPoolExecutor(
+        max_workers=max_workers, thread_name_prefix="test"
+    )
+    orig_executor, threads.executor = threads.executor, executor
+
+    def restore():
+        threads.executor = orig_executor
+        executor.shutdown(wait=True)
+
+    test.addCleanup(restore)
+    return executor
+
+
 class Setup(CleanUp):
     def setUp(self):
         CleanUp.setUp(self)
@@ -79,6 +104,163 @@ class TestPageTemplate(Setup, unittest.TestCase):
         result = template.render(p=p)
         self.assertIn(repr(p), result)
 
+    def test_memoize_translations(self):
+        template = pagetemplate.PageTemplate(
+            """<div i18n:domain="test">
+                 <p tal:repeat="i python:range(3)"
+                    i18n:translate="">hello</p>
+                 <p i18n:translate="">Hi
+                   <b i18n:name="name" tal:replace="options/name" /></p>
+               </div>"""
+        )
+        template.memoize_translations = True
+        self._i18n_domain.translate.return_value = "world"
+
+        result = template.render(
+            options={"name": "Bob"}, target_language="de"
+        )
+        self.assertEqual(result.count("world"), 4)
+        result = template.render(
+            options={"name": "Bob"}, target_language="de"
+        )
+        self.assertEqual(result.count("world"), 4)
+
+        # The static message is translated once; the one with a
+        # mapping is translated each time.
+        msgids = [
+            call.args[0]
+            for call in self._i18n_domain.translate.call_args_list
+        ]
+        self.assertEqual(msgids.count("hello"), 1)
+        self.assertEqual(len(msgids), 3)
+
+    def test_memoize_translations_by_language(self):
+        template = pagetemplate.PageTemplate(
+            """<p i18n:domain="test" i18n:translate="">hello</p>"""
+        )
+        template.memoize_translations = True
+        self._i18n_domain.translate.side_effect = (
+            lambda msgid, mapping, context, target_language, *args:
+            target_language
+        )
+        self.assertIn("de", template.render(target_language="de"))
+        self.assertIn("fr", template.render(target_language="fr"))
+        self.assertIn("de", template.render(target_language="de"))
+        self.assertEqual(self._i18n_domain.translate.call_count, 2)
+
+    def test_memoize_translations_by_site(self):
+        import zope.component.hooks
+        from zope.interface.registry import Components
+
+        template = pagetemplate.PageTemplate(
+            """<p i18n:domain="test" i18n:translate="">hello</p>"""
+        )
+        template.memoize_translations = True
+        self._i18n_domain.translate.return_value = "global"
+
+        # The registration in the local site does not clear the cache.
+        domain = unittest.mock.Mock()
+        domain.translate.return_value = "local"
+        components = Components(bases=(zope.component.getSiteManager(),))
+        components.registerUtility(
+            domain, ITranslationDomain, name="test", event=False
+        )
+        site = unittest.mock.Mock()
+        site.getSiteManager.return_value = components
+
+        zope.component.hooks.setHooks()
+        self.addCleanup(zope.component.hooks.resetHooks)
+
+        self.assertIn("global", template.render(target_language="de"))
+        with zope.component.hooks.site(site):
+            self.assertIn("local", template.render(target_language="de"))
+        self.assertIn("global", template.render(target_language="de"))
+        self.assertEqual(self._i18n_domain.translate.call_count, 1)
+
+    def test_pretranslate_languages(self):
+        template = pagetemplate.PageTemplate(
+            """<div i18n:domain="test">
+                 <p tal:repeat="i python:range(3)"
+                    i18n:translate="">hello   world</p>
+                 <p i18n:translate="">Hi
+                   <b i18n:name="name" tal:replace="options/name" /></p>
+               </div>""",
+            pretranslate_languages=("de",),
+        )
+        self._i18n_domain.translate.side_effect = (
+            lambda msgid, mapping, context, target_language, *args:
+            "%s:%s" % (target_language, msgid)
+        )
+
+        for i in range(2):
+            result = template.render(
+                options={"name": "Bob"}, target_language="de"
+            )
+            self.assertEqual(result.count("de:hello world"), 3)
+            self.assertEqual(result.count("de:Hi ${name}"), 1)
+
+        # The static message is translated when the variant is
+        # compiled; the one with a mapping is translated each time.
+        msgids = [
+            call.args[0]
+            for call in self._i18n_domain.translate.call_args_list
+        ]
+        self.assertEqual(msgids.count("hello world"), 1)
+        self.assertEqual(len(msgids), 3)
+
+        # Other languages are translated at runtime.
+        result = template.render(
+            options={"name": "Bob"}, target_language="fr"
+        )
+        self.assertEqual(result.count("fr:hello world"), 3)
+
+    def test_pretranslate_languages_set_later(self):
+        template = pagetemplate.PageTemplate(
+            """<p i18n:domain="test" i18n:translate="">hello</p>"""
+        )
+        template.pretranslate_languages = ("de",)
+        self._i18n_domain.translate.return_value = "world"
+        for i in range(2):
+            result = template.render(target_language="de")
+            self.assertEqual(result, "<p>world</p>")
+        self.assertEqual(self._i18n_domain.translate.call_count, 1)
+
+    def test_pretranslate_without_domain(self):
+        # The domain of a macro is that of its caller.
+        template = pagetemplate.PageTemplate(
+            """<p metal:define-macro="m" i18n:translate="">hello</p>""",
+            pretranslate_languages=("de",),
+        )
+        self._i18n_domain.translate.return_value = "world"
+        caller = pagetemplate.PageTemplate(
+            """<div i18n:domain="test"
+                    metal:use-macro="options/macro" />"""
+        )
+        for i in range(2):
+            result = template.render(target_language="de")
+            self.assertEqual(result, "<p>hello</p>")
+            result = caller.render(
+                options={"macro": template.macros["m"]},
+                target_language="de",
+            )
+            self.assertEqual(result, "<p>world</p>")
+
+    def test_pretranslate_target(self):
+        template = pagetemplate.PageTemplate(
+            """<div i18n:domain="test">
+                 <p i18n:translate="">hello</p>
+                 <p i18n:target="string:fr" i18n:translate="">hello</p>
+               </div>""",
+            pretranslate_languages=("de",),
+        )
+        self._i18n_domain.translate.side_effect = (
+            lambda msgid, mapping, context, target_language, *args:
+            "%s:%s" % (target_language, msgid)
+        )
+        result = template.render(target_language="de")
+        self.assertIn("de:hello", result)
+        self.assertIn("fr:hello", result)
+
     def test_structure(self):
         template = pagetemplate.PageTemplate(
             "${structure: python: '&lt;div&gt;Hello world&lt;/div&gt;'}"
@@ -194,6 +376,412 @@ class TestViewPageTemplateFile(Setup, unittest.TestCase):
         self.assertIn(repr({"context": context}), result)
 
 
+class TestProviderUpdateExecutor(Setup, unittest.TestCase):
+    def setUp(self):
+        from concurrent.futures import ThreadPoolExecutor
+
+        super().setUp()
+        self.executor = ThreadPoolExecutor(4)
+        self.addCleanup(self.executor.shutdown)
+
+    def _provideProvider(self, name, log, fail=False, interface=None):
+        import threading
+
+        from zope.component import provideAdapter
+        from zope.contentprovider.interfaces import IContentProvider
+        from zope.interface import implementer
+
+        @implementer(interface or IContentProvider)
+        class Provider:
+            def __init__(self, *args):
+                pass
+
+            def update(self):
+                log.append(("update", name, threading.current_thread()))
+                if fail:
+                    raise ValueError(name)
+
+            def render(self):
+                log.append(("render", name, threading.current_thread()))
+                return "<p>%s</p>" % name
+
+        provideAdapter(
+            Provider, (None, None, None), IContentProvider, name=name
+        )
+
+    def _makeView(self, body):
+        class View:
+            context = None
+            request = None
+            __call__ = ViewPageTemplate(body)
+
+        View.__call__.provider_update_executor = self.executor
+        return View()
+
+    def test_static_providers(self):
+        template = ViewPageTemplate(
+            """<div tal:replace="structure provider:a" />
+            <div tal:replace="structure provider: ${python: 'b'}" />
+            <!-- <div tal:replace="structure provider:comment" /> -->
+            <div tal:condition="nothing">${structure: provider:x}</div>
+            <div tal:repeat="i python:()" tal:content="provider:y" />
+            <div tal:define="x provider:c; y string:d" />
+            <div tal:replace="structure provider:a" />"""
+        )
+        self.assertEqual(template._static_providers, ("a", "c"))
+
+    def test_static_providers_cached_program(self):
+        import tempfile
+
+        from z3c.pt.cache import TemplateCache
+
+        with tempfile.NamedTemporaryFile(
+            "w", suffix=".pt", delete=False
+        ) as f:
+            f.write("""<div tal:replace="structure provider:a" />""")
+        self.addCleanup(os.remove, f.name)
+
+        # The names are recorded in the compiled program.
+        cache = TemplateCache()
+        for i in range(2):
+            template = ViewPageTemplateFile(f.name)
+            template.cache = cache
+            template.cook_check()
+            self.assertEqual(template._static_providers, ("a",))
+        self.assertEqual(cache.stats()["hits"], 1)
+
+    def test_update_in_calling_context(self):
+        import contextvars
+
+        from zope.component import provideAdapter
+        from zope.contentprovider.interfaces import IContentProvider
+        from zope.interface import implementer
+        from zope.security.management import endInteraction
+        from zope.security.management import newInteraction
+        from zope.security.management import queryInteraction
+
+        var = contextvars.ContextVar("var", default=None)
+        log = []
+
+        @implementer(IContentProvider)
+        class Provider:
+            def __init__(self, *args):
+                pass
+
+            def update(self):
+                log.append((var.get(), queryInteraction()))
+
+            def render(self):
+                return ""
+
+        provideAdapter(
+            Provider, (None, None, None), IContentProvider, name="a"
+        )
+        view = self._makeView("""<div tal:replace="provider:a" />""")
+
+        newInteraction()
+        self.addCleanup(endInteraction)
+        var.set("value")
+        view()
+        self.assertEqual(log, [("value", queryInteraction())])
+
+    def test_updates_before_render(self):
+        import threading
+
+        from zope.component import provideHandler
+        from zope.contentprovider.interfaces import IBeforeUpdateEvent
+
+        log = []
+        provideHandler(
+            lambda event: log.append(("event", event.object.__class__)),
+            (IBeforeUpdateEvent,),
+        )
+        self._provideProvider("a", log)
+        self._provideProvider("b", log)
+        view = self._makeView(
+            """<div tal:replace="structure provider:a" />"""
+            """<div tal:replace="structure provider:b" />"""
+        )
+
+        self.assertEqual(view(), "<p>a</p><p>b</p>")
+        updates = [entry for entry in log if entry[0] == "update"]
+        renders = [entry for entry in log if entry[0] == "render"]
+        self.assertEqual(len([e for e in log if e[0] == "event"]), 2)
+        self.assertEqual(sorted(name for _, name, _ in updates), ["a", "b"])
+        self.assertEqual([name for _, name, _ in renders], ["a", "b"])
+        main = threading.current_thread()
+        self.assertTrue(all(thread is not main for _, _, thread in updates))
+        self.assertTrue(all(thread is main for _, _, thread in renders))
+
+    def test_update_error_is_raised(self):
+        log = []
+        self._provideProvider("a", log, fail=True)
+        view = self._makeView(
+            """<div tal:replace="structure provider:a" />"""
+        )
+        with self.assertRaises(ValueError):
+            view()
+
+    def test_tal_namespace_data_providers_are_not_prefetched(self):
+        import threading
+
+        from zope.contentprovider.interfaces import IContentProvider
+        from zope.contentprovider.interfaces import ITALNamespaceData
+        from zope.interface import directlyProvides
+
+        class ITestProvider(IContentProvider):
+            pass
+
+        directlyProvides(ITestProvider, ITALNamespaceData)
+
+        log = []
+        self._provideProvider("a", log, interface=ITestProvider)
+        view = self._makeView(
+            """<div tal:replace="structure provider:a" />"""
+        )
+        self.assertEqual(view(), "<p>a</p>")
+        self.assertTrue(
+            all(thread is threading.current_thread()
+                for _, _, thread in log)
+        )
+
+    def test_cached_providers_are_not_updated(self):
+        from zope.component import provideAdapter
+        from zope.interface import implementer
+
+        from z3c.pt.expressions import provider_outputs
+        from z3c.pt.interfaces import ICachedContentProvider
+
+        log = []
+
+        @implementer(ICachedContentProvider)
+        class Provider:
+            def __init__(self, *args):
+                pass
+
+            def cache_key(self):
+                return "key"
+
+            def update(self):
+                log.append("update")
+
+            def render(self):
+                log.append("render")
+                return "<p>cached</p>"
+
+        provideAdapter(
+            Provider, (None, None, None), ICachedContentProvider,
+            name="cached",
+        )
+        view = self._makeView(
+            """<div tal:replace="structure provider:cached" />"""
+        )
+        self.assertEqual(view(), "<p>cached</p>")
+        self.assertEqual(view(), "<p>cached</p>")
+        self.assertEqual(log, ["update", "render"])
+        self.assertEqual(
+            provider_outputs.provider_stats()["cached"],
+            {"hits": 1, "misses": 1},
+        )
+
+
+class TestRenderAsync(Setup, unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        use_executor(self)
+
+    def _makeView(self, body):
+        import asyncio
+
+        class View:
+            context = None
+            request = None
+            running = maximum = 0
+            template = ViewPageTemplate(body)
+
+            async def fetch(self, value="fetched"):
+                View.running += 1
+                View.maximum = max(View.maximum, View.running)
+                await asyncio.sleep(0.01)
+                View.running -= 1
+                return value
+
+            def items(self):
+                return [self.fetch(i) for i in range(3)]
+
+        return View()
+
+    def _render(self, view, **kw):
+        import asyncio
+
+        return asyncio.run(view.template.render_async(**kw))
+
+    def test_path(self):
+        view = self._makeView("<p>${view/fetch}</p>")
+        self.assertEqual(self._render(view), "<p>fetched</p>")
+
+    def test_python(self):
+        view = self._makeView("<p>${python: view.fetch('python')}</p>")
+        self.assertEqual(self._render(view), "<p>python</p>")
+
+    def test_condition(self):
+        view = self._makeView(
+            """<p tal:condition="python: view.fetch(False)">no</p>"""
+        )
+        self.assertEqual(self._render(view), "")
+
+    def test_repeat_is_gathered(self):
+        view = self._makeView(
+            """<p tal:repeat="item view/items">${item}</p>"""
+        )
+        self.assertEqual(
+            self._render(view).split(), ["<p>0</p>", "<p>1</p>", "<p>2</p>"]
+        )
+        self.assertEqual(view.maximum, 3)
+
+    def test_template_render_async(self):
+        import asyncio
+
+        template = pagetemplate.PageTemplate("<p>${options/fetch}</p>")
+
+        async def fetch():
+            return "fetched"
+
+        self.assertEqual(
+            asyncio.run(template.render_async(options={"fetch": fetch})),
+            "<p>fetched</p>",
+        )
+
+    def test_nested(self):
+        import asyncio
+
+        # A render which is started while another awaits it does not
+        # wait for a thread of the executor.
+        use_executor(self, max_workers=1)
+
+        inner = pagetemplate.PageTemplate("<i>${options/text}</i>")
+        outer = pagetemplate.PageTemplate(
+            "<p tal:repeat='item options/items'>"
+            "${structure: item}</p>"
+        )
+
+        async def render():
+            items = [
+                inner.render_async(options={"text": text})
+                for text in ("a", "b")
+            ]
+            return await asyncio.wait_for(
+                outer.render_async(options={"items": items}), 5
+            )
+
+        self.assertEqual(
+            asyncio.run(render()).split(),
+            ["<p><i>a</i></p>", "<p><i>b</i></p>"],
+        )
+
+    def test_thread_state(self):
+        import asyncio
+        import contextvars
+
+        # The context variables of the caller are used, but no other
+        # thread-local state.
+        var = contextvars.ContextVar("var", default="unset")
+        local = threading.local()
+        template = pagetemplate.PageTemplate(
+            "<p>${python: var.get()}"
+            " ${python: getattr(local, 'v', 'unset')}</p>"
+        )
+
+        async def render():
+            var.set("set")
+            local.v = "set"
+            return await template.render_async(var=var, local=local)
+
+        self.assertEqual(asyncio.run(render()), "<p>set unset</p>")
+
+    def test_sync_render(self):
+        from z3c.pt import expressions
+
+        # The resolver is looked up once per render function, not for
+        # each call in an expression.
+        lookups = []
+        for count in (1, 10):
+            template = pagetemplate.PageTemplate(
+                "<p>${options/f}</p>" + "${python: options['f']()}" * count
+            )
+            with unittest.mock.patch.object(
+                expressions, "awaitable_resolver",
+                unittest.mock.Mock(**{"get.return_value": None}),
+            ) as resolver:
+                template(f=lambda: "x")
+            lookups.append(resolver.get.call_count)
+        self.assertEqual(lookups[0], lookups[1])
+
+    def test_providers_are_gathered(self):
+        import asyncio
+
+        from zope.component import provideAdapter
+        from zope.contentprovider.interfaces import IContentProvider
+        from zope.interface import implementer
+
+        state = {"running": 0, "maximum": 0}
+
+        @implementer(IContentProvider)
+        class Provider:
+            def __init__(self, *args):
+                pass
+
+            async def update(self):
+                state["running"] += 1
+                state["maximum"] = max(state["maximum"], state["running"])
+                await asyncio.sleep(0.01)
+                state["running"] -= 1
+
+            async def render(self):
+                return "<p>%s</p>" % self.__class__.__name__
+
+        class A(Provider):
+            pass
+
+        class B(Provider):
+            pass
+
+        provideAdapter(A, (None, None, None), IContentProvider, name="a")
+        provideAdapter(B, (None, None, None), IContentProvider, name="b")
+
+        view = self._makeView(
+            """<div tal:replace="structure provider:a" />"""
+            """<div tal:replace="structure provider:b" />"""
+        )
+        self.assertEqual(self._render(view), "<p>A</p><p>B</p>")
+        self.assertEqual(state["maximum"], 2)
+
+    def test_provider_update_error(self):
+        from zope.component import provideAdapter
+        from zope.contentprovider.interfaces import IContentProvider
+        from zope.interface import implementer
+
+        @implementer(IContentProvider)
+        class Provider:
+            def __init__(self, *args):
+                pass
+
+            async def update(self):
+                raise ValueError("update")
+
+            def render(self):
+                raise AssertionError("Should not be rendered")
+
+        provideAdapter(
+            Provider, (None, None, None), IContentProvider, name="a"
+        )
+        view = self._makeView(
+            """<div tal:replace="structure provider:a" />"""
+        )
+        with self.assertRaises(ValueError):
+            self._render(view)
+
+
 class TestOpaqueDict(unittest.TestCase):
     def test_getitem(self):
         import operator
@@ -224,6 +812,9 @@ class TestOpaqueDict(unittest.TestCase):
 
 
 class TestBaseTemplate(unittest.TestCase):
+    def setUp(self):
+        use_executor(self)
+
     def test_negotiate_fails(self):
         class I18N:
             request = None
@@ -243,6 +834,115 @@ class TestBaseTemplate(unittest.TestCase):
         finally:
             pagetemplate.i18n = orig_i18n
 
+    def test_render_iter(self):
+        template = pagetemplate.BaseTemplate("<p>${options}</p>")
+        chunks = template.render_iter(
+            chunk_size=4, options="Hello world"
+        )
+        self.assertEqual(list(chunks), ["<p>H", "ello", " wor", "ld</", "p>"])
+
+    def test_render_iter_streams(self):
+        import threading
+
+        released = threading.Event()
+
+        def wait():
+            self.assertTrue(released.wait(5))
+            return "b"
+
+        template = pagetemplate.BaseTemplate("${a}<b>${python: wait()}</b>")
+        chunks = template.render_iter(chunk_size=2, a="aa", wait=wait)
+
+        # The first chunk is yielded while the template is rendered.
+        self.assertEqual(next(chunks), "aa")
+        released.set()
+        self.assertEqual(list(chunks), ["<b", ">b", "</", "b>"])
+
+    def test_render_iter_on_error(self):
+        def fail():
+            raise ValueError()
+
+        template = pagetemplate.BaseTemplate(
+            """<p>a</p><p tal:on-error="string:error">b${python: fail()}</p>"""
+        )
+        chunks = template.render_iter(chunk_size=1, fail=fail)
+        self.assertEqual("".join(chunks), template.render(fail=fail))
+
+    def test_render_iter_error(self):
+        def fail():
+            raise ValueError()
+
+        template = pagetemplate.BaseTemplate("""<p>a</p>${python: fail()}""")
+        chunks = template.render_iter(chunk_size=1, fail=fail)
+        self.assertEqual(next(chunks), "<")
+        with self.assertRaises(ValueError):
+            list(chunks)
+
+    def test_render_iter_close(self):
+        import threading
+
+        released = threading.Event()
+        calls = []
+
+        def wait():
+            released.wait(5)
+            return "b"
+
+        template = pagetemplate.BaseTemplate(
+            "a<b>${python: wait()}</b><i>${python: after()}</i>"
+        )
+        chunks = template.render_iter(
+            chunk_size=1, wait=wait, after=lambda: calls.append(1)
+        )
+        self.assertEqual(next(chunks), "a")
+
+        # The render is aborted when it next writes its output.
+        chunks.close()
+        released.set()
+        chunks.future.result(5)
+        self.assertEqual(calls, [])
+        self.assertEqual(list(chunks), [])
+
+    def test_render_iter_executor(self):
+        # The streams are rendered in the threads of the executor.
+        released = threading.Event()
+        names = []
+
+        def wait():
+            names.append(threading.current_thread().name)
+            released.wait(5)
+            return "b"
+
+        template = pagetemplate.BaseTemplate("a${python: wait()}")
+        streams = [
+            template.render_iter(chunk_size=1, wait=wait) for i in range(2)
+        ]
+        released.set()
+        self.assertEqual(
+            [list(chunks) for chunks in streams], [["a", "b"], ["a", "b"]]
+        )
+        self.assertEqual(len(set(names)), 2)
+        self.assertTrue(all(name.startswith("test") for name in names))
+
+    def test_render_iter_sets_content_type(self):
+        class Response:
+            def __init__(self):
+                self.headers = {}
+                self.getHeader = self.headers.get
+                self.setHeader = self.headers.__setitem__
+
+        class Request:
+            response = Response()
+
+        request = Request()
+        template = pagetemplate.BaseTemplate("<html />")
+        template.stream_chunk_size = 2
+        chunks = template.render_iter(request=request)
+        self.assertEqual(
+            request.response.getHeader("Content-Type"), "text/html"
+        )
+        self.assertEqual("".join(chunks), "<html />")
+
     def test_translate_mv(self):
         template = pagetemplate.BaseTemplate(
             """
@@ -273,8 +973,208 @@ class TestBaseTemplateFile(unittest.TestCase):
 
         self.assertEqual(template.filename, os.path.join(here, "view.pt"))
 
+    def test_lazy(self):
+        here = os.path.abspath(os.path.dirname(__file__))
+
+        template = PageTemplateFile(
+            "false.pt", lazy=True, content_type="text/plain"
+        )
+        self.assertIn("_unresolved", template.__dict__)
+        self.assertIsNone(template.content_type)
+
+        self.assertEqual(template.filename, os.path.join(here, "false.pt"))
+        self.assertNotIn("_unresolved", template.__dict__)
+        self.assertEqual(template.content_type, "text/plain")
+
+    def test_lazy_render(self):
+        template = PageTemplateFile("false.pt", lazy=True)
+        self.assertIn("False", template())
+
+        template = PageTemplateFile("false.pt", lazy=True)
+        self.assertIn("False", template.render())
+
+    def test_lazy_macros(self):
+        template = PageTemplateFile("view.pt", lazy=True)
+        with self.assertRaises(KeyError):
+            template.macros["missing"]
+        self.assertNotIn("_unresolved", template.__dict__)
+
+    def test_preload_templates(self):
+        template = PageTemplateFile("false.pt", lazy=True)
+        missing = PageTemplateFile("missing.pt")
+        with self.assertLogs("z3c.pt", "ERROR") as logs:
+            count = pagetemplate.preload_templates(freeze=False)
+        self.assertGreaterEqual(count, 1)
+        self.assertTrue(template._cooked)
+        self.assertIn(repr(missing), logs.output[0])
+
+    def test_template_cache(self):
+        cache = pagetemplate.TemplateCache()
+        compile = pagetemplate.BaseTemplate._compile
+        with unittest.mock.patch.object(
+            pagetemplate.BaseTemplate,
+            "_compile",
+            autospec=True,
+            side_effect=compile,
+        ) as mock:
+            for cls in (
+                PageTemplateFile,
+                PageTemplateFile,
+                ViewPageTemplateFile,
+            ):
+                template = cls("false.pt")
+                template.cache = cache
+                self.assertIn("False", template.render())
+
+            self.assertEqual(mock.call_count, 1)
+            self.assertEqual(len(cache), 1)
+            self.assertEqual(cache.stats()["hits"], 2)
+            self.assertGreater(cache.stats()["bytes"], 0)
+
+            # The key includes the settings of the template.
+            template = PageTemplateFile("false.pt", literal_false=False)
+            template.cache = cache
+            template.render()
+            self.assertEqual(mock.call_count, 2)
+            self.assertEqual(len(cache), 2)
+
+    def test_cook_single_flight(self):
+        template = PageTemplateFile("false.pt")
+        cook = pagetemplate.BaseTemplate.cook
+        barrier = threading.Barrier(32)
+
+        def slow_cook(self, body):
+            time.sleep(0.05)
+            cook(self, body)
+
+        def render():
+            barrier.wait()
+            return template()
+
+        with unittest.mock.patch.object(
+            PageTemplateFile, "cook", autospec=True, side_effect=slow_cook
+        ) as mock:
+            with concurrent.futures.ThreadPoolExecutor(32) as executor:
+                futures = [executor.submit(render) for i in range(32)]
+                results = [future.result() for future in futures]
+
+        self.assertEqual(mock.call_count, 1)
+        self.assertEqual(len(set(results)), 1)
+        self.assertIn("False", results[0])
+
+    def test_pretranslate_single_flight(self):
+        template = PageTemplateFile(
+            "false.pt", pretranslate_languages=("de",)
+        )
+        barrier = threading.Barrier(16)
+
+        def render():
+            barrier.wait()
+            return template.render(target_language="de")
+
+        with unittest.mock.patch.object(
+            pagetemplate,
+            "PretranslatingCompiler",
+            wraps=pagetemplate.PretranslatingCompiler,
+        ) as mock:
+            with concurrent.futures.ThreadPoolExecutor(16) as executor:
+                futures = [executor.submit(render) for i in range(16)]
+                for future in futures:
+                    self.assertIn("False", future.result())
+
+        self.assertEqual(mock.call_count, 1)
+
+    def test_preload_templates_freeze(self):
+        self.addCleanup(gc.unfreeze)
+        PageTemplateFile("false.pt")
+        pagetemplate.preload_templates()
+        self.assertGreater(gc.get_freeze_count(), 0)
+
+
+class TestMacroDependencies(Setup, unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+        self.graph = pagetemplate.macro_dependencies
+        self.addCleanup(self.graph.clear)
+        self._write("main.pt", '<div metal:define-macro="main">main</div>')
+        self._write(
+            "page.pt",
+            '<div metal:define-macro="page"><div metal:use-macro="'
+            "python: options['main'].macros['main']\" /></div>",
+        )
+        self._write(
+            "view.pt",
+            "<div metal:use-macro=\"python: options['page'].macros['page']\""
+            " />",
+        )
+        self.main = self._template("main.pt", auto_reload=True)
+        self.page = self._template("page.pt")
+        self.view = self._template("view.pt")
+
+    def _write(self, name, body):
+        with open(os.path.join(self.path, name), "w") as f:
+            f.write(body)
+
+    def _template(self, name, **kwargs):
+        return PageTemplateFile(os.path.join(self.path, name), **kwargs)
+
+    def test_dependencies(self):
+        self.assertEqual(
+            self.view(page=self.page, main=self.main),
+            "<div><div>main</div></div>",
+        )
+        # The dependency is recorded for the file which uses the macro.
+        self.assertEqual(
+            self.graph.sources(self.view.filename), {self.page.filename}
+        )
+        self.assertEqual(
+            self.graph.sources(self.page.filename), {self.main.filename}
+        )
+        self.assertEqual(
+            self.graph.dependents(self.main.filename),
+            {self.page.filename, self.view.filename},
+        )
+
+        # Looking up a macro does not record a dependency.
+        self.graph.clear()
+        self.page.macros["page"]
+        self.assertEqual(self.graph.sources(self.page.filename), set())
+
+    def test_string_template(self):
+        template = pagetemplate.PageTemplate(
+            "<div metal:use-macro=\"python: options['main'].macros['main']\""
+            " />"
+        )
+        self.assertEqual(template(main=self.main), "<div>main</div>")
+        self.assertEqual(self.graph.dependents(self.main.filename), set())
+
+    def test_changed(self):
+        changes = []
+        self.graph.subscribers.append(
+            lambda source, dependents: changes.append((source, dependents))
+        )
+        self.addCleanup(self.graph.subscribers.pop)
+
+        self.view(page=self.page, main=self.main)
+        self.assertEqual(changes, [])
+
+        self._write("main.pt", '<div metal:define-macro="main">new</div>')
+        self.main._v_last_read = None
+        self.assertEqual(
+            self.view(page=self.page, main=self.main),
+            "<div><div>new</div></div>",
+        )
+        self.assertEqual(
+            changes,
+            [(self.main.filename, {self.page.filename, self.view.filename})],
+        )
+
 
 class TestBoundPageTemplate(unittest.TestCase):
+    def setUp(self):
+        use_executor(self)
 
     def test_setattr(self):
         bound = pagetemplate.BoundPageTemplate(None, None)
@@ -292,6 +1192,21 @@ class TestBoundPageTemplate(unittest.TestCase):
             repr(bound),
         )
 
+    def test_stream(self):
+        template = pagetemplate.PageTemplate("<p>${options/text}</p>")
+        bound = template.bind(None)
+        chunks = bound.stream(chunk_size=3, text="abcdef")
+        self.assertEqual(list(chunks), ["<p>", "abc", "def", "</p", ">"])
+
+    def test_render_async(self):
+        import asyncio
+
+        template = pagetemplate.PageTemplate("<p>${options/text}</p>")
+        bound = template.bind(None)
+        self.assertEqual(
+            asyncio.run(bound.render_async(text="async")), "<p>async</p>"
+        )
+
     def test_attributes(self):
         func = object()
         bound = pagetemplate.BoundPageTemplate(self, func)
@@ -0,0 +1,158 @@
+##############################################################################
+#
+# Copyright (c) 2007 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+import os
+import shutil
+import tempfile
+import time
+import unittest
+import unittest.mock
+
+from z3c.pt import watch
+from z3c.pt.pagetemplate import PageTemplateFile
+
+
+class Template:
+    _v_changed = False
+
+
+class WatcherTests:
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+        self.filename = os.path.join(self.path, "test.pt")
+        self._write(self.filename, "<p>1</p>")
+        self.watcher = self._makeOne()
+        self.addCleanup(self.watcher.stop)
+
+    def _write(self, filename, body):
+        with open(filename, "w") as f:
+            f.write(body)
+
+    def _wait(self, template):
+        deadline = time.monotonic() + 5
+        while not template._v_changed:
+            if time.monotonic() > deadline:
+                self.fail("change not seen")
+            time.sleep(0.01)
+
+    def test_write(self):
+        template = Template()
+        self.assertTrue(self.watcher.watch(self.filename, template))
+        self._write(self.filename, "<p>2</p>")
+        self._wait(template)
+
+    def test_rename(self):
+        template = Template()
+        other = Template()
+        self.watcher.watch(self.filename, template)
+        self.watcher.watch(os.path.join(self.path, "other.pt"), other)
+
+        # The new file has the same modification time.
+        mtime = os.stat(self.filename).st_mtime_ns
+        temp = os.path.join(self.path, "test.pt.tmp")
+        self._write(temp, "<p>2</p>")
+        os.utime(temp, ns=(mtime, mtime))
+        os.rename(temp, self.filename)
+        self._wait(template)
+        self.assertFalse(other._v_changed)
+
+    def test_remove(self):
+        template = Template()
+        self.watcher.watch(self.filename, template)
+        os.remove(self.filename)
+        self._wait(template)
+
+
+class TestPollingWatcher(WatcherTests, unittest.TestCase):
+    def _makeOne(self):
+        return watch.PollingWatcher(0.01)
+
+    def test_poll(self):
+        watcher = watch.PollingWatcher(3600)
+        template = Template()
+        watcher.watch(self.filename, template)
+        watcher.poll()
+        self.assertFalse(template._v_changed)
+        self._write(self.filename, "<p>2 </p>")
+        watcher.poll()
+        self.assertTrue(template._v_changed)
+        watcher.stop()
+
+
+@unittest.skipUnless(watch.InotifyWatcher.available, "inotify not available")
+class TestInotifyWatcher(WatcherTests, unittest.TestCase):
+    def _makeOne(self):
+        return watch.InotifyWatcher()
+
+    def test_missing_directory(self):
+        template = Template()
+        filename = os.path.join(self.path, "missing", "test.pt")
+        self.assertFalse(self.watcher.watch(filename, template))
+
+    def test_create_watcher(self):
+        watcher = watch.create_watcher()
+        self.assertIsInstance(watcher, watch.InotifyWatcher)
+        watcher.stop()
+
+
+class TestTemplateWatcher(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+        self.filename = os.path.join(self.path, "test.pt")
+        with open(self.filename, "w") as f:
+            f.write("<p>1</p>")
+        self.watcher = watch.create_watcher(0.01)
+        self.addCleanup(self.watcher.stop)
+
+    def test_auto_reload(self):
+        template = PageTemplateFile(self.filename, auto_reload=True)
+        template.cache = None
+        template.watcher = self.watcher
+        self.assertEqual(template(), "<p>1</p>")
+
+        # The modification time is not read when the file has not
+        # changed.
+        with unittest.mock.patch.object(
+            PageTemplateFile, "mtime", side_effect=AssertionError
+        ):
+            self.assertEqual(template(), "<p>1</p>")
+
+        mtime = os.stat(self.filename).st_mtime_ns
+        temp = self.filename + ".tmp"
+        with open(temp, "w") as f:
+            f.write("<p>2</p>")
+        os.utime(temp, ns=(mtime, mtime))
+        os.rename(temp, self.filename)
+
+        deadline = time.monotonic() + 5
+        while not template._v_changed and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(template(), "<p>2</p>")
+        self.assertFalse(template._v_changed)
+
+    def test_not_watched(self):
+        template = PageTemplateFile(self.filename)
+        template.watcher = self.watcher
+        self.assertEqual(template(), "<p>1</p>")
+        self.assertIsNone(template._v_watched)
+
+    def test_auto_reload_without_watcher(self):
+        template = PageTemplateFile(self.filename, auto_reload=True)
+        self.assertEqual(template(), "<p>1</p>")
+        with open(self.filename, "w") as f:
+            f.write("<p>2</p>")
+        mtime = os.stat(self.filename).st_mtime_ns + 10**9
+        os.utime(self.filename, ns=(mtime, mtime))
+        self.assertEqual(template(), "<p>2</p>")
@@ -0,0 +1,38 @@
+##############################################################################
+#
+# Copyright (c) 2007 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""The threads which render templates on behalf of another thread.
+
+A template whose output is streamed (``render_iter`` and
+``BoundPageTemplate.stream``) or which is rendered asynchronously
+(``render_async``) is rendered in a thread of ``executor``.
+
+The render thread uses the context variables, the site (see
+``zope.component.hooks``) and the security interaction of the calling
+thread (see ``z3c.pt.expressions.in_calling_context``). Other
+thread-local state does not cross the thread; e.g. in the render
+thread ``transaction.get()`` returns another transaction than in the
+calling thread (``transaction.manager`` is a thread-local manager) and
+``zope.globalrequest.getRequest()`` returns ``None``. Templates (and
+the views and content providers which they call) which depend on such
+state must be rendered in the calling thread, using ``render()``.
+"""
+import concurrent.futures
+
+
+# At most ``max_workers`` templates are rendered at the same time;
+# further renders wait for a thread. The executor may be replaced
+# (e.g. with one of another size); it is looked up for each render.
+executor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=8, thread_name_prefix="z3c.pt"
+)
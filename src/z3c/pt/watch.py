@@ -0,0 +1,286 @@
+##############################################################################
+#
+# Copyright (c) 2007 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""Watch template files for changes.
+
+A watcher is used as the ``watcher`` of file-based templates which are
+automatically reloaded (``auto_reload``); instead of reading the
+modification time of its file on each render, a template is reloaded
+only when the watcher has seen its file change.
+"""
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import select
+import struct
+import sys
+import threading
+import weakref
+
+
+log = logging.getLogger("z3c.pt")
+
+
+class TemplateWatcher:
+    """Base class of watchers.
+
+    The ``watch`` method registers a template for its file; when the
+    file changes (or is replaced, removed or created), the
+    ``_v_changed`` attribute of the template is set. The watcher holds
+    weak references to the templates only.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._templates = {}
+        self._thread = None
+
+    def watch(self, filename, template):
+        """Watch ``filename`` for ``template``; returns ``False`` if
+        the file can not be watched."""
+
+        filename = os.path.abspath(filename)
+        with self._lock:
+            if not self._add(filename):
+                return False
+            templates = self._templates.get(filename)
+            if templates is None:
+                templates = self._templates[filename] = weakref.WeakSet()
+            templates.add(template)
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run,
+                    name="z3c.pt-%s" % type(self).__name__,
+                    daemon=True,
+                )
+                self._thread.start()
+        return True
+
+    def _changed(self, filename):
+        with self._lock:
+            templates = list(self._templates.get(filename, ()))
+        for template in templates:
+            template._v_changed = True
+        if templates:
+            log.debug("template file changed: %s", filename)
+
+    def _add(self, filename):
+        raise NotImplementedError
+
+    def _run(self):
+        raise NotImplementedError
+
+
+class PollingWatcher(TemplateWatcher):
+    """Watcher which reads the status of the watched files every
+    ``interval`` seconds in a thread.
+
+    A file has changed when its modification time, size or inode
+    differs, such that a file which is replaced (e.g. renamed over) is
+    seen to change even if it has the same modification time.
+    """
+
+    def __init__(self, interval=1.0):
+        super().__init__()
+        self.interval = interval
+        self._signatures = {}
+        self._stopped = threading.Event()
+
+    @staticmethod
+    def _signature(filename):
+        try:
+            st = os.stat(filename)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size, st.st_ino
+
+    def _add(self, filename):
+        if filename not in self._signatures:
+            self._signatures[filename] = self._signature(filename)
+        return True
+
+    def poll(self):
+        """Check the watched files for changes."""
+
+        with self._lock:
+            signatures = list(self._signatures.items())
+        for filename, signature in signatures:
+            current = self._signature(filename)
+            if current != signature:
+                with self._lock:
+                    self._signatures[filename] = current
+                self._changed(filename)
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.poll()
+            except Exception:  # pragma: no cover
+                log.exception("error polling template files")
+
+    def stop(self):
+        self._stopped.set()
+
+
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_CLOEXEC = 0o2000000
+
+_EVENT = struct.Struct("iIII")
+
+
+def _load_libc():
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        libc.inotify_init1
+    except (OSError, AttributeError):  # pragma: no cover
+        return None
+    return libc
+
+
+_libc = _load_libc()
+
+
+class InotifyWatcher(TemplateWatcher):
+    """Watcher which uses Linux inotify.
+
+    The directory of each watched file is watched, such that a file
+    which is replaced (e.g. written to a temporary file and renamed
+    over, as done by editors and deployment tools) is seen to change;
+    since events are reported on the directory, note that replacing
+    the directory itself (e.g. by changing a symbolic link to it) is
+    not.
+    """
+
+    mask = (
+        IN_ATTRIB
+        | IN_CLOSE_WRITE
+        | IN_MOVED_FROM
+        | IN_MOVED_TO
+        | IN_CREATE
+        | IN_DELETE
+        | IN_ONLYDIR
+    )
+
+    available = _libc is not None
+
+    def __init__(self):
+        if not self.available:
+            raise OSError(errno.ENOSYS, "inotify is not available")
+        super().__init__()
+        self._fd = _libc.inotify_init1(IN_CLOEXEC)
+        if self._fd < 0:
+            code = ctypes.get_errno()
+            raise OSError(code, os.strerror(code))
+        self._directories = {}
+        self._wds = {}
+        self._stop_r, self._stop_w = os.pipe()
+
+    def _add(self, filename):
+        directory = os.path.dirname(filename)
+        if directory in self._directories:
+            return True
+        wd = _libc.inotify_add_watch(
+            self._fd, os.fsencode(directory), self.mask
+        )
+        if wd < 0:
+            code = ctypes.get_errno()
+            log.warning(
+                "can not watch %s: %s", directory, os.strerror(code)
+            )
+            return False
+        self._directories[directory] = wd
+        self._wds[wd] = directory
+        return True
+
+    def _handle(self, data):
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = _EVENT.unpack_from(data, offset)
+            offset += _EVENT.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                # Events were lost; all files may have changed.
+                with self._lock:
+                    filenames = list(self._templates)
+            elif mask & IN_IGNORED:
+                # The directory was removed (or unmounted); the watch
+                # is added again when a template is next loaded.
+                with self._lock:
+                    directory = self._wds.pop(wd, None)
+                    self._directories.pop(directory, None)
+                    filenames = [
+                        filename
+                        for filename in self._templates
+                        if os.path.dirname(filename) == directory
+                    ]
+            else:
+                directory = self._wds.get(wd)
+                if directory is None or not name:
+                    continue
+                filenames = [os.path.join(directory, os.fsdecode(name))]
+
+            for filename in filenames:
+                self._changed(filename)
+
+    def _run(self):
+        while True:
+            ready = select.select([self._fd, self._stop_r], [], [])[0]
+            if self._stop_r in ready:
+                break
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except InterruptedError:  # pragma: no cover
+                continue
+            self._handle(data)
+        os.close(self._fd)
+        os.close(self._stop_r)
+
+    def stop(self):
+        with self._lock:
+            thread = self._thread
+            self._thread = False
+        if thread:
+            os.write(self._stop_w, b"\0")
+            thread.join()
+        else:
+            os.close(self._fd)
+            os.close(self._stop_r)
+        os.close(self._stop_w)
+
+
+def create_watcher(interval=1.0):
+    """Return an ``InotifyWatcher`` if inotify is available; otherwise
+    a ``PollingWatcher`` which checks the files every ``interval``
+    seconds."""
+
+    if InotifyWatcher.available:
+        try:
+            return InotifyWatcher()
+        except OSError as exc:
+            # E.g. the limit of inotify instances is reached.
+            log.warning("can not use inotify: %s", exc)
+    return PollingWatcher(interval)